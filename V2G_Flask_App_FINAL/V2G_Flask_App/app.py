@@ -3,41 +3,138 @@ import io
 import json
 import uuid
 import os
+import logging
 from dotenv import load_dotenv
 
 
-from flask import Flask, render_template, request, send_file, jsonify,redirect,url_for
-import googlemaps
-from googlemaps import Client as GoogleMapsClient
-from weather_utils import WeatherFetcher
-from cnn_forecaster import CNNForecaster
-from utils import load_settings, generate_summary, format_charging_plan
-from demand_simulation import generate_grid_demand_realistic
-from optimiser import run_optimiser
+import threading
+from flask import Flask, Response, render_template, request, send_file, jsonify,redirect,url_for
+from utils import load_settings, generate_summary, format_charging_plan, plan_metrics, plan_derived, summary_key
+from metrics import timed, add_collector, render as render_metrics
+from plan_store import get_plan_store
+from weather_client import utc_now
 from datetime import datetime, timedelta, timezone
+
+# Heavy dependencies (pandas, the CNN, googlemaps, PuLP) are imported inside
+# the routes that need them, so booting a worker and serving /settings or
+# /saved_trips never pays for them. `python benchmark.py cold_start` keeps
+# this honest.
+
 load_dotenv()
 app = Flask(__name__)
-GMAPS = googlemaps.Client(key=os.getenv("GOOGLE_API_KEY"))
+
+# V2G_LOG_LEVEL=DEBUG brings back the per-hour PV and optimiser table dumps
+logging.basicConfig(level=os.getenv("V2G_LOG_LEVEL", "INFO").upper())
+log = logging.getLogger(__name__)
 CACHE_FILE = "dashboard_weather_cache.json"
 
+# saved trips shown on the dashboard, and per /saved_trips page
+DASHBOARD_PLANS = 5
+PLANS_PER_PAGE  = 20
+
 if os.path.exists(CACHE_FILE):
     os.remove(CACHE_FILE)
 
+_GMAPS = None
+
+
+def gmaps_client():
+    global _GMAPS
+    if _GMAPS is None:
+        import googlemaps
+        _GMAPS = googlemaps.Client(key=os.getenv("GOOGLE_API_KEY"))
+    return _GMAPS
+
+
+def _warm_forecaster():
+    from cnn_forecaster import forecaster_from_settings
+    try:
+        forecaster_from_settings(load_settings())
+    except Exception as e:
+        log.warning("CNN warm-up failed: %s", e)
+
+
+# Load + warm up the CNN once per worker, off the boot path, so the first
+# forecasting request doesn't pay for it; later requests reuse it (and
+# reload if settings.json changes). Set V2G_WARMUP=0 to skip.
+if os.getenv("V2G_WARMUP", "1") != "0":
+    threading.Thread(target=_warm_forecaster, daemon=True).start()
+
+
+def next_hour_utc():
+    """Current UTC time rounded up to the next whole hour."""
+    now_utc = utc_now()
+    if any((now_utc.minute, now_utc.second, now_utc.microsecond)):
+        now_utc = (now_utc + timedelta(hours=1)) \
+                  .replace(minute=0, second=0, microsecond=0)
+    return now_utc
+
+
+def solar_window(settings, start_utc, hours, slot_minutes=60):
+    """
+    Weather + PV forecast for the `hours` hours starting at start_utc, in
+    slot_minutes slots. Returns (future_df, solar) with future_df in
+    Europe/London time.
+
+    Shared by /planner, /download and the dashboard through the forecast
+    cache, so the weather fetch and CNN run happen once per site, hour,
+    horizon and model. The cache holds the hourly forecast; sub-hourly
+    slots are interpolated from it.
+    """
+    from forecast_cache import get_forecast_cache, forecast_key
+    from timeslots import interpolate_frame, interpolate_hourly
+
+    def compute():
+        from weather_utils import WeatherFetcher
+        from cnn_forecaster import forecaster_from_settings
+
+        wf         = WeatherFetcher(settings["latitude"], settings["longitude"])
+        forecaster = forecaster_from_settings(settings)
+
+        seq_hours  = forecaster.seq_length
+        hist_start = start_utc - timedelta(hours=seq_hours)
+        future_end = start_utc + timedelta(hours=hours - 1)
+
+        # one round-trip at most; both slices are then served from the store
+        with timed("weather_fetch"):
+            wf.prefetch(hist_start, future_end)
+            hist_df   = wf.fetch_range(hist_start, start_utc)
+            future_df = wf.fetch_range(start_utc, future_end)
+
+        # convert DataFrame to local tz and keep just the requested window
+        end_utc = start_utc + timedelta(hours=hours)
+        future_df["datetime"] = future_df["datetime"].dt.tz_convert("Europe/London")
+        future_df = future_df[
+            (future_df["datetime"] >= start_utc) &
+            (future_df["datetime"] <  end_utc)
+        ].reset_index(drop=True)
+
+        solar = forecaster.predict(
+            historical_df=hist_df,
+            future_df    = future_df,
+            horizon      = len(future_df)
+        )
+        return future_df, solar
+
+    key = forecast_key(settings["latitude"], settings["longitude"],
+                       start_utc, hours, settings["model_name"],
+                       backend      = settings.get("inference_backend", "keras"),
+                       scaler_paths = (settings["scaler_X_path"], settings["scaler_y_path"]))
+    future_df, solar = get_forecast_cache(settings).get_or_compute(key, compute)
+    if slot_minutes == 60:
+        return future_df, solar
+    return interpolate_frame(future_df, slot_minutes), interpolate_hourly(solar, slot_minutes)
+
 @app.route("/planner", methods=["GET", "POST"])
 def planner():
-    import pytz
+    from demand_simulation import generate_grid_demand_realistic
+    from plan_cache import run_optimiser_cached
+    from tariff import tariff_prices
+    from timeslots import interpolate_hourly, slots_per_hour, slot_labels
 
     settings  = load_settings()
     max_range = settings["battery_capacity"] / settings["energy_per_mile"]
 
-    # Forecasting setup
-    wf = WeatherFetcher(settings["latitude"], settings["longitude"])
-    forecaster = CNNForecaster(
-        model_path    = settings["model_name"],
-        scaler_X_path = settings["scaler_X_path"],
-        scaler_y_path = settings["scaler_y_path"]
-    )
-
     if request.method == "POST":
         mode     = request.form.get("mode", "basic")
         eco_mode = "eco_mode" in request.form
@@ -56,7 +153,7 @@ def planner():
                 dest_lng = request.form.get("dest_lng")
 
                 if not (orig_lat and orig_lng):
-                    geo = GMAPS.geocode(origin_addr)
+                    geo = gmaps_client().geocode(origin_addr)
                     if not geo:
                         error = f"Could not geocode origin: {origin_addr}"
                     else:
@@ -64,7 +161,7 @@ def planner():
                         orig_lat, orig_lng = loc["lat"], loc["lng"]
 
                 if not error and not (dest_lat and dest_lng):
-                    geo = GMAPS.geocode(dest_addr)
+                    geo = gmaps_client().geocode(dest_addr)
                     if not geo:
                         error = f"Could not geocode destination: {dest_addr}"
                     else:
@@ -78,7 +175,7 @@ def planner():
 
             orig = (float(orig_lat), float(orig_lng))
             dest = (float(dest_lat), float(dest_lng))
-            matrix = GMAPS.distance_matrix(orig, dest, units="imperial")
+            matrix = gmaps_client().distance_matrix(orig, dest, units="imperial")
             elem = matrix["rows"][0]["elements"][0]
             if elem.get("status") != "OK":
                 error = "Could not compute route between those points."
@@ -106,7 +203,7 @@ def planner():
                                        error=error, max_range=max_range)
 
         # ── 2) Determine simulation window ────────────────
-        now_local = datetime.now()
+        now_local = utc_now().astimezone().replace(tzinfo=None)
         # round up to next hour if any minutes/seconds
         if now_local.minute > 0:
             start_local = now_local + timedelta(hours=1)
@@ -122,56 +219,27 @@ def planner():
             abs_target += 24
         deadline_hour = abs_target - sim_start_naive
 
-        # ── 3) Fetch PV history + forecast ────────────────
-        now_utc = datetime.now(timezone.utc)
-        if any((now_utc.minute, now_utc.second, now_utc.microsecond)):
-            now_utc = (now_utc + timedelta(hours=1)) \
-                      .replace(minute=0, second=0, microsecond=0)
-
-        seq_hours  = forecaster.seq_length
-        hist_start = now_utc - timedelta(hours=seq_hours)
-        future_end = now_utc + timedelta(hours=deadline_hour)
-
-        hist_df   = wf.fetch_range(hist_start, now_utc)
-        future_df = wf.fetch_range(now_utc, future_end)
-
-        # ── 4) Align and slice future_df to local window ──
-        tz = pytz.timezone("Europe/London")
-        # make start_local tz-aware
-        start_local = tz.localize(start_local)
-        end_local = start_local + timedelta(hours=deadline_hour + 1)
-
-        # convert DataFrame to local tz and filter
-        future_df["datetime"] = future_df["datetime"].dt.tz_convert("Europe/London")
-        future_df = future_df[
-            (future_df["datetime"] >= start_local) &
-            (future_df["datetime"] <  end_local)
-        ].reset_index(drop=True)
-
-        # ── 5) Build solar array ──────────────────────────
-        solar = forecaster.predict(
-            historical_df=hist_df,
-            future_df    = future_df,
-            horizon      = len(future_df)
-        ).tolist()
+        # ── 3–5) PV forecast for the local window ─────────
+        slot_minutes = settings["slot_minutes"]
+        n_slots      = deadline_hour * slots_per_hour(slot_minutes)
+        start_utc    = next_hour_utc()
+        future_df, solar = solar_window(settings, start_utc, deadline_hour + 1, slot_minutes)
+        solar = solar.tolist()
 
-        # debug print
-        for dt, pv in zip(future_df["datetime"], solar):
-            print(f"{dt.strftime('%Y-%m-%d %H:%M')} → PV: {pv:.2f} kW")
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug("PV forecast:\n%s", "\n".join(
+                f"{dt.strftime('%Y-%m-%d %H:%M')} → PV: {pv:.2f} kW"
+                for dt, pv in zip(future_df["datetime"], solar)))
 
         # ── 6) Simulate demand & build tariff ────────────
-        demand = generate_grid_demand_realistic(len(solar))
-        tariff_schedule = [
-            0.10 if dt.hour < 7 else
-            0.15 if dt.hour < 15 else
-            0.30 if dt.hour < 19 else
-            0.20
-            for dt in future_df["datetime"]
-        ]
+        demand = interpolate_hourly(generate_grid_demand_realistic(deadline_hour + 1),
+                                    slot_minutes).tolist()
+        tariff_schedule = tariff_prices(settings, start_utc, len(solar), slot_minutes)
 
         # ── 7) Run optimiser ─────────────────────────────
         required_energy = required_range * settings["energy_per_mile"]
-        result = run_optimiser(
+        plan_key, result = run_optimiser_cached(
+            settings,
             solar_forecast         = solar,
             grid_prices            = tariff_schedule,
             grid_demand            = demand,
@@ -187,22 +255,19 @@ def planner():
             v2g_sell_price         = settings["v2g_sell_price"],
             co2_price_per_kg       = settings.get("co2_price_per_kg", 0.0),
             emission_factor        = settings.get("emission_factor", 0.233),
-            grid_demand_threshold  = 30000
+            grid_demand_threshold  = 30000,
+            solver                 = _solver_for(settings, slot_minutes),
+            slot_minutes           = slot_minutes
         )
 
         # ── 8) Compute metrics ───────────────────────────
-        avg_tariff      = sum(tariff_schedule) / len(tariff_schedule)
-        baseline_cost   = required_energy * avg_tariff
-        grid_in_cost    = sum(ch * tariff_schedule[i]
-                              for i, ch in enumerate(result["grid_charging"]))
-        grid_out_rev    = sum(dch * settings["v2g_sell_price"]
-                              for dch in result["grid_discharging"])
-        net_cost        = grid_in_cost - grid_out_rev
-        co2_emitted_kg  = sum(ch * settings.get("emission_factor", 0.233)
-                              for ch in result["grid_charging"])
-        co2_avoided_kg  = sum(result["solar_charging"]) \
-                          * settings.get("emission_factor", 0.233)
-        net_co2_saved_kg= co2_avoided_kg - co2_emitted_kg
+        metrics = plan_metrics(result, tariff_schedule, required_energy,
+                               settings["v2g_sell_price"], settings.get("emission_factor", 0.233))
+        baseline_cost    = metrics["baseline_cost"]
+        net_cost         = metrics["net_cost"]
+        co2_emitted_kg   = metrics["co2_emitted_kg"]
+        co2_avoided_kg   = metrics["co2_avoided_kg"]
+        net_co2_saved_kg = metrics["net_co2_saved_kg"]
 
         # ── 9) Generate UI summary ───────────────────────
         summary = generate_summary(
@@ -211,7 +276,8 @@ def planner():
             deadline_hour,
             grid_prices     = tariff_schedule,
             energy_per_mile = settings["energy_per_mile"],
-            max_charge_rate = settings["charge_rate"]
+            max_charge_rate = settings["charge_rate"],
+            slot_minutes    = slot_minutes
         )
 
         # ── 10) Handle “Save Plan” ───────────────────────
@@ -223,6 +289,7 @@ def planner():
                 "range":            required_range,
                 "start_hour":       sim_start_naive,
                 "deadline_hour":    deadline_hour,
+                "slot_minutes":     slot_minutes,
                 "result":           result,
                 "baseline_cost":    baseline_cost,
                 "net_cost":         net_cost,
@@ -230,33 +297,37 @@ def planner():
                 "co2_emitted_kg":   co2_emitted_kg,
                 "co2_avoided_kg":   co2_avoided_kg,
                 "net_co2_saved_kg": net_co2_saved_kg,
-                "day_offset":       day
+                "day_offset":       day,
+                "grid_prices":      tariff_schedule,
+                "derived":          dict(metrics, summary_text=summary),
+                "derived_key":      summary_key(settings)
             }
-            saved = json.load(open("saved_plans.json")) if os.path.exists("saved_plans.json") else []
-            saved.append(plan)
-            with open("saved_plans.json","w") as f:
-                json.dump(saved, f, indent=2)
+            get_plan_store(settings).add(plan)
             return redirect(url_for("saved_trips"))
 
         # ── 11) Render results ───────────────────────────
-        return render_template(
-            "planner.html",
-            mode             = mode,
-            result           = result,
-            summary          = summary,
-            start_hour       = sim_start_naive,
-            deadline_hour    = deadline_hour,
-            calculated_range = required_range,
-            max_range        = max_range,
-            baseline_cost    = baseline_cost,
-            net_cost         = net_cost,
-            money_saved      = baseline_cost - net_cost,
-            co2_avoided_kg   = co2_avoided_kg,
-            co2_emitted_kg   = co2_emitted_kg,
-            net_co2_saved_kg = net_co2_saved_kg,
-            co2_saved_kg     = net_co2_saved_kg,
-            day_offset       = day
-        )
+        with timed("render", page="planner"):
+            return render_template(
+                "planner.html",
+                mode             = mode,
+                result           = result,
+                summary          = summary,
+                start_hour       = sim_start_naive,
+                deadline_hour    = deadline_hour,
+                slot_minutes     = slot_minutes,
+                slot_labels      = slot_labels(sim_start_naive, n_slots + 1, slot_minutes),
+                calculated_range = required_range,
+                max_range        = max_range,
+                baseline_cost    = baseline_cost,
+                net_cost         = net_cost,
+                money_saved      = baseline_cost - net_cost,
+                co2_avoided_kg   = co2_avoided_kg,
+                co2_emitted_kg   = co2_emitted_kg,
+                net_co2_saved_kg = net_co2_saved_kg,
+                co2_saved_kg     = net_co2_saved_kg,
+                day_offset       = day,
+                plan_key         = plan_key
+            )
 
     # GET → empty form
     return render_template(
@@ -271,13 +342,9 @@ def planner():
 
 @app.route("/download", methods=["POST"])
 def download_plan():
+    from plan_cache import get_plan_cache
+
     settings   = load_settings()
-    wf         = WeatherFetcher(settings["latitude"], settings["longitude"])
-    forecaster = CNNForecaster(
-        model_path    = settings["model_name"],
-        scaler_X_path = settings["scaler_X_path"],
-        scaler_y_path = settings["scaler_y_path"]
-    )
 
     # parse inputs
     required_range = float(request.form["range"])
@@ -285,6 +352,9 @@ def download_plan():
     target_hr      = int(request.form["deadline"])
     eco_mode       = (request.form.get("eco_mode") == "True")
     sim_start      = int(request.form["start_hour"])
+    slot_minutes   = _slot_minutes(request.form.get("slot_minutes", 60))
+    if slot_minutes is None:
+        return _bad_slot_minutes()
 
     # compute deadline_hour
     abs_target = day*24 + target_hr
@@ -292,38 +362,74 @@ def download_plan():
         abs_target += 24
     deadline_hour = abs_target - sim_start
 
-    # fetch & predict solar
-    now_utc    = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
-    seq_hours  = forecaster.seq_length
-    hist_start = now_utc - timedelta(hours=seq_hours)
-    future_end = now_utc + timedelta(hours=deadline_hour)
-
-    hist_df   = wf.fetch_range(hist_start, now_utc)
-    future_df = wf.fetch_range(now_utc, future_end)
+    # the plan /planner just showed, if it's still cached; otherwise re-plan
+    plan_key = request.form.get("plan_key")
+    result   = get_plan_cache(settings).get(plan_key) if plan_key else None
+    if result is None:
+        result = _replan_for_download(settings, sim_start, deadline_hour,
+                                      required_range, eco_mode, slot_minutes)
 
-    raw_preds = forecaster.predict(
-        historical_df=hist_df,
-        future_df    = future_df,
-        horizon      = len(future_df)
+    # send plan text
+    day_offset = int(request.form.get("day", 0))
+    with timed("render", page="download"):
+        plan_text = format_charging_plan(
+            result,
+            sim_start,
+            deadline_hour,
+            day_offset,
+            slot_minutes
+        )
+    buf = io.BytesIO(plan_text.encode("utf-8"))
+    buf.seek(0)
+    return send_file(
+        buf,
+        as_attachment   = True,
+        download_name   = "charging_plan.txt",
+        mimetype        = "text/plain"
     )
-    solar = [
-        float(p) if sr >= 30.0 else 0.0
-        for p, sr in zip(raw_preds, future_df["solar_radiation_W_m2"])
-    ]
+
+
+def _slot_minutes(value):
+    """Form value → slot length in minutes, or None unless it is one of SLOT_MINUTES."""
+    from timeslots import SLOT_MINUTES
+    try:
+        minutes = int(value)
+    except (TypeError, ValueError):
+        return None
+    return minutes if minutes in SLOT_MINUTES else None
+
+
+def _bad_slot_minutes():
+    from timeslots import SLOT_MINUTES
+    return f"slot_minutes must be one of {', '.join(map(str, SLOT_MINUTES))}", 400
+
+
+def _solver_for(settings, slot_minutes):
+    # the MILP engines need tens of seconds for 96-192 slot plans, the DP
+    # engine tens of milliseconds, so sub-hourly plans always use DP
+    return settings["solver"] if slot_minutes == 60 else "dp"
+
+
+def _replan_for_download(settings, sim_start, deadline_hour, required_range, eco_mode, slot_minutes=60):
+    from demand_simulation import generate_grid_demand_realistic
+    from plan_cache import run_optimiser_cached
+    from tariff import tariff_prices
+    from timeslots import interpolate_hourly
+
+    # same forecast window as /planner, so this is normally a cache hit
+    start_utc = next_hour_utc()
+    _, raw_preds = solar_window(settings, start_utc, deadline_hour + 1, slot_minutes)
+    solar = [float(p) for p in raw_preds]
 
     # simulate demand & tariff
-    demand = generate_grid_demand_realistic(len(solar))
-    tariff_schedule = [
-        0.10 if (sim_start+h) % 24 < 7 else
-        0.15 if (sim_start+h) % 24 < 15 else
-        0.30 if (sim_start+h) % 24 < 19 else
-        0.20
-        for h in range(len(solar))
-    ]
+    demand = interpolate_hourly(generate_grid_demand_realistic(deadline_hour + 1),
+                                slot_minutes).tolist()
+    tariff_schedule = tariff_prices(settings, start_utc, len(solar), slot_minutes)
 
     # run optimiser
     required_energy = required_range * settings["energy_per_mile"]
-    result = run_optimiser(
+    _, result = run_optimiser_cached(
+        settings,
         solar_forecast=solar,
         grid_prices=tariff_schedule,
         grid_demand=demand,
@@ -339,63 +445,51 @@ def download_plan():
         max_discharge_rate=settings["discharge_rate"],
         initial_soc=settings["initial_soc"],
         v2g_sell_price=settings["v2g_sell_price"],
-        grid_demand_threshold=30000
+        grid_demand_threshold=30000,
+        solver=_solver_for(settings, slot_minutes),
+        slot_minutes=slot_minutes
     )
+    return result
+
 
-    # send plan text
-    day_offset = int(request.form.get("day", 0))
-    plan_text = format_charging_plan(
-        result,
-        sim_start,
-        deadline_hour,
-        day_offset
-    )
-    buf = io.BytesIO(plan_text.encode("utf-8"))
-    buf.seek(0)
-    return send_file(
-        buf,
-        as_attachment   = True,
-        download_name   = "charging_plan.txt",
-        mimetype        = "text/plain"
-    )
 @app.route("/")
 @app.route("/dashboard")
 def dashboard():
-    plans = json.load(open("saved_plans.json")) if os.path.exists("saved_plans.json") else []
+    plans = get_plan_store(load_settings()).list_recent(DASHBOARD_PLANS)
     return render_template("dashboard.html", plans=plans)
 
 
 @app.route("/saved_trips")
 def saved_trips():
     settings = load_settings()
-    raw = []
-    if os.path.exists("saved_plans.json"):
-        raw = json.load(open("saved_plans.json"))
-    plans = []
-    for p in raw:
-        # regenerate the summary text exactly as in planner
-        summary = generate_summary(
-            p["result"],
-            p["range"],
-            p["deadline_hour"],
-            grid_prices = p.get("grid_prices"),      # if you stored it
-            energy_per_mile = settings["energy_per_mile"],
-            max_charge_rate = settings["charge_rate"]
-        )
-        p["summary_text"] = summary
-        plans.append(p)
+    store    = get_plan_store(settings)
+    pages    = max(1, -(-store.count() // PLANS_PER_PAGE))
+    page     = min(max(request.args.get("page", 1, type=int), 1), pages)
+    plans    = store.list_recent(PLANS_PER_PAGE, (page - 1) * PLANS_PER_PAGE,
+                                 exclude=("result", "grid_prices"))
+
+    # summaries and metrics are stored with each plan; only those computed
+    # under another summary version or other settings are redone (and saved)
+    key   = summary_key(settings)
+    stale = {p["id"]: plan_derived(store.get(p["id"]), settings)
+             for p in plans if p["derived_key"] != key}
+    if stale:
+        store.set_derived(key, stale)
+    for p in plans:
+        p.update(stale.get(p["id"]) or p["derived"])
+
+    return render_template("saved_trips.html", plans=plans, page=page, pages=pages)
 
-    return render_template("saved_trips.html", plans=plans)
 
 @app.route("/saved_trips/<plan_id>/download")
 def download_saved_plan(plan_id):
-    plans = json.load(open("saved_plans.json")) if os.path.exists("saved_plans.json") else []
-    plan = next((p for p in plans if p["id"] == plan_id), None)
+    plan = get_plan_store(load_settings()).get(plan_id)
     if not plan:
         return "Not found", 404
 
     buf = io.BytesIO()
-    buf.write(format_charging_plan(plan["result"], plan["start_hour"], plan["deadline_hour"]).encode("utf-8"))
+    buf.write(format_charging_plan(plan["result"], plan["start_hour"], plan["deadline_hour"],
+                                   plan.get("day_offset", 0), plan.get("slot_minutes", 60)).encode("utf-8"))
     buf.seek(0)
 
     return send_file(buf, as_attachment=True, download_name=f"charging_plan_{plan_id}.txt", mimetype="text/plain")
@@ -404,19 +498,13 @@ def download_saved_plan(plan_id):
 @app.route("/delete_plan/<plan_id>")
 def delete_plan(plan_id):
     from_page = request.args.get("from_page", "dashboard")  # Default to dashboard
-    file_path = "saved_plans.json"
-    if os.path.exists(file_path):
-        saved = json.load(open(file_path))
-        saved = [p for p in saved if p["id"] != plan_id]
-        with open(file_path, "w") as f:
-            json.dump(saved, f, indent=2)
+    get_plan_store(load_settings()).delete(plan_id)
     return redirect(url_for(from_page))
 
 
 @app.route("/clear_plans")
 def clear_plans():
-    if os.path.exists("saved_plans.json"):
-        os.remove("saved_plans.json")
+    get_plan_store(load_settings()).clear()
     return redirect(url_for("saved_trips"))
 
 
@@ -426,52 +514,18 @@ def edit_plan_name(plan_id):
     if not new_name:
         return redirect(url_for("saved_trips"))
 
-    file_path = "saved_plans.json"
-    if not os.path.exists(file_path):
-        return redirect(url_for("saved_trips"))
-
-    plans = json.load(open(file_path))
-    for plan in plans:
-        if plan["id"] == plan_id:
-            plan["name"] = new_name
-            break
-
-    with open(file_path, "w") as f:
-        json.dump(plans, f, indent=2)
-
+    get_plan_store(load_settings()).rename(plan_id, new_name)
     return redirect(url_for("saved_trips"))
 
 
 @app.route("/api/dashboard-weather")
 def api_dashboard_weather():
-    settings   = load_settings()
-    wf         = WeatherFetcher(settings["latitude"], settings["longitude"])
-    forecaster = CNNForecaster(
-        model_path    =settings["model_name"],
-        scaler_X_path =settings["scaler_X_path"],
-        scaler_y_path =settings["scaler_y_path"]
-    )
+    settings = load_settings()
 
     # always next 48 h
-    seq_hours      = forecaster.seq_length
     forecast_hours = 48
-
-    now_utc    = datetime.now(timezone.utc).replace(minute=0,second=0,microsecond=0)
-    hist_start = now_utc - timedelta(hours=seq_hours)
-    future_end = now_utc + timedelta(hours=forecast_hours)
-
-    hist_df   = wf.fetch_range(hist_start, now_utc)
-    future_df = wf.fetch_range(now_utc, future_end)
-
-    raw_preds = forecaster.predict(
-        historical_df=hist_df,
-        future_df    =future_df,
-        horizon      =len(future_df)
-    )
-    solar = [
-        float(p) if sr>=30.0 else 0.0
-        for p,sr in zip(raw_preds, future_df["solar_radiation_W_m2"])
-    ]
+    future_df, raw_preds = solar_window(settings, next_hour_utc(), forecast_hours)
+    solar = [float(p) for p in raw_preds]
 
     payload = {
         "labels":           future_df["datetime"].dt.strftime("%a %H:%M").tolist(),
@@ -483,6 +537,215 @@ def api_dashboard_weather():
     return jsonify(payload)
 
 
+@app.route("/api/forecast-cache")
+def api_forecast_cache():
+    from forecast_cache import get_forecast_cache
+    return jsonify(get_forecast_cache(load_settings()).stats())
+
+
+@app.route("/api/plan-cache")
+def api_plan_cache():
+    from plan_cache import get_plan_cache
+    return jsonify(get_plan_cache(load_settings()).stats())
+
+
+def _cache_metrics():
+    from forecast_cache import get_forecast_cache
+    from plan_cache import get_plan_cache
+
+    settings = load_settings()
+    caches = (("forecast", get_forecast_cache(settings)), ("plan", get_plan_cache(settings)),
+              ("mpc", _mpc_sessions(settings)))
+    for name, cache in caches:
+        stats = cache.stats()
+        for key in ("hits", "misses", "disk_hits"):
+            yield (f"v2g_cache_{key}_total", "counter", f"Cache lookups ({key.replace('_', ' ')}).",
+                   {"cache": name}, stats[key])
+        yield ("v2g_cache_entries", "gauge", "Entries held in memory.", {"cache": name}, stats["size"])
+
+
+add_collector(_cache_metrics)
+
+
+@app.route("/metrics")
+def metrics():
+    """Stage timings, solver counters and cache stats in Prometheus text format."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+# Rolling-horizon sessions (see mpc.py), per worker process: an LRU of at
+# most "mpc_sessions" (planner, lock) pairs, each dropped once its deadline
+# has passed. The lock serialises steps on one session, since step() updates
+# the planner's warm start and history.
+_MPC_SESSIONS = None
+
+
+def _mpc_sessions(settings):
+    global _MPC_SESSIONS
+    if _MPC_SESSIONS is None:
+        from forecast_cache import TTLCache
+        _MPC_SESSIONS = TTLCache(maxsize=settings.get("mpc_sessions", 256))
+    return _MPC_SESSIONS
+
+
+def _mpc_inputs(settings):
+    from demand_simulation import generate_grid_demand_realistic
+    from tariff import tariff_prices
+
+    def inputs(start_utc, hours):
+        # fresh PV forecast, tariff and simulated demand for the window
+        _, solar = solar_window(settings, start_utc, hours)
+        tariff = tariff_prices(settings, start_utc, len(solar))
+        return solar.tolist(), tariff, generate_grid_demand_realistic(len(solar))
+    return inputs
+
+
+def _mpc_payload(session_id, step):
+    return jsonify({
+        "session_id": session_id,
+        "start_utc":  step["start_utc"].isoformat(),
+        "hours":      step["hours"],
+        "periods":    step["periods"],
+        "action":     step["action"],
+        "plan":       step["plan"],
+    })
+
+
+@app.route("/api/mpc", methods=["POST"])
+def api_mpc_start():
+    """
+    Opens a rolling-horizon session and returns its first plan.
+    JSON: {"range": miles, "hours": hours to the deadline, "eco_mode": bool,
+    "soc": kWh now (default: settings initial_soc)}.
+    """
+    from mpc import RollingHorizonPlanner
+
+    settings = load_settings()
+    body     = request.get_json(force=True)
+    try:
+        hours = int(body["hours"])
+        miles = float(body.get("range", 0.0))
+        soc   = float(body.get("soc", settings["initial_soc"]))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Expected numeric 'hours', 'range' and 'soc'"}), 400
+    if hours < 1 or miles < 0 or soc < 0:
+        return jsonify({"error": "Expected 'hours' >= 1 and non-negative 'range' and 'soc'"}), 400
+
+    planner = RollingHorizonPlanner(
+        deadline_utc           = next_hour_utc() + timedelta(hours=hours),
+        required_energy        = miles * settings["energy_per_mile"],
+        inputs                 = _mpc_inputs(settings),
+        eco_mode               = bool(body.get("eco_mode", False)),
+        solver                 = settings["solver"],
+        cycle_degradation_cost = settings["cycle_degradation_cost"],
+        battery_capacity       = settings["battery_capacity"],
+        max_charge_rate        = settings["charge_rate"],
+        max_discharge_rate     = settings["discharge_rate"],
+        switch_penalty         = settings["switch_penalty"],
+        v2g_sell_price         = settings["v2g_sell_price"],
+        co2_price_per_kg       = settings.get("co2_price_per_kg", 0.0),
+        emission_factor        = settings.get("emission_factor", 0.233),
+    )
+    try:
+        step = planner.step(soc)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    session_id = uuid.uuid4().hex[:8]
+    _mpc_sessions(settings).put(session_id, (planner, threading.Lock()),
+                                expires_at=planner.deadline_utc.timestamp())
+    return _mpc_payload(session_id, step)
+
+
+@app.route("/api/mpc/<session_id>/step", methods=["POST"])
+def api_mpc_step(session_id):
+    """Re-plans a session from the measured SoC. JSON: {"soc": kWh}."""
+    sessions = _mpc_sessions(load_settings())
+    session  = sessions.get(session_id)
+    if session is None:
+        return jsonify({"error": "Unknown or expired session"}), 404
+    try:
+        soc = float(request.get_json(force=True)["soc"])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Expected numeric 'soc'"}), 400
+    if soc < 0:
+        return jsonify({"error": "Expected non-negative 'soc'"}), 400
+
+    planner, lock = session
+    try:
+        with lock:
+            step = planner.step(soc)
+    except ValueError as e:
+        sessions.discard(session_id)
+        return jsonify({"error": str(e)}), 410
+    return _mpc_payload(session_id, step)
+
+
+MAX_SCENARIOS = 20000
+
+
+@app.route("/api/stochastic", methods=["POST"])
+def api_stochastic():
+    """
+    A sample-average plan over simulated demand and PV scenarios (see
+    stochastic.py). JSON: {"range": miles, "hours": hours to the deadline,
+    "eco_mode": bool, "soc": kWh now, "scenarios": ensemble size (1000),
+    "reduced": scenarios kept (10), "first_stage_hours": 1, "seed": int}.
+    """
+    from demand_simulation import generate_scenarios
+    from stochastic import run_stochastic_optimiser, solar_scenarios
+
+    settings = load_settings()
+    body     = request.get_json(force=True)
+    try:
+        hours     = int(body["hours"])
+        miles     = float(body.get("range", 0.0))
+        soc       = float(body.get("soc", settings["initial_soc"]))
+        n         = int(body.get("scenarios", 1000))
+        reduced   = int(body.get("reduced", 10))
+        first     = int(body.get("first_stage_hours", 1))
+        seed      = body.get("seed")
+        seed      = None if seed is None else int(seed)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Expected numeric 'hours', 'range', 'soc', 'scenarios', "
+                                 "'reduced', 'first_stage_hours' and 'seed'"}), 400
+    if not (0 < hours and 0 < n <= MAX_SCENARIOS and 0 < reduced and 0 <= first):
+        return jsonify({"error": f"Expected hours > 0, reduced > 0, first_stage_hours >= 0 "
+                                 f"and scenarios in 1..{MAX_SCENARIOS}"}), 400
+
+    start = next_hour_utc()
+    solar, tariff, _ = _mpc_inputs(settings)(start, hours)
+    demand, _ = generate_scenarios(n, len(solar), seed=seed)
+    try:
+        result = run_stochastic_optimiser(
+            solar_scenarios(solar, n, seed=seed), tariff, demand, hours,
+            required_energy        = miles * settings["energy_per_mile"],
+            eco_mode               = bool(body.get("eco_mode", False)),
+            cycle_degradation_cost = settings["cycle_degradation_cost"],
+            battery_capacity       = settings["battery_capacity"],
+            max_charge_rate        = settings["charge_rate"],
+            max_discharge_rate     = settings["discharge_rate"],
+            initial_soc            = soc,
+            switch_penalty         = settings["switch_penalty"],
+            v2g_sell_price         = settings["v2g_sell_price"],
+            co2_price_per_kg       = settings.get("co2_price_per_kg", 0.0),
+            emission_factor        = settings.get("emission_factor", 0.233),
+            first_stage_hours      = first,
+            n_reduced              = reduced,
+            seed                   = seed or 0,
+        )
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 422
+
+    scenarios = result.pop("scenarios")
+    return jsonify({
+        "start_utc": start.isoformat(),
+        "ensemble":  n,
+        "scenarios": [{"index": s["index"], "probability": s["probability"],
+                       "net_cost": s["plan"]["net_cost"]} for s in scenarios],
+        **result,
+    })
+
+
 @app.route("/settings", methods=["GET", "POST"])
 def settings():
     settings_file = "settings.json"
@@ -503,11 +766,16 @@ def settings():
             "switch_penalty":        float,
             "v2g_sell_price":        float,
             "car_name":              str,
+            "slot_minutes":          _slot_minutes,
+            "tariff":                str,
         }
 
         for key, caster in editable_fields.items():
             if key in request.form:
                 current[key] = caster(request.form[key])
+        # a slot length slots_per_hour rejects would break every later /planner
+        if current.get("slot_minutes", 60) is None:
+            return _bad_slot_minutes()
 
         # Write the merged settings back out
         with open(settings_file, "w") as f:
@@ -516,11 +784,14 @@ def settings():
         return redirect(url_for("settings"))
 
     # GET → render the form with all settings (incl. the static ones)
+    from tariff import tariff_names
+
     cars = json.load(open(cars_file)) if os.path.exists(cars_file) else {}
     return render_template(
         "settings.html",
         settings=current,
-        cars=cars
+        cars=cars,
+        tariffs=tariff_names(current)
     )
 
 
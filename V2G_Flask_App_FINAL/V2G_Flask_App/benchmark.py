@@ -0,0 +1,868 @@
+# benchmark.py
+#
+# Offline timing harness. Everything runs on synthetic weather so no
+# network is needed:
+#
+#   python benchmark.py forecaster forecaster_batch numpy_engine cold_start
+#   python benchmark.py optimiser_template solver_parity dp_gap fleet fleet_repair stochastic
+#   python benchmark.py micro [--save-baseline] [--json results.json]
+#
+# The parity benchmarks (numpy_engine, solver_parity, dp_gap, ...) double as
+# CI checks: any of them that goes over its tolerance is reported as FAILED
+# and the run exits non-zero.
+
+import os
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+
+from utils import load_settings
+
+
+def synthetic_weather(start_utc, hours, seed=0):
+    """
+    Hourly frame with the same columns WeatherFetcher.fetch_range returns:
+    a clear-sky-ish irradiance curve plus noise, and a daily temperature swing.
+    """
+    rng   = np.random.default_rng(seed)
+    times = pd.date_range(start=start_utc, periods=hours, freq="h", tz="UTC")
+    hour  = times.hour.values
+    sun   = np.clip(np.sin((hour - 6) / 12 * np.pi), 0, None)
+
+    return pd.DataFrame({
+        "datetime":             times.tz_convert("Europe/London"),
+        "temperature_2m":       10 + 6 * sun + rng.normal(0, 0.5, hours),
+        "cloud_cover_%":        rng.uniform(0, 100, hours),
+        "solar_radiation_W_m2": np.round(700 * sun * rng.uniform(0.4, 1.0, hours), 1),
+    })
+
+
+def synthetic_frames(seq_hours, horizon, seed=0):
+    now_utc = datetime(2025, 6, 1, 12, tzinfo=timezone.utc)
+    hist_df   = synthetic_weather(now_utc - timedelta(hours=seq_hours), seq_hours, seed)
+    future_df = synthetic_weather(now_utc, horizon, seed + 1)
+    return hist_df, future_df
+
+
+def synthetic_optimiser_inputs(H, eco_mode=False, seed=0):
+    """
+    run_optimiser kwargs for an H-hour plan starting at 18:00. The V2G price
+    is kept low enough that CBC proves optimality quickly even at 168 h.
+    """
+    rng   = np.random.default_rng(seed)
+    hours = (18 + np.arange(H)) % 24
+    sun   = np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None)
+    return dict(
+        solar_forecast  = list(np.round(3.0 * sun * rng.uniform(0.3, 1.0, H), 3)),
+        grid_prices     = [0.10 if h < 7 else 0.15 if h < 15 else 0.30 if h < 19 else 0.20 for h in hours],
+        grid_demand     = list(rng.normal(30000, 4000, H)),
+        deadline_hour   = H,
+        required_energy = 40.0,
+        eco_mode        = eco_mode,
+        initial_soc     = 20.0,
+        v2g_sell_price  = 0.12,
+    )
+
+
+def synthetic_slot_inputs(H, slot_minutes, eco_mode=False, seed=0):
+    """
+    synthetic_optimiser_inputs on slot_minutes slots: PV and demand
+    interpolated from the hourly values, the tariff held per hour.
+    """
+    from timeslots import interpolate_hourly, slots_per_hour
+
+    kw = synthetic_optimiser_inputs(H + 1, eco_mode, seed)
+    n  = slots_per_hour(slot_minutes)
+    kw["solar_forecast"] = interpolate_hourly(kw["solar_forecast"], slot_minutes).tolist()
+    kw["grid_demand"]    = interpolate_hourly(kw["grid_demand"], slot_minutes).tolist()
+    kw["grid_prices"]    = [p for p in kw["grid_prices"] for _ in range(n)]
+    kw["deadline_hour"]  = H
+    return kw
+
+
+def _time(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def bench_forecaster(horizons=(24, 48, 168), repeat=3):
+    from cnn_forecaster import forecaster_from_settings
+
+    forecaster = forecaster_from_settings(load_settings())
+    rows = []
+    for H in horizons:
+        hist_df, future_df = synthetic_frames(forecaster.seq_length, H)
+
+        fast   = forecaster.predict(hist_df, future_df, horizon=H, fast=True)
+        legacy = forecaster.predict(hist_df, future_df, horizon=H, fast=False)
+        # one batched call rounds differently from H single-window calls in
+        # float32, so the two agree to a few ulps rather than bit for bit
+        tol = 8 * np.finfo(np.float32).eps * max(np.abs(legacy).max(), 1.0)
+        if np.abs(fast - legacy).max() > tol:
+            raise AssertionError(f"fast/legacy forecasts differ at H={H}: "
+                                 f"max |Δ| = {np.abs(fast - legacy).max():.3g} > {tol:.3g}")
+
+        t_fast   = _time(lambda: forecaster.predict(hist_df, future_df, horizon=H, fast=True), repeat)
+        t_legacy = _time(lambda: forecaster.predict(hist_df, future_df, horizon=H, fast=False), repeat)
+        rows.append({
+            "horizon":          H,
+            "legacy_ms":        t_legacy * 1e3,
+            "fast_ms":          t_fast * 1e3,
+            "legacy_ms_per_step": t_legacy * 1e3 / H,
+            "fast_ms_per_step": t_fast * 1e3 / H,
+            "speedup":          t_legacy / t_fast,
+        })
+    return pd.DataFrame(rows)
+
+
+def bench_forecaster_batch(site_counts=(1, 8, 32), horizon=48, repeat=3):
+    from cnn_forecaster import forecaster_from_settings
+
+    forecaster = forecaster_from_settings(load_settings())
+    rows = []
+    for N in site_counts:
+        frames = [synthetic_frames(forecaster.seq_length, horizon, seed=2 * k) for k in range(N)]
+
+        batched = forecaster.predict_batch(frames, horizon=horizon)
+        looped  = [forecaster.predict(h, f, horizon=horizon) for h, f in frames]
+        max_diff = max(np.abs(b - l).max() for b, l in zip(batched, looped))
+        if max_diff > 1e-4:
+            raise AssertionError(f"batched/per-site forecasts differ at N={N}: max |Δ| = {max_diff:.3g}")
+
+        t_loop  = _time(lambda: [forecaster.predict(h, f, horizon=horizon) for h, f in frames], repeat)
+        t_batch = _time(lambda: forecaster.predict_batch(frames, horizon=horizon), repeat)
+        rows.append({
+            "sites":        N,
+            "horizon":      horizon,
+            "per_site_ms":  t_loop * 1e3,
+            "batched_ms":   t_batch * 1e3,
+            "max_abs_diff": max_diff,
+            "speedup":      t_loop / t_batch,
+        })
+    return pd.DataFrame(rows)
+
+
+_STARTUP_PROBE = """
+import json, resource, sys, time
+
+def peak_rss_mb():
+    # ru_maxrss survives fork+exec on Linux, so prefer the fresh VmHWM
+    try:
+        for line in open("/proc/self/status"):
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+t0 = time.perf_counter()
+from cnn_forecaster import CNNForecaster
+s = json.load(open("settings.json"))
+f = CNNForecaster(s["model_name"], s["scaler_X_path"], s["scaler_y_path"], backend=sys.argv[1])
+f.warm_up()
+print(json.dumps({
+    "startup_s":  time.perf_counter() - t0,
+    "max_rss_mb": peak_rss_mb(),
+    "tensorflow": "tensorflow" in sys.modules,
+}))
+"""
+
+
+def bench_numpy_engine(n_windows=256, horizon=48, tol=1e-4):
+    """
+    Parity of the NumPy engine against Keras on random windows and on a full
+    forecast, plus cold-start time and peak RSS of each backend measured in
+    a fresh interpreter.
+    """
+    from cnn_forecaster import CNNForecaster
+
+    s = load_settings()
+    keras_fc = CNNForecaster(s["model_name"], s["scaler_X_path"], s["scaler_y_path"], backend="keras")
+    numpy_fc = CNNForecaster(s["model_name"], s["scaler_X_path"], s["scaler_y_path"], backend="numpy")
+
+    X = np.random.default_rng(0).uniform(
+        0, 1, (n_windows, keras_fc.seq_length, len(keras_fc.feature_cols))
+    ).astype(np.float32)
+    window_diff = np.abs(keras_fc.model.predict(X, verbose=0) - numpy_fc.model(X)).max()
+
+    hist_df, future_df = synthetic_frames(keras_fc.seq_length, horizon)
+    forecast_diff = np.abs(
+        keras_fc.predict(hist_df, future_df, horizon=horizon)
+        - numpy_fc.predict(hist_df, future_df, horizon=horizon)
+    ).max()
+    if max(window_diff, forecast_diff) > tol:
+        raise AssertionError(f"NumPy engine differs from Keras: windows {window_diff:.3g}, "
+                             f"forecast {forecast_diff:.3g} (tol {tol})")
+
+    rows = []
+    for backend in ("keras", "numpy"):
+        out = subprocess.run([sys.executable, "-c", _STARTUP_PROBE, backend],
+                             capture_output=True, text=True, check=True)
+        probe = json.loads(out.stdout.strip().splitlines()[-1])
+        t = _time(lambda: (keras_fc if backend == "keras" else numpy_fc)
+                  .predict(hist_df, future_df, horizon=horizon), 3)
+        rows.append({
+            "backend":          backend,
+            "startup_s":        probe["startup_s"],
+            "max_rss_mb":       probe["max_rss_mb"],
+            "imports_tf":       probe["tensorflow"],
+            f"predict_{horizon}h_ms": t * 1e3,
+            "max_window_diff":  window_diff,
+            "max_forecast_diff": forecast_diff,
+        })
+    return pd.DataFrame(rows)
+
+
+# (horizon, eco_mode) fixtures for the CBC benchmarks. A 168 h eco plan is
+# left out: CBC doesn't prove optimality on it within minutes.
+OPTIMISER_CASES = ((24, False), (24, True), (48, False), (48, True), (168, False))
+
+
+def bench_optimiser_template(cases=OPTIMISER_CASES, repeat=3):
+    """
+    Model build vs solve time for a fresh PuLP model (the old behaviour)
+    and for a solve on the cached (horizon, mode) template.
+    """
+    import optimiser
+
+    rows = []
+    for H, eco in cases:
+        kw = synthetic_optimiser_inputs(H, eco)
+        wear = kw.get("cycle_degradation_cost", 1.0) / (2 * 75.0)
+        params = (kw["solar_forecast"], kw["grid_prices"], kw["grid_demand"], kw["required_energy"],
+                  75.0, 11.0, 11.0, kw["initial_soc"], 0.05, kw["v2g_sell_price"], wear, 0.0, 30000)
+
+        t_build = _time(lambda: optimiser._LpTemplate(H, eco), repeat)
+        template = optimiser._LpTemplate(H, eco)
+        t_update = _time(lambda: template.update(*params), repeat)
+        t_solve  = _time(template.solve, repeat)
+
+        t_fresh  = _time(lambda: optimiser.run_optimiser(**kw, reuse_model=False), repeat)
+        optimiser.run_optimiser(**kw)           # populate the template cache
+        t_reused = _time(lambda: optimiser.run_optimiser(**kw), repeat)
+        rows.append({
+            "horizon":   H,
+            "mode":      "eco" if eco else "cost",
+            "build_ms":  t_build * 1e3,
+            "update_ms": t_update * 1e3,
+            "solve_ms":  t_solve * 1e3,
+            "fresh_total_ms":  t_fresh * 1e3,
+            "reused_total_ms": t_reused * 1e3,
+            "speedup":   t_fresh / t_reused,
+        })
+    return pd.DataFrame(rows)
+
+
+def plan_objective(result, kw):
+    """The MILP objective value of a run_optimiser result (for parity checks)."""
+    H        = min(kw["deadline_hour"], len(kw["solar_forecast"]))
+    wear     = kw.get("cycle_degradation_cost", 1.0) / (2 * kw.get("battery_capacity", 75.0))
+    co2      = 0.0 if kw["eco_mode"] else kw.get("co2_price_per_kg", 0.0) * kw.get("emission_factor", 0.233)
+    switch   = kw.get("switch_penalty", 0.05)
+    v2g      = kw.get("v2g_sell_price", 0.10)
+    pv, gc, gd = result["solar_charging"], result["grid_charging"], result["grid_discharging"]
+    return sum(
+        kw["grid_prices"][h] * gc[h] - v2g * gd[h] + wear * (pv[h] + gc[h] + gd[h])
+        + switch * (gd[h] > 1e-9) + co2 * gc[h]
+        for h in range(H)
+    )
+
+
+# CBC can take minutes to prove optimality on some 168 h instances, so the
+# parity corpus sticks to the horizons it closes quickly
+PARITY_CASES = ((24, False), (24, True), (48, False), (48, True))
+
+
+def bench_solver_parity(cases=PARITY_CASES, seeds=range(5), tol=1e-6, repeat=1):
+    """
+    CBC vs HiGHS vs the (polished) DP engine on the same corpus: all must
+    reach the CBC objective within tol (schedules may differ on ties);
+    reports mean solve times.
+    """
+    import optimiser
+
+    rows = []
+    for H, eco in cases:
+        t_cbc = t_highs = t_dp = worst = 0.0
+        for seed in seeds:
+            kw  = synthetic_optimiser_inputs(H, eco, seed)
+            ref = plan_objective(optimiser.run_optimiser(**kw, solver="cbc"), kw)
+            for solver in ("highs", "dp"):
+                gap = abs(plan_objective(optimiser.run_optimiser(**kw, solver=solver), kw) - ref)
+                if gap > tol:
+                    raise AssertionError(f"CBC/{solver} objectives differ "
+                                         f"(H={H}, eco={eco}, seed={seed}): {gap:.3g}")
+                worst = max(worst, gap)
+            t_cbc   += _time(lambda: optimiser.run_optimiser(**kw, solver="cbc"), repeat)
+            t_highs += _time(lambda: optimiser.run_optimiser(**kw, solver="highs"), repeat)
+            t_dp    += _time(lambda: optimiser.run_optimiser(**kw, solver="dp"), repeat)
+        rows.append({
+            "horizon":       H,
+            "mode":          "eco" if eco else "cost",
+            "cases":         len(seeds),
+            "cbc_ms":        t_cbc / len(seeds) * 1e3,
+            "highs_ms":      t_highs / len(seeds) * 1e3,
+            "dp_ms":         t_dp / len(seeds) * 1e3,
+            "max_obj_diff":  worst,
+        })
+    return pd.DataFrame(rows)
+
+
+def bench_dp_gap(cases=OPTIMISER_CASES, seeds=range(3), soc_steps=(0.05, 0.01), tol=1e-6):
+    """
+    Optimality gap (£) of the DP engine against the exact MILP (HiGHS) on
+    the synthetic corpus, per SoC grid step, with and without the LP
+    polish, with mean solve times. DP plans must be feasible for the MILP
+    (caps, SoC bounds, target), never beat it by more than tol, and with
+    the polish must match it within tol.
+    """
+    import optimiser
+
+    rows = []
+    for H, eco in cases:
+        exact = []
+        t_milp = 0.0
+        for seed in seeds:
+            kw = synthetic_optimiser_inputs(H, eco, seed)
+            t0 = time.perf_counter()
+            exact.append(plan_objective(optimiser.run_optimiser(**kw, solver="highs"), kw))
+            t_milp += time.perf_counter() - t0
+
+        for step, polish in ((step, polish) for step in soc_steps for polish in (False, True)):
+            gaps, t_dp = [], 0.0
+            for seed, best in zip(seeds, exact):
+                kw  = synthetic_optimiser_inputs(H, eco, seed)
+                run = lambda: optimiser.run_optimiser(**kw, solver="dp", dp_soc_step=step, dp_polish=polish)
+                dp  = run()
+                soc = np.asarray(dp["battery_soc"])
+                ok  = (
+                    np.all(np.asarray(dp["solar_charging"][:H]) <= np.asarray(kw["solar_forecast"][:H]) + tol)
+                    and np.all(soc >= -tol) and np.all(soc <= 75.0 + tol)
+                    and abs(soc[H] - (kw["initial_soc"] if eco else kw["required_energy"])) <= tol
+                )
+                if not ok:
+                    raise AssertionError(f"DP plan infeasible (H={H}, eco={eco}, seed={seed}, step={step})")
+                gap = plan_objective(dp, kw) - best
+                if gap < -tol or (polish and gap > tol):
+                    raise AssertionError(f"DP objective off the MILP optimum by {gap:.3g} "
+                                         f"(H={H}, eco={eco}, seed={seed}, step={step}, polish={polish})")
+                gaps.append(gap)
+                t_dp += _time(run, 1)
+            rows.append({
+                "horizon":   H,
+                "mode":      "eco" if eco else "cost",
+                "soc_step":  step,
+                "polish":    polish,
+                "milp_ms":   t_milp / len(seeds) * 1e3,
+                "dp_ms":     t_dp / len(seeds) * 1e3,
+                "mean_gap":  float(np.mean(gaps)),
+                "max_gap":   float(np.max(gaps)),
+            })
+    return pd.DataFrame(rows)
+
+
+def synthetic_fleet(n, H, seed=0):
+    """
+    n vehicles from cars.json (60 kWh+ batteries) with deadlines between H/2
+    and H, plus run_optimiser-style kwargs for the shared site inputs.
+    """
+    import fleet
+
+    rng   = np.random.default_rng(seed)
+    with open("cars.json") as f:
+        cars = [name for name, spec in json.load(f).items() if spec["battery_capacity"] >= 60]
+    vehicles = fleet.load_vehicles([
+        dict(car=cars[i % len(cars)], name=f"ev{i}", deadline_hour=int(rng.integers(H // 2, H + 1)),
+             required_energy=float(rng.uniform(30, 55)), initial_soc=float(rng.uniform(10, 30)))
+        for i in range(n)
+    ])
+    return vehicles, synthetic_optimiser_inputs(H, seed=seed)
+
+
+def _fleet_kwargs(vehicle, site):
+    # per-vehicle kwargs for plan_objective
+    return dict(site, deadline_hour=vehicle["deadline_hour"], battery_capacity=vehicle["battery_capacity"])
+
+
+def solve_fleet_monolithic(vehicles, site, site_import_kw, time_limit=30.0):
+    """
+    Reference: the whole fleet as one MILP (every vehicle's milp_arrays
+    block plus the site import / shared PV rows), solved by HiGHS.
+    Returns (objective or None, proven optimal).
+    """
+    import optimiser
+    from scipy.optimize import milp, LinearConstraint, Bounds
+    from scipy.sparse import block_diag, coo_matrix
+
+    H_site = max(v["deadline_hour"] for v in vehicles)
+    parts, offset, coupling = [], 0, []
+    for v in vehicles:
+        H, cap = v["deadline_hour"], v["battery_capacity"]
+        arrays = optimiser.milp_arrays(
+            site["solar_forecast"][:H], site["grid_prices"][:H], site["grid_demand"][:H],
+            v["required_energy"], cap, v["max_charge_rate"], v["max_discharge_rate"],
+            v["initial_soc"], 0.05, site["v2g_sell_price"], 1.0 / (2 * cap), 0.0, 30000, False
+        )
+        cPV, cG = arrays[-1][0], arrays[-1][1]
+        coupling += [(h, offset + cG[h]) for h in range(H)]
+        coupling += [(H_site + h, offset + cPV[h]) for h in range(H)]
+        parts.append(arrays)
+        offset += len(arrays[0])
+
+    rows, cols = zip(*coupling)
+    C = coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(2 * H_site, offset))
+    limit = np.concatenate([np.full(H_site, site_import_kw), site["solar_forecast"][:H_site]])
+    res = milp(
+        np.concatenate([p[0] for p in parts]),
+        constraints=[
+            LinearConstraint(block_diag([p[1] for p in parts]),
+                             np.concatenate([p[2] for p in parts]), np.concatenate([p[3] for p in parts])),
+            LinearConstraint(C, -np.inf, limit),
+        ],
+        integrality=np.concatenate([p[6] for p in parts]),
+        bounds=Bounds(np.concatenate([p[4] for p in parts]), np.concatenate([p[5] for p in parts])),
+        options={"time_limit": time_limit},
+    )
+    return res.fun, res.status == 0
+
+
+def bench_fleet(sizes=(5, 10, 20, 40), H=48, kw_per_vehicle=2.5, time_limit=30.0):
+    """
+    Price-coordinated fleet solve vs the monolithic MILP under a site import
+    cap of kw_per_vehicle × fleet size. gap is relative to the monolithic
+    objective, and only reported when HiGHS proves that one optimal within
+    time_limit.
+    """
+    import fleet
+
+    rows = []
+    for n in sizes:
+        vehicles, site = synthetic_fleet(n, H, seed=n)
+        cap = kw_per_vehicle * n
+
+        t0  = time.perf_counter()
+        out = fleet.run_fleet_optimiser(vehicles, site["solar_forecast"], site["grid_prices"],
+                                        site["grid_demand"], site_import_kw=cap,
+                                        v2g_sell_price=site["v2g_sell_price"])
+        t_fleet = time.perf_counter() - t0
+        if max(out["site_import"]) > cap + 1e-6:
+            raise AssertionError(f"Fleet plan breaks the site cap ({n} vehicles)")
+        obj = sum(plan_objective(out["vehicles"][v["name"]], _fleet_kwargs(v, site)) for v in vehicles)
+
+        t0 = time.perf_counter()
+        mono, optimal = solve_fleet_monolithic(vehicles, site, cap, time_limit)
+        t_mono = time.perf_counter() - t0
+        rows.append({
+            "vehicles":       n,
+            "fleet_s":        t_fleet,
+            "per_vehicle_ms": t_fleet / n * 1e3,
+            "rounds":         out["iterations"],
+            "converged":      out["converged"],
+            "objective":      obj,
+            "monolithic_s":   t_mono,
+            "monolithic_obj": mono,
+            "gap":            (obj - mono) / abs(mono) if optimal else float("nan"),
+        })
+    return pd.DataFrame(rows)
+
+
+def bench_fleet_repair(n=3, H=24, kw_per_vehicle=4.0, max_iter=4):
+    """
+    run_fleet_optimiser when the greedy repair pass strands a vehicle
+    (simulated by failing the first capped solve of a round): rounds whose
+    repair fails are skipped and a later round's plan is used; only when
+    every round fails may it raise. Also checks that max_iter < 1 is
+    rejected.
+    """
+    import fleet
+
+    vehicles, site = synthetic_fleet(n, H, seed=n)
+    args = (vehicles, site["solar_forecast"], site["grid_prices"], site["grid_demand"])
+    cap  = kw_per_vehicle * n
+    real = fleet.solve_schedule
+
+    def run(failed_rounds, **kw):
+        failed = [0]
+
+        def solve_schedule(params, *a, **k):
+            # per-hour rates (params[5]) mean a repair/polish solve against site caps
+            if isinstance(params[5], np.ndarray) and failed[0] < failed_rounds:
+                failed[0] += 1
+                raise RuntimeError("stranded")
+            return real(params, *a, **k)
+
+        fleet.solve_schedule = solve_schedule
+        try:
+            return fleet.run_fleet_optimiser(*args, site_import_kw=cap,
+                                             v2g_sell_price=site["v2g_sell_price"], **kw)
+        finally:
+            fleet.solve_schedule = real
+
+    rows = []
+    for case, failed_rounds in (("repairs succeed", 0), ("early repairs fail", max_iter // 2)):
+        out = run(failed_rounds, max_iter=max_iter)
+        if max(out["site_import"]) > cap + 1e-6:
+            raise AssertionError(f"Fleet plan breaks the site cap ({case})")
+        if out["plan_round"] <= failed_rounds:
+            raise AssertionError(f"Fleet plan taken from failed round {out['plan_round']} ({case})")
+        rows.append({"case": case, "failed_repairs": failed_rounds, "rounds": out["iterations"],
+                     "converged": out["converged"], "plan_round": out["plan_round"],
+                     "plan_source": out["plan_source"], "net_cost": out["net_cost"]})
+
+    try:
+        run(max_iter, max_iter=max_iter)
+    except RuntimeError as e:
+        if "No feasible fleet schedule" not in str(e):
+            raise
+    else:
+        raise AssertionError("Fleet solve with every repair failing didn't raise")
+    rows.append({"case": "all repairs fail", "failed_repairs": max_iter, "rounds": max_iter,
+                 "converged": False, "plan_round": None, "plan_source": None,
+                 "net_cost": float("nan")})
+
+    try:
+        fleet.run_fleet_optimiser(*args, site_import_kw=cap, max_iter=0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("max_iter=0 was accepted")
+    return pd.DataFrame(rows)
+
+
+def bench_stochastic(ensembles=(100, 1000, 10000), H=48, n_reduced=10, first_stage_hours=4,
+                     time_limit=30.0):
+    """
+    Sample-average mode on demand / PV ensembles of growing size: time for
+    the scenario reduction and the whole solve, expected cost and spread.
+    gap is the plan's expected objective over the extensive-form MILP of
+    the same reduced scenarios, only reported when HiGHS proves that one
+    optimal within time_limit.
+    """
+    import stochastic
+    from demand_simulation import generate_scenarios
+    from scipy.optimize import milp, LinearConstraint, Bounds
+
+    kw    = synthetic_optimiser_inputs(H)
+    start = datetime(2024, 1, 1, 18)      # synthetic_optimiser_inputs starts at 18:00
+    wear  = 1.0 / (2 * 75.0)
+    rows  = []
+    for n in ensembles:
+        demand, _ = generate_scenarios(n, H, seed=n, start=start)
+        solar     = stochastic.solar_scenarios(kw["solar_forecast"], n, seed=n)
+
+        t0 = time.perf_counter()
+        stochastic.reduce_scenarios(np.hstack([solar, 11.0 * (demand >= 30000)]), n_reduced)
+        t_reduce = time.perf_counter() - t0
+
+        t0  = time.perf_counter()
+        out = stochastic.run_stochastic_optimiser(
+            solar, kw["grid_prices"], demand, H, kw["required_energy"],
+            initial_soc=kw["initial_soc"], v2g_sell_price=kw["v2g_sell_price"],
+            first_stage_hours=first_stage_hours, n_reduced=n_reduced)
+        t_saa = time.perf_counter() - t0
+
+        idx  = [s["index"] for s in out["scenarios"]]
+        prob = [s["probability"] for s in out["scenarios"]]
+        obj  = sum(p * plan_objective(s["plan"], dict(kw, solar_forecast=list(solar[i]),
+                                                      grid_demand=list(demand[i])))
+                   for i, p, s in zip(idx, prob, out["scenarios"]))
+
+        params = [(list(solar[i]), kw["grid_prices"], list(demand[i]), kw["required_energy"], 75.0,
+                   11.0, 11.0, kw["initial_soc"], 0.05, kw["v2g_sell_price"], wear, 0.0, 30000)
+                  for i in idx]
+        c, A, lo, hi, lb, ub, integrality, _ = stochastic.extensive_arrays(
+            params, prob, False, first_stage_hours)
+        t0  = time.perf_counter()
+        res = milp(c, constraints=LinearConstraint(A, lo, hi), integrality=integrality,
+                   bounds=Bounds(lb, ub), options={"time_limit": time_limit})
+        t_milp = time.perf_counter() - t0
+
+        rows.append({
+            "ensemble":      n,
+            "scenarios":     len(idx),
+            "reduce_s":      t_reduce,
+            "saa_s":         t_saa,
+            "expected_cost": out["expected_cost"],
+            "cost_std":      out["cost_std"],
+            "milp_s":        t_milp,
+            "gap":           obj - res.fun if res.status == 0 else float("nan"),
+        })
+    return pd.DataFrame(rows)
+
+
+# `import app` must stay under this (seconds, measured in a fresh interpreter)
+# and must not pull in any of HEAVY_MODULES.
+COLD_START_BUDGET_S = 0.6
+HEAVY_MODULES = ("tensorflow", "pandas", "pulp", "googlemaps", "sklearn", "cnn_forecaster")
+
+_COLD_START_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+print(json.dumps({
+    "import_s": time.perf_counter() - t0,
+    "heavy":    [m for m in sys.argv[1:] if m in sys.modules],
+}))
+"""
+
+
+def bench_cold_start(budget_s=COLD_START_BUDGET_S):
+    """
+    Imports app.py in a fresh interpreter (warm-up thread disabled) with
+    -X importtime and reports the cumulative import time of each module app
+    pulls in directly. Fails if the total exceeds budget_s or a heavy
+    dependency is imported eagerly.
+    """
+    env = dict(os.environ, V2G_WARMUP="0")
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", _COLD_START_PROBE, *HEAVY_MODULES],
+                         capture_output=True, text=True, check=True, env=env)
+    probe = json.loads(out.stdout.strip().splitlines()[-1])
+
+    # importtime prints children before their parent, so the depth-1 lines
+    # right before the top-level "app" line are app's direct imports.
+    rows, pending = [], []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0:
+            if name.strip() == "app":
+                rows = pending
+            pending = []
+        elif depth == 1:
+            pending.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1e3})
+    rows.append({"module": "app (total)", "cumulative_ms": probe["import_s"] * 1e3})
+    df = pd.DataFrame(rows).sort_values("cumulative_ms", ascending=False)
+
+    if probe["heavy"]:
+        raise AssertionError(f"import app eagerly loaded: {', '.join(probe['heavy'])}")
+    if probe["import_s"] > budget_s:
+        raise AssertionError(f"cold start {probe['import_s']:.3f}s exceeds budget {budget_s:.3f}s\n"
+                             + df.to_string(index=False))
+    return df
+
+
+# ─── Micro-benchmarks ─────────────────────────────────────────────
+# Hot functions on fixed offline fixtures, compared against a stored
+# baseline so a change that slows one of them down shows up:
+#
+#   python benchmark.py micro                   # compare with the baseline
+#   python benchmark.py micro --save-baseline   # record a new baseline
+#   python benchmark.py micro --json out.json   # machine-readable results
+
+MICRO_BASELINE  = "benchmark_baseline.json"
+MICRO_TOLERANCE = 0.25      # best time may grow 25% before it's a regression
+
+
+def micro_cases():
+    """
+    (name, fn) pairs. All fixture setup happens here, so the timings only
+    cover the call itself. CBC runs on OPTIMISER_CASES (warm templates, as
+    in the app); the DP engine also covers the 168 h eco plan.
+    """
+    import optimiser
+    from utils import format_charging_plan
+    from demand_simulation import generate_grid_demand_realistic, generate_scenarios
+    from cnn_forecaster import forecaster_from_settings
+    from tariff import load_tariffs
+    from plan_store import PlanStore
+
+    cases = []
+    for H, eco in OPTIMISER_CASES:
+        kw = synthetic_optimiser_inputs(H, eco)
+        cases.append((f"run_optimiser/cbc/{H}h/{'eco' if eco else 'cost'}",
+                      lambda kw=kw: optimiser.run_optimiser(**kw, solver="cbc")))
+    for H in (24, 48, 168):
+        for eco in (False, True):
+            kw = synthetic_optimiser_inputs(H, eco)
+            cases.append((f"run_optimiser/dp/{H}h/{'eco' if eco else 'cost'}",
+                          lambda kw=kw: optimiser.run_optimiser(**kw, solver="dp")))
+    for slot in (30, 15):
+        kw = synthetic_slot_inputs(48, slot)
+        cases.append((f"run_optimiser/dp/48h@{slot}min/cost",
+                      lambda kw=kw, slot=slot: optimiser.run_optimiser(**kw, solver="dp", slot_minutes=slot)))
+
+    for H in (24, 168):
+        prices = synthetic_optimiser_inputs(H)["grid_prices"]
+        cases.append((f"compute_baseline_cost/{H}h",
+                      lambda prices=prices: optimiser.compute_baseline_cost(prices, 40.0, 11.0)))
+
+    forecaster = forecaster_from_settings(load_settings())
+    for H in (24, 48):
+        hist_df, future_df = synthetic_frames(forecaster.seq_length, H)
+        cases.append((f"CNNForecaster.predict/{forecaster.backend}/{H}h",
+                      lambda h=hist_df, f=future_df, H=H: forecaster.predict(h, f, horizon=H)))
+
+    for H in (48, 168):
+        cases.append((f"generate_grid_demand_realistic/{H}h",
+                      lambda H=H: generate_grid_demand_realistic(H, seed=0)))
+    cases.append(("generate_scenarios/1000x168h", lambda: generate_scenarios(1000, 168, seed=0)))
+
+    tou   = load_tariffs(None)["tou"]
+    start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    tou.prices(start, 168)                # materialised outside the timing
+    cases.append(("Tariff.prices/tou/168h", lambda: tou.prices(start, 168)))
+
+    plan = optimiser.run_optimiser(**synthetic_optimiser_inputs(48), solver="dp")
+    cases.append(("format_charging_plan/48h", lambda: format_charging_plan(plan, 18, 48, 0)))
+
+    # a page of saved trips out of 1000 48 h plans (the DB is removed at exit)
+    import tempfile
+    tmp   = tempfile.TemporaryDirectory()
+    store = PlanStore(os.path.join(tmp.name, "plans.sqlite3"))
+    for i in range(1000):
+        store.add({"id": f"{i:08x}", "name": f"plan {i}", "result": plan,
+                   "created_at": (start + timedelta(hours=i)).isoformat()})
+    cases.append(("PlanStore.list_recent/20of1000",
+                  lambda tmp=tmp: store.list_recent(20, 500)))
+    # as /saved_trips reads a page: without the plan arrays
+    cases.append(("PlanStore.list_recent/20of1000/summaries",
+                  lambda tmp=tmp: store.list_recent(20, 500, exclude=("result", "grid_prices"))))
+    return cases
+
+
+def _autorange(fn, repeat, min_time=0.2):
+    # per-call seconds over `repeat` runs of enough loops to last min_time
+    loops = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - t0 >= min_time:
+            break
+        loops *= 2
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        times.append((time.perf_counter() - t0) / loops)
+    return loops, times
+
+
+def load_micro_baseline(path=MICRO_BASELINE):
+    """{case: best_us} from a baseline written by save_micro_baseline, or {}."""
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return {row["case"]: row["best_us"] for row in json.load(f)["cases"]}
+
+
+def save_micro_baseline(df, path=MICRO_BASELINE):
+    with open(path, "w") as f:
+        json.dump({"machine": machine_info(),
+                   "cases":   df[["case", "best_us", "median_us"]].to_dict("records")}, f, indent=2)
+        f.write("\n")
+
+
+def machine_info():
+    import platform
+    return {
+        "python":    platform.python_version(),
+        "platform":  platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus":      os.cpu_count(),
+    }
+
+
+def bench_micro(baseline=MICRO_BASELINE, tolerance=MICRO_TOLERANCE, repeat=5):
+    """
+    Best and median per-call time of every micro_cases() entry, and the
+    ratio of the best time to the baseline's. status is "slower" for a
+    case more than `tolerance` slower than the baseline (the CLI exits
+    non-zero on any). Only meaningful against a baseline recorded on the
+    same machine.
+    """
+    stored = load_micro_baseline(baseline)
+    rows = []
+    for name, fn in micro_cases():
+        fn()                                    # warm caches / templates
+        loops, times = _autorange(fn, repeat)
+        best, median = min(times) * 1e6, float(np.median(times)) * 1e6
+        ref = stored.get(name)
+        ratio = best / ref if ref else float("nan")
+        rows.append({
+            "case":        name,
+            "loops":       loops,
+            "best_us":     best,
+            "median_us":   median,
+            "baseline_us": ref if ref else float("nan"),
+            "ratio":       ratio,
+            "status":      "new" if not ref else
+                           "slower" if ratio > 1 + tolerance else
+                           "faster" if ratio < 1 / (1 + tolerance) else "ok",
+        })
+    return pd.DataFrame(rows)
+
+
+BENCHMARKS = {
+    "forecaster":       bench_forecaster,
+    "forecaster_batch": bench_forecaster_batch,
+    "numpy_engine":     bench_numpy_engine,
+    "cold_start":       bench_cold_start,
+    "optimiser_template": bench_optimiser_template,
+    "solver_parity":    bench_solver_parity,
+    "dp_gap":           bench_dp_gap,
+    "fleet":            bench_fleet,
+    "fleet_repair":     bench_fleet_repair,
+    "stochastic":       bench_stochastic,
+    "micro":            bench_micro,
+}
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Offline benchmarks.")
+    parser.add_argument("names", nargs="*", metavar="name",
+                        help=f"benchmarks to run (default: all): {', '.join(BENCHMARKS)}")
+    parser.add_argument("--json", metavar="PATH", help="also write every result table to PATH as JSON")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"store the micro results as the new baseline ({MICRO_BASELINE})")
+    parser.add_argument("--tolerance", type=float, default=MICRO_TOLERANCE,
+                        help="relative slowdown of a micro case that counts as a regression")
+    args = parser.parse_args()
+    unknown = [n for n in args.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+
+    results, failed = {}, {}
+    for name in args.names or list(BENCHMARKS):
+        print(f"── {name} " + "─" * (60 - len(name)))
+        try:
+            if name == "micro":
+                df = bench_micro(baseline=None if args.save_baseline else MICRO_BASELINE,
+                                 tolerance=args.tolerance)
+                if args.save_baseline:
+                    save_micro_baseline(df)
+            else:
+                df = BENCHMARKS[name]()
+        except AssertionError as e:
+            print(f"FAILED: {e}")
+            failed[name] = str(e)
+            continue
+        print(df.to_string(index=False, float_format="%.4g"))
+        results[name] = df
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"machine": machine_info(),
+                       "results": {name: json.loads(df.to_json(orient="records"))
+                                   for name, df in results.items()}}, f, indent=2)
+
+    if failed:
+        sys.exit(f"{len(failed)} check(s) failed: {', '.join(failed)}")
+    if "micro" in results:
+        slower = results["micro"].query("status == 'slower'")["case"].tolist()
+        if slower:
+            sys.exit(f"{len(slower)} micro-benchmark(s) regressed by more than "
+                     f"{args.tolerance:.0%}: {', '.join(slower)}")
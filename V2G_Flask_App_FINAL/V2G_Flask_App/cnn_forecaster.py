@@ -1,94 +1,270 @@
-# cnn_forecaster.py
-
-import os, re, joblib
-import numpy as np
-import pandas as pd
-from tensorflow.keras.models import load_model
-
-class CNNForecaster:
-    def __init__(self, model_path, scaler_X_path, scaler_y_path):
-        # 1) Load model (no compile needed for inference)
-        self.model = load_model(model_path, compile=False)
-
-        # 2) Parse seq_length from filename (e.g., CNN_24_64_...)
-        m = re.search(r'CNN_(\d+)_', os.path.basename(model_path))
-        if not m:
-            raise ValueError("Could not parse seq_length from model filename")
-        self.seq_length = int(m.group(1))
-
-        # 3) Define expected input feature columns
-        self.feature_cols = [
-            "solar_radiation_W_m2",
-            "temperature_2m",
-            "time_of_day",
-            "irradiance_present"
-        ]
-
-        # 4) Load pre-fitted scalers
-        self.scaler_X = joblib.load(scaler_X_path)
-        self.scaler_y = joblib.load(scaler_y_path)
-
-    def _engineer(self, df):
-        df = df.copy()
-        df['time_of_day'] = pd.to_datetime(df['datetime']).dt.hour
-        df['irradiance_present'] = (df['solar_radiation_W_m2'] > 0).astype(int)
-        return df[self.feature_cols]
-
-    def predict(self, historical_df, future_df=None, horizon=None):
-        # ─── Feature engineering ───────────────────────────────
-        hist_feats = self._engineer(historical_df)
-        fut_feats = self._engineer(future_df) if future_df is not None else None
-        all_feats = pd.concat([hist_feats, fut_feats], ignore_index=True) if fut_feats is not None else hist_feats
-
-        # ─── Scaling features ───────────────────────────────────
-        hist_scaled = self.scaler_X.transform(hist_feats)
-        fut_scaled = self.scaler_X.transform(fut_feats) if fut_feats is not None else None
-
-        # ─── Padding if historical data is too short ────────────
-        if len(hist_scaled) < self.seq_length:
-            need = self.seq_length - len(hist_scaled)
-            if fut_scaled is None or len(fut_scaled) < need:
-                raise ValueError(f"Need at least {self.seq_length} total points for CNN input.")
-            pad = fut_scaled[:need]
-            hist_scaled = np.vstack([pad, hist_scaled])
-            fut_scaled = fut_scaled[need:]
-
-        # ─── Create initial prediction window ───────────────────
-        X_win = hist_scaled[-self.seq_length:].reshape(1, self.seq_length, -1)
-
-        # ─── Set forecast horizon ───────────────────────────────
-        if horizon is None:
-            horizon = len(fut_scaled) if fut_scaled is not None else 24
-
-        # ─── Generate forecasts ─────────────────────────────────
-        preds = []
-        for i in range(horizon):
-            norm_p = float(self.model.predict(X_win, verbose=0).flatten()[0])
-            mw_p = self.scaler_y.inverse_transform([[norm_p]])[0, 0]
-
-            # Scale from MW to realistic household-level kW
-            scaled_kw_p = (mw_p * 1000) * (3.25 / 5000)  # 3.25 kW home, 5 MW solar farm baseline
-            preds.append(scaled_kw_p)
-
-            new_row = fut_scaled[i] if fut_scaled is not None and i < len(fut_scaled) else X_win[0, -1, :]
-            X_win = np.concatenate([X_win[:, 1:, :], new_row.reshape(1, 1, -1)], axis=1)
-
-        # ─── Post-correct: Zero out predictions where no sun ───
-        # ─── Convert future_df to Europe/London, align by time, then apply irradiance threshold ───
-        fut_local = future_df.copy()
-        fut_local['datetime'] = fut_local['datetime'].dt.tz_convert('Europe/London')
-        fut_local = fut_local.sort_values('datetime').reset_index(drop=True)
-
-        irradiance = fut_local['solar_radiation_W_m2'].values[:horizon]
-        threshold = 30.0  # W/m²
-
-        solar = [
-            pred if ir >= threshold else 0.0
-            for pred, ir in zip(preds, irradiance)
-        ]
-
-        return np.array(solar)
-
-        return np.array(solar)
-
-
+# cnn_forecaster.py
+
+import os, re, joblib, threading
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from metrics import timed
+
+class CNNForecaster:
+    def __init__(self, model_path, scaler_X_path, scaler_y_path, backend="keras"):
+        # 1) Load model (no compile needed for inference). The "numpy"
+        #    backend reads the weights straight from the .h5 so TensorFlow
+        #    is never imported.
+        if backend == "keras":
+            from tensorflow.keras.models import load_model
+            self.model = load_model(model_path, compile=False)
+        elif backend == "numpy":
+            from numpy_cnn import NumpyCNN
+            self.model = NumpyCNN(model_path)
+        else:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        self.backend = backend
+
+        # 2) Parse seq_length from filename (e.g., CNN_24_64_...)
+        m = re.search(r'CNN_(\d+)_', os.path.basename(model_path))
+        if not m:
+            raise ValueError("Could not parse seq_length from model filename")
+        self.seq_length = int(m.group(1))
+
+        # 3) Define expected input feature columns
+        self.feature_cols = [
+            "solar_radiation_W_m2",
+            "temperature_2m",
+            "time_of_day",
+            "irradiance_present"
+        ]
+
+        # 4) Load pre-fitted scalers
+        self.scaler_X = joblib.load(scaler_X_path)
+        self.scaler_y = joblib.load(scaler_y_path)
+
+    def _engineer(self, df):
+        df = df.copy()
+        df['time_of_day'] = pd.to_datetime(df['datetime']).dt.hour
+        df['irradiance_present'] = (df['solar_radiation_W_m2'] > 0).astype(int)
+        return df[self.feature_cols]
+
+    def _prepare(self, historical_df, future_df=None, horizon=None):
+        # ─── Feature engineering ───────────────────────────────
+        hist_feats = self._engineer(historical_df)
+        fut_feats = self._engineer(future_df) if future_df is not None else None
+
+        # ─── Scaling features ───────────────────────────────────
+        hist_scaled = self.scaler_X.transform(hist_feats)
+        fut_scaled = self.scaler_X.transform(fut_feats) if fut_feats is not None else None
+
+        # ─── Padding if historical data is too short ────────────
+        if len(hist_scaled) < self.seq_length:
+            need = self.seq_length - len(hist_scaled)
+            if fut_scaled is None or len(fut_scaled) < need:
+                raise ValueError(f"Need at least {self.seq_length} total points for CNN input.")
+            pad = fut_scaled[:need]
+            hist_scaled = np.vstack([pad, hist_scaled])
+            fut_scaled = fut_scaled[need:]
+
+        # ─── Set forecast horizon ───────────────────────────────
+        if horizon is None:
+            horizon = len(fut_scaled) if fut_scaled is not None else 24
+
+        return hist_scaled[-self.seq_length:], fut_scaled, horizon
+
+    def _window_buffer(self, init_win, fut_scaled, horizon):
+        # Preallocated (seq_length + horizon) buffer: step i's window is the
+        # view buf[i:i+seq_length], so sliding it never copies. Rows past the
+        # end of the future features repeat the last row, giving the same
+        # windows as the old np.concatenate loop.
+        seq = self.seq_length
+        buf = np.empty((seq + horizon, init_win.shape[-1]), dtype=np.float32)
+        buf[:seq] = init_win
+        n_fut = min(horizon, len(fut_scaled)) if fut_scaled is not None else 0
+        buf[seq:seq + n_fut] = fut_scaled[:n_fut]
+        if n_fut < horizon:
+            buf[seq + n_fut:] = buf[seq + n_fut - 1]
+        return buf
+
+    def _infer_fn(self):
+        # Keras: a compiled tf.function direct call, avoiding model.predict's
+        # per-call data-adapter and callback overhead. NumPy: the model's
+        # plain forward pass, nothing compiled; the saving there comes from
+        # _rollout batching every window into one call.
+        if getattr(self, "_infer", None) is None:
+            if self.backend == "numpy":
+                self._infer = self.model
+                return self._infer
+
+            import tensorflow as tf
+            self._infer = tf.function(
+                lambda x: self.model(x, training=False),
+                input_signature=[tf.TensorSpec(
+                    [None, self.seq_length, len(self.feature_cols)], tf.float32
+                )]
+            )
+        return self._infer
+
+    def _rollout(self, bufs, horizon):
+        # ─── Generate normalised forecasts ──────────────────────
+        # bufs is (N, seq_length + horizon, features). The windows hold only
+        # weather features, never earlier predictions, so all N × horizon
+        # windows are known up front and go through one model call.
+        N, _, F = bufs.shape
+        wins = sliding_window_view(bufs, self.seq_length, axis=1)[:, :horizon]
+        wins = wins.transpose(0, 1, 3, 2).reshape(N * horizon, self.seq_length, F)
+        return np.asarray(self._infer_fn()(wins), dtype=np.float64).reshape(N, horizon)
+
+    def _rollout_legacy(self, init_win, fut_scaled, horizon):
+        # Original one-model.predict-per-step loop, kept for benchmarking.
+        X_win = init_win.reshape(1, self.seq_length, -1)
+        norm  = []
+        for i in range(horizon):
+            norm.append(float(self.model.predict(X_win, verbose=0).flatten()[0]))
+            new_row = fut_scaled[i] if fut_scaled is not None and i < len(fut_scaled) else X_win[0, -1, :]
+            X_win = np.concatenate([X_win[:, 1:, :], new_row.reshape(1, 1, -1)], axis=1)
+        return np.array(norm)
+
+    def _to_household_kw(self, norm):
+        # One vectorised inverse transform for the whole horizon
+        mw = self.scaler_y.inverse_transform(np.asarray(norm).reshape(-1, 1))[:, 0]
+
+        # Scale from MW to realistic household-level kW
+        return (mw * 1000) * (3.25 / 5000)  # 3.25 kW home, 5 MW solar farm baseline
+
+    def _zero_without_sun(self, preds, future_df, horizon):
+        # ─── Post-correct: Zero out predictions where no sun ───
+        # ─── Convert future_df to Europe/London, align by time, then apply irradiance threshold ───
+        fut_local = future_df.copy()
+        fut_local['datetime'] = fut_local['datetime'].dt.tz_convert('Europe/London')
+        fut_local = fut_local.sort_values('datetime').reset_index(drop=True)
+
+        irradiance = fut_local['solar_radiation_W_m2'].values[:horizon]
+        threshold = 30.0  # W/m²
+
+        solar = [
+            pred if ir >= threshold else 0.0
+            for pred, ir in zip(preds, irradiance)
+        ]
+
+        return np.array(solar)
+
+    def predict(self, historical_df, future_df=None, horizon=None, fast=True):
+        with timed("feature_engineering"):
+            init_win, fut_scaled, horizon = self._prepare(historical_df, future_df, horizon)
+
+        with timed("cnn_inference", backend=self.backend):
+            if fast:
+                # same windows as the legacy loop, but one batched float32
+                # call, so it agrees with fast=False to a few ulps, not
+                # bit for bit
+                buf  = self._window_buffer(init_win, fut_scaled, horizon)
+                norm = self._rollout(buf[np.newaxis], horizon)[0]
+            else:
+                norm = self._rollout_legacy(init_win, fut_scaled, horizon)
+        preds = self._to_household_kw(norm)
+
+        return self._zero_without_sun(preds, future_df, horizon)
+
+    def predict_batch(self, frames, horizon=None):
+        """
+        Multi-site forecast. frames is a list of (historical_df, future_df)
+        pairs, one per site; horizon is an int, a per-site list, or None
+        (each site's future length). Returns a list of PV arrays in the same
+        order, each the shape predict() would return and equal to it up to
+        float32 rounding.
+
+        Every site's windows go through the same single model call, instead
+        of one call per site.
+        """
+        if not frames:
+            return []
+        horizons = horizon if isinstance(horizon, (list, tuple)) else [horizon] * len(frames)
+        if len(horizons) != len(frames):
+            raise ValueError("Need one horizon per site.")
+
+        with timed("feature_engineering"):
+            prepared = [
+                self._prepare(hist_df, fut_df, h)
+                for (hist_df, fut_df), h in zip(frames, horizons)
+            ]
+        H_max = max(h for _, _, h in prepared)
+
+        # Sites with shorter horizons just carry their last row forward;
+        # the extra steps are discarded below.
+        with timed("cnn_inference", backend=self.backend):
+            bufs = np.stack([
+                self._window_buffer(init_win, fut_scaled, H_max)
+                for init_win, fut_scaled, _ in prepared
+            ])
+            norm = self._rollout(bufs, H_max)
+
+        out = []
+        for (_, fut_df), (_, _, h), site_norm in zip(frames, prepared, norm):
+            preds = self._to_household_kw(site_norm[:h])
+            out.append(self._zero_without_sun(preds, fut_df, h))
+        return out
+
+    def warm_up(self):
+        # One throw-away inference so the first real request doesn't pay for
+        # graph tracing / kernel selection inside Keras.
+        X_win = np.zeros((1, self.seq_length, len(self.feature_cols)), dtype=np.float32)
+        self._infer_fn()(X_win)
+        return self
+
+
+# ─── Process-wide forecaster registry ───────────────────────────
+# Loading the .h5 model and both scalers is the slowest part of a request,
+# so each (model, scaler_X, scaler_y) triple is loaded once per process and
+# shared by every route. Entries are keyed on the resolved paths *and* file
+# modification times, so pointing settings.json at another model (or
+# overwriting the file in place) transparently loads the new one.
+
+_REGISTRY      = {}
+_REGISTRY_LOCK = threading.Lock()
+
+
+def _registry_key(model_path, scaler_X_path, scaler_y_path):
+    paths = tuple(os.path.abspath(p) for p in (model_path, scaler_X_path, scaler_y_path))
+    mtimes = tuple(os.path.getmtime(p) if os.path.exists(p) else None for p in paths)
+    return paths, mtimes
+
+
+def get_forecaster(model_path, scaler_X_path, scaler_y_path, warm_up=True, backend="keras"):
+    """
+    Returns the shared CNNForecaster for this model/scaler triple and
+    backend, loading (and optionally warming up) it on first use.
+    """
+    paths, mtimes = _registry_key(model_path, scaler_X_path, scaler_y_path)
+    paths = paths + (backend,)
+    entry = _REGISTRY.get(paths)
+    if entry is not None and entry[0] == mtimes:
+        return entry[1]
+
+    with _REGISTRY_LOCK:
+        # another thread may have loaded it while we waited
+        entry = _REGISTRY.get(paths)
+        if entry is not None and entry[0] == mtimes:
+            return entry[1]
+
+        forecaster = CNNForecaster(model_path, scaler_X_path, scaler_y_path, backend=backend)
+        if warm_up:
+            forecaster.warm_up()
+        _REGISTRY[paths] = (mtimes, forecaster)
+        return forecaster
+
+
+def forecaster_from_settings(settings, warm_up=True):
+    """Shared forecaster for whatever model settings.json currently points at."""
+    return get_forecaster(
+        model_path    = settings["model_name"],
+        scaler_X_path = settings["scaler_X_path"],
+        scaler_y_path = settings["scaler_y_path"],
+        warm_up       = warm_up,
+        backend       = settings.get("inference_backend", "keras")
+    )
+
+
+def clear_registry():
+    with _REGISTRY_LOCK:
+        _REGISTRY.clear()
+
+
@@ -1,19 +1,21 @@
 # data_fetcher.py
+import asyncio
+import contextlib
 import pandas as pd
-import requests_cache
-from retry_requests import retry
-import openmeteo_requests
+from weather_client import get_weather_client, utc_now
+from weather_archive import WeatherArchive, DEFAULT_ARCHIVE_DIR
 
 class DataFetcher:
-    def __init__(self, latitude, longitude):
+    def __init__(self, latitude, longitude, archive_dir=DEFAULT_ARCHIVE_DIR):
         self.latitude = latitude
         self.longitude = longitude
-        self.cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-        self.retry_session = retry(self.cache_session, retries=5, backoff_factor=0.2)
-        self.client = openmeteo_requests.Client(session=self.retry_session)
+        self.client = get_weather_client()
+        # past hours are appended to the local archive (None disables it)
+        self.archive = WeatherArchive(archive_dir) if archive_dir else None
 
     def fetch_weather(self, start_date, end_date,
-                      hourly_params="temperature_2m,relative_humidity_2m,wind_speed_10m,cloudcover,shortwave_radiation"):
+                      hourly_params="temperature_2m,relative_humidity_2m,wind_speed_10m,cloudcover,shortwave_radiation",
+                      timeout=None):
         """
         Returns DataFrame with columns:
         datetime, temperature_2m, humidity_%, wind_speed_m_s, cloud_cover_%, solar_radiation_W_m2
@@ -26,7 +28,7 @@ class DataFetcher:
         # 2) choose historic vs forecast API
         url = (
             "https://historical-forecast-api.open-meteo.com/v1/forecast"
-            if start_dt < pd.Timestamp.now(tz="UTC").normalize()
+            if start_dt < pd.Timestamp(utc_now()).normalize()
             else "https://api.open-meteo.com/v1/forecast"
         )
         params = {
@@ -39,7 +41,8 @@ class DataFetcher:
         }
 
         # 3) fetch
-        responses = self.client.weather_api(url, params=params)
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        responses = self.client.weather_api(url, params=params, **kwargs)
         r = responses[0]
         hourly = r.Hourly()
 
@@ -67,7 +70,64 @@ class DataFetcher:
             "wind_speed_10m":        "wind_speed_m_s"
         }, inplace=True)
 
+        # 8) archive the hours that are already in the past
+        if self.archive is not None:
+            now = pd.Timestamp(utc_now()).floor("h")
+            self.archive.append(self.latitude, self.longitude, df[df["datetime"] < now])
+
         return df
 
+    def backfill(self, start_date, end_date, chunk_days=31, **kwargs):
+        """
+        Fills the archive for [start_date, end_date], fetching only the days
+        it doesn't hold yet, in chunks of at most chunk_days per request.
+        """
+        if self.archive is None:
+            raise ValueError("DataFetcher was created without an archive")
+        days = self.archive.missing_days(self.latitude, self.longitude, start_date, end_date)
+        chunk = []
+        for day in days + [None]:
+            if chunk and (day is None or (day - chunk[0]).days >= chunk_days
+                          or (day - chunk[-1]).days > 1):
+                self.fetch_weather(str(chunk[0]), str(chunk[-1]), **kwargs)
+                chunk = []
+            if day is not None:
+                chunk.append(day)
+
+    def load_history(self, start_date, end_date, columns=None):
+        """
+        Archived hourly history in [start_date, end_date) (UTC), read from
+        memory-mapped column files without touching the network. Only the
+        requested columns are loaded, e.g. ["solar_radiation_W_m2",
+        "temperature_2m"].
+        """
+        if self.archive is None:
+            raise ValueError("DataFetcher was created without an archive")
+        return self.archive.read(self.latitude, self.longitude, start_date, end_date, columns)
+
+    async def fetch_weather_async(self, start_date, end_date, semaphore=None, timeout=30.0, **kwargs):
+        """
+        Awaitable fetch_weather; the request runs on a worker thread, with
+        timeout passed to the HTTP request.
+        """
+        async with semaphore or contextlib.nullcontext():
+            return await asyncio.to_thread(self.fetch_weather, start_date, end_date,
+                                           timeout=timeout, **kwargs)
+
+
+def fetch_weather_many(jobs, max_concurrency=8, timeout=30.0):
+    """
+    jobs: iterable of (DataFetcher, start_date, end_date). Fetches them all
+    concurrently (bounded by max_concurrency) and returns the DataFrames in
+    job order.
+    """
+    async def run():
+        semaphore = asyncio.Semaphore(max_concurrency)
+        return await asyncio.gather(*(
+            fetcher.fetch_weather_async(start, end, semaphore, timeout)
+            for fetcher, start, end in jobs
+        ))
+    return asyncio.run(run())
+
 
 
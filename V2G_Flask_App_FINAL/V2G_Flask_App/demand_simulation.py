@@ -1,50 +1,67 @@
 import numpy as np
-import pandas as pd
 from datetime import datetime
 
+# Time-of-day base demand (MW) by hour: overnight low, morning peak, midday
+# average, evening peak
+BASE_DEMAND = np.array(
+    [22000] * 6 + [32000] * 3 + [27000] * 8 + [35000] * 4 + [27000] + [22000] * 2,
+    dtype=float,
+)
+WEEKEND_FACTOR = 0.85
+DEMAND_NOISE   = 1500
+
+# Price bands, highest threshold first: peak, mid, normal, off-peak
+PRICE_BANDS = ((34000, 0.30), (30000, 0.20), (25000, 0.15))
+OFF_PEAK    = 0.10
+
+
+def _base_demand(start, hours):
+    # base demand for each hour from `start`, weekend-adjusted
+    h       = start.hour + np.arange(hours)
+    weekday = (start.weekday() + h // 24) % 7  # 0=Monday, 6=Sunday
+    base    = BASE_DEMAND[h % 24]
+    return np.where(weekday >= 5, base * WEEKEND_FACTOR, base)
+
+
+def _prices(demand):
+    demand = np.asarray(demand, dtype=float)
+    return np.select([demand >= t for t, _ in PRICE_BANDS],
+                     [p for _, p in PRICE_BANDS], default=OFF_PEAK)
+
+
 def generate_grid_demand_realistic(hours=168, seed=None):
     if seed is not None:
         np.random.seed(seed)
 
     now = datetime.now().replace(minute=0, second=0, microsecond=0)
-    time_index = pd.date_range(start=now, periods=hours, freq="H")
+    # one draw per hour from the global RNG, in hour order as before
+    noise = np.random.normal(0, DEMAND_NOISE, hours)
+    return (_base_demand(now, hours) + noise).tolist()
 
-    demand = []
-    for timestamp in time_index:
-        hour = timestamp.hour
-        weekday = timestamp.weekday()  # 0=Monday, 6=Sunday
 
-        # Time-of-day base demand
-        if hour in range(6, 9):
-            base = 32000  # Morning peak
-        elif hour in range(17, 21):
-            base = 35000  # Evening peak
-        elif hour in range(0, 6) or hour in range(22, 24):
-            base = 22000  # Overnight low
-        else:
-            base = 27000  # Midday average
+def generate_price_profile_realistic(demand, base_price=0.12):
+    """
+    Price per hour of demand from the fixed PRICE_BANDS. base_price is
+    ignored; it is kept so existing callers don't break.
+    """
+    return _prices(demand).tolist()
 
-        # Weekend adjustment
-        if weekday >= 5:
-            base *= 0.85
 
-        # Add natural fluctuation
-        noise = np.random.normal(0, 1500)
-        demand.append(base + noise)
+def generate_scenarios(n_scenarios, hours=168, seed=None, start=None):
+    """
+    Monte Carlo ensemble of (demand, prices), each an (n_scenarios, hours)
+    array, for hours from start (default: the current hour).
 
-    return demand
+    Every scenario draws its noise from its own numpy Generator, spawned
+    from SeedSequence(seed), so scenario i is the same for a given seed
+    whatever n_scenarios is, and the streams never overlap.
+    """
+    if start is None:
+        start = datetime.now()
+    start = start.replace(minute=0, second=0, microsecond=0)
 
-def generate_price_profile_realistic(demand, base_price=0.12):
-    prices = []
-
-    for d in demand:
-        if d >= 34000:
-            prices.append(0.30)  # Peak
-        elif d >= 30000:
-            prices.append(0.20)  # Mid
-        elif d >= 25000:
-            prices.append(0.15)  # Normal
-        else:
-            prices.append(0.10)  # Off-peak
-
-    return prices
+    noise = np.empty((n_scenarios, hours))
+    for row, child in zip(noise, np.random.SeedSequence(seed).spawn(n_scenarios)):
+        np.random.Generator(np.random.PCG64(child)).standard_normal(out=row)
+    demand = _base_demand(start, hours) + DEMAND_NOISE * noise
+    return demand, _prices(demand)
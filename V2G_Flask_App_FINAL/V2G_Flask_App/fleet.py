@@ -0,0 +1,255 @@
+# fleet.py
+#
+# Joint charging schedule for a depot of EVs behind one grid connection.
+#
+# The site limits (import kW, export kW, and the shared PV output) couple
+# the vehicles together. The problem is split per vehicle: every vehicle is
+# planned on its own by the usual single-EV engine, with hourly shadow
+# prices added to its grid / V2G / PV costs. The prices are raised by
+# subgradient steps wherever the fleet overshoots a limit. Each round is
+# one independent solve per vehicle, run one after another (the DP solves
+# are GIL-bound, so threads would not overlap them), so solve time grows
+# linearly with fleet size. Until the prices clear every limit, a repair
+# pass re-plans the vehicles one by one against the capacity still left;
+# that greedy fill can strand a vehicle, in which case the round simply
+# yields no plan and the next prices are tried. The cheapest plan any round
+# produced, price-cleared or repaired, is the one polished and returned.
+
+import json
+import numpy as np
+
+from optimiser import solve_schedule, summarise_plan
+
+FLEET_SOLVERS = ("dp", "highs")
+
+
+def load_vehicles(vehicles, cars_file="cars.json"):
+    """
+    Vehicle dicts with battery_capacity / max_charge_rate / max_discharge_rate
+    filled in from cars.json for entries that name a "car" model. Each needs
+    deadline_hour, required_energy and initial_soc of its own.
+    """
+    with open(cars_file) as f:
+        cars = json.load(f)
+
+    out = []
+    for i, v in enumerate(vehicles):
+        v = dict(v)
+        if "car" in v:
+            if v["car"] not in cars:
+                raise ValueError(f"Unknown car model: {v['car']}")
+            for key in ("battery_capacity", "max_charge_rate", "max_discharge_rate"):
+                v.setdefault(key, cars[v["car"]][key])
+        v.setdefault("name", f"vehicle_{i}")
+        out.append(v)
+    return out
+
+
+def _limit(value, H):
+    # scalar or per-hour kW limit → H-vector (None = unlimited)
+    if value is None:
+        return np.full(H, np.inf)
+    return np.broadcast_to(np.asarray(value, dtype=float), (H,)).copy()
+
+
+def run_fleet_optimiser(
+    vehicles:                 list[dict],
+    solar_forecast:           list[float],
+    grid_prices:              list[float],
+    grid_demand:              list[float],
+    site_import_kw,
+    site_export_kw                    = None,
+    eco_mode:                 bool    = False,
+    cycle_degradation_cost:   float   = 1.0,    # £ per full (in+out) cycle
+    switch_penalty:           float   = 0.05,   # £ per discharge event
+    v2g_sell_price:           float   = 0.10,   # £/kWh
+    co2_price_per_kg:         float   = 0.0,
+    emission_factor:          float   = 0.233,
+    grid_demand_threshold:    float   = 30000,
+    solver:                   str     = "dp",
+    dp_soc_step:              float   = 0.05,
+    max_iter:                 int     = 10,
+    step_size:                float   = 0.5,
+    polish_passes:            int     = 2,
+    tol:                      float   = 1e-6
+) -> dict:
+    """
+    Co-optimises `vehicles` (see load_vehicles) so that hourly fleet grid
+    charging stays under site_import_kw, V2G export under site_export_kw
+    and solar charging under solar_forecast (the site's shared PV).
+
+    Returns {"vehicles": {name: run_optimiser-style result}, "site_import",
+    "site_export", "site_solar", "shadow_prices", "net_cost", "iterations",
+    "converged", "plan_round", "plan_source"}. converged says whether the
+    last round's prices cleared every limit; the returned schedule is the
+    cheapest of all rounds' plans, from round plan_round, with plan_source
+    "prices" (the price-cleared solves) or "repair" (the repair pass).
+    Raises RuntimeError if no round converged and every repair failed.
+    """
+    if solver not in FLEET_SOLVERS:
+        raise ValueError(f"Fleet solver must be one of {FLEET_SOLVERS}")
+    if not vehicles:
+        raise ValueError("No vehicles to schedule")
+    names = [v.get("name", f"vehicle_{i}") for i, v in enumerate(vehicles)]
+    if len(set(names)) != len(names):
+        raise ValueError("Vehicle names must be unique")
+    if max_iter < 1:
+        raise ValueError("max_iter must be at least 1")
+
+    H_site = max(min(v["deadline_hour"], len(solar_forecast)) for v in vehicles)
+    sf  = np.asarray(solar_forecast[:H_site], dtype=float)
+    gp  = np.asarray(grid_prices[:H_site], dtype=float)
+    gd  = np.asarray(grid_demand[:H_site], dtype=float)
+    caps = {
+        "pv":   sf.copy(),
+        "grid": _limit(site_import_kw, H_site),
+        "dis":  _limit(site_export_kw, H_site),
+    }
+
+    co2_cost_per_kwh = co2_price_per_kg * emission_factor
+
+    def params(v, pv_cap=None, grid_cap=None, dis_cap=None):
+        # per-vehicle run_optimiser params; the *_cap vectors (repair pass)
+        # clip the vehicle's PV share and rates to the site capacity left
+        H        = min(v["deadline_hour"], H_site)
+        cap      = v.get("battery_capacity", 75.0)
+        pv       = sf[:H] if pv_cap is None else np.minimum(sf[:H], pv_cap[:H])
+        charge   = v.get("max_charge_rate", 11.0)
+        dischg   = v.get("max_discharge_rate", 11.0)
+        if grid_cap is not None:
+            charge = np.minimum(charge, grid_cap[:H])
+        if dis_cap is not None:
+            dischg = np.minimum(dischg, dis_cap[:H])
+        return (
+            list(pv), list(gp[:H]), list(gd[:H]),
+            v["required_energy"], cap, charge, dischg,
+            v["initial_soc"], switch_penalty, v2g_sell_price,
+            cycle_degradation_cost / (2 * cap), co2_cost_per_kwh, grid_demand_threshold,
+        )
+
+    def solve(i, lam, **site_caps):
+        v = vehicles[i]
+        H = min(v["deadline_hour"], H_site)
+        try:
+            return solve_schedule(params(v, **site_caps), eco_mode, solver, dp_soc_step=dp_soc_step,
+                                  shadow_prices=(lam["pv"][:H], lam["grid"][:H], lam["dis"][:H]))
+        except RuntimeError as e:
+            where = "under the site limits" if site_caps else "on its own"
+            raise RuntimeError(f"{names[i]} can't be scheduled {where}: {e}") from None
+
+    def vehicle_cost(i, plan):
+        # the MILP objective of one vehicle's plan at the real prices
+        v = vehicles[i]
+        cPV, cG, dG, _ = (np.asarray(x) for x in plan)
+        H    = len(cPV)
+        wear = cycle_degradation_cost / (2 * v.get("battery_capacity", 75.0))
+        grid = gp[:H] + wear + (0.0 if eco_mode else co2_cost_per_kwh)
+        return float(wear * cPV.sum() + grid @ cG + (wear - v2g_sell_price) * dG.sum()
+                     + switch_penalty * np.count_nonzero(dG > tol))
+
+    def fleet_cost(plans):
+        return sum(vehicle_cost(i, p) for i, p in enumerate(plans))
+
+    def totals(plans):
+        use = {k: np.zeros(H_site) for k in caps}
+        for plan in plans:
+            if plan is None:
+                continue
+            cPV, cG, dG, _ = plan
+            use["pv"][:len(cPV)]   += cPV
+            use["grid"][:len(cG)]  += cG
+            use["dis"][:len(dG)]   += dG
+        return use
+
+    def left_for(i, plans, use):
+        # site capacity the rest of the fleet leaves vehicle i
+        left = {k: caps[k].copy() for k in caps}
+        if plans[i] is not None:
+            for k, flow in zip(("pv", "grid", "dis"), plans[i][:3]):
+                left[k][:len(flow)] += flow
+        return {f"{k}_cap": np.maximum(left[k] - use[k], 0.0) for k in caps}
+
+    def repair(lam):
+        # least flexible vehicles first, each limited to whatever site
+        # capacity the ones before it left over
+        def slack(i):
+            v = vehicles[i]
+            H = min(v["deadline_hour"], H_site)
+            return H * v.get("max_charge_rate", 11.0) - abs(v["required_energy"] - v["initial_soc"])
+        plans = [None] * len(vehicles)
+        use   = {k: np.zeros(H_site) for k in caps}
+        for i in sorted(range(len(vehicles)), key=slack):
+            plans[i] = solve(i, lam, **left_for(i, plans, use))
+            use = totals(plans)
+        return plans
+
+    # Subgradient steps are scaled to the price spread and the fleet's total
+    # charge rate, so step_size is "tariff range per fleet-sized overshoot"
+    price_scale = max(float(np.ptp(gp)), v2g_sell_price, 0.01)
+    fleet_kw    = sum(v.get("max_charge_rate", 11.0) for v in vehicles)
+    lam  = {k: np.zeros(H_site) for k in caps}
+    best = None   # (plans, round, source) of the cheapest feasible fleet plan
+
+    converged = False
+    for iteration in range(1, max_iter + 1):
+        plans = [solve(i, lam) for i in range(len(vehicles))]
+        use   = totals(plans)
+        over  = {k: use[k] - caps[k] for k in caps}
+        converged = all(np.all(over[k] <= tol) for k in caps)
+
+        # a round yields a feasible fleet plan if the prices cleared the
+        # limits or the repair pass gets every vehicle in; keep the cheapest
+        candidate, source = plans, "prices"
+        if not converged:
+            source = "repair"
+            try:
+                candidate = repair(lam)
+            except RuntimeError:
+                candidate = None
+        if candidate is not None and (best is None or fleet_cost(candidate) < fleet_cost(best[0])):
+            best = (candidate, iteration, source)
+        if converged:
+            break
+
+        alpha = step_size * price_scale / np.sqrt(iteration)
+        for k in caps:
+            excess = np.where(np.isfinite(caps[k]), over[k], 0.0)
+            lam[k] = np.maximum(lam[k] + alpha * excess / fleet_kw, 0.0)
+
+    if best is None:
+        raise RuntimeError(f"No feasible fleet schedule found in {max_iter} rounds: the prices "
+                           f"never cleared the site limits and every repair pass stranded a vehicle")
+
+    # Polish: Gauss-Seidel passes at the real prices, each vehicle re-planned
+    # against the capacity the rest of the fleet leaves it. A vehicle's
+    # current plan is always still feasible, so the fleet cost never rises.
+    plans, plan_round, plan_source = best
+    use   = totals(plans)
+    zero  = {k: np.zeros(H_site) for k in caps}
+    for _ in range(polish_passes):
+        before = fleet_cost(plans)
+        for i in range(len(vehicles)):
+            plan = solve(i, zero, **left_for(i, plans, use))
+            if vehicle_cost(i, plan) < vehicle_cost(i, plans[i]) - tol:
+                plans[i] = plan
+                use = totals(plans)
+        if before - fleet_cost(plans) <= tol:
+            break
+
+    results = {}
+    for name, (cPV, cG, dG, E) in zip(names, plans):
+        H = len(cPV)
+        results[name] = summarise_plan(cPV, cG, dG, E, list(gp[:H]), v2g_sell_price, emission_factor)
+
+    return {
+        "vehicles":      results,
+        "site_import":   use["grid"].tolist(),
+        "site_export":   use["dis"].tolist(),
+        "site_solar":    use["pv"].tolist(),
+        "shadow_prices": {k: lam[k].tolist() for k in caps},
+        "net_cost":      sum(r["net_cost"] for r in results.values()),
+        "iterations":    iteration,
+        "converged":     converged,
+        "plan_round":    plan_round,
+        "plan_source":   plan_source,
+    }
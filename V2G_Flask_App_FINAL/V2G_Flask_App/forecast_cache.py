@@ -0,0 +1,196 @@
+# forecast_cache.py
+#
+# Shared cache of solar forecasts. /planner, /download and the dashboard all
+# ask for the same (site, hour, horizon, model) forecast many times within an
+# hour, so the weather fetch + CNN run is done once and reused until the next
+# hour boundary. Optionally mirrored to disk so restarts and other worker
+# processes can reuse it too. Concurrent misses on one key wait for a single
+# computation instead of each running their own.
+
+import os
+import pickle
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+
+
+def forecast_key(latitude, longitude, issue_time, horizon, model_name,
+                 backend="keras", scaler_paths=()):
+    """
+    (lat, lon, issue hour, horizon, model, backend, scalers) with the hour
+    normalised to UTC.
+    """
+    if issue_time.tzinfo is None:
+        issue_time = issue_time.replace(tzinfo=timezone.utc)
+    issue_hour = issue_time.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return (
+        round(float(latitude), 4),
+        round(float(longitude), 4),
+        issue_hour.isoformat(),
+        int(horizon),
+        os.path.basename(model_name),
+        backend,
+        tuple(os.path.abspath(p) for p in scaler_paths),
+    )
+
+
+def _next_hour_boundary(now):
+    return (int(now) // 3600 + 1) * 3600
+
+
+class TTLCache:
+    """
+    General-purpose in-memory LRU with per-entry expiry and an optional
+    on-disk tier (one pickle per key). By default entries expire at the end
+    of the wall-clock hour they were stored in; expires(now) → expiry
+    timestamp overrides that, and put() can also be given an entry's own
+    expires_at. Used for forecasts here, and for plans and MPC sessions.
+    """
+
+    def __init__(self, maxsize=64, disk_dir=None, expires=_next_hour_boundary):
+        self.maxsize  = maxsize
+        self.disk_dir = disk_dir
+        self.expires  = expires
+        self._entries = OrderedDict()   # key → (expires_at, value)
+        self._lock    = threading.Lock()
+        self._flights = {}              # key → lock held while it is computed
+        self.hits = self.misses = self.disk_hits = 0
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.pkl")
+
+    def _load_disk(self, key, now):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                expires_at, stored_key, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if stored_key != key or expires_at <= now:
+            return None
+        return expires_at, value
+
+    def _store_disk(self, key, expires_at, value):
+        if not self.disk_dir:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        # unique temp file per writer, then an atomic rename
+        with tempfile.NamedTemporaryFile(dir=self.disk_dir, suffix=".tmp", delete=False) as f:
+            tmp = f.name
+            try:
+                pickle.dump((expires_at, key, value), f)
+            except BaseException:
+                f.close()
+                os.remove(tmp)
+                raise
+        os.replace(tmp, self._disk_path(key))
+
+    def get(self, key, default=None):
+        return self._get(key, default, count=True)
+
+    def _get(self, key, default, count):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += count
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+
+        entry = self._load_disk(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += count
+                return default
+            self.hits += count
+            self.disk_hits += count
+            self._insert(key, *entry)
+        return entry[1]
+
+    def _insert(self, key, expires_at, value):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def put(self, key, value, expires_at=None):
+        if expires_at is None:
+            expires_at = self.expires(time.time())
+        with self._lock:
+            self._insert(key, expires_at, value)
+        self._store_disk(key, expires_at, value)
+        return value
+
+    def get_or_compute(self, key, compute):
+        """
+        Cached value for key, else compute() stored under it. Concurrent
+        misses on the same key run compute() once; the rest wait for it.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is not sentinel:
+            return value
+
+        with self._lock:
+            flight = self._flights.setdefault(key, threading.Lock())
+        try:
+            with flight:
+                # re-checked (uncounted) in case another thread just stored it
+                value = self._get(key, sentinel, count=False)
+                if value is sentinel:
+                    value = self.put(key, compute())
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+        return value
+
+    def discard(self, key):
+        """Drops key from memory (the disk tier is left to expire)."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits":      self.hits,
+                "misses":    self.misses,
+                "disk_hits": self.disk_hits,
+                "size":      len(self._entries),
+                "maxsize":   self.maxsize,
+            }
+
+
+# the name the forecast cache was introduced under
+ForecastCache = TTLCache
+
+
+_CACHE = None
+
+
+def get_forecast_cache(settings=None):
+    """
+    Process-wide cache. The disk tier is enabled by setting
+    "forecast_cache_dir" in settings.json.
+    """
+    global _CACHE
+    if _CACHE is None:
+        settings = settings or {}
+        _CACHE = TTLCache(
+            maxsize  = settings.get("forecast_cache_size", 64),
+            disk_dir = settings.get("forecast_cache_dir")
+        )
+    return _CACHE
@@ -0,0 +1,151 @@
+# metrics.py
+#
+# Process-wide request instrumentation, served by /metrics in the Prometheus
+# text exposition format. Stage durations (weather fetch, feature
+# engineering, CNN inference, model build, solve, render) are histograms,
+# solver outcomes are counters and the size of the last solve per engine is
+# a gauge. Collectors registered with add_collector are read at scrape time
+# (the forecast / plan cache hit counts come in that way).
+#
+# Standard library only, so every module can import it at the top.
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# seconds; CBC on long horizons can run into the tens of seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    def escape(v):
+        return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms keyed by (name, labels). A metric's
+    type and help text are fixed by the first call that names it.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets     = tuple(buckets)
+        self._lock       = threading.Lock()
+        self._meta       = {}   # name → (type, help)
+        self._values     = {}   # (name, labels) → float (counters, gauges)
+        self._histograms = {}   # (name, labels) → [bucket counts, sum, count]
+        self._collectors = []
+
+    def _declare(self, name, kind, help):
+        known = self._meta.setdefault(name, (kind, help))
+        if known[0] != kind:
+            raise ValueError(f"{name} is already a {known[0]}")
+
+    def inc(self, name, amount=1.0, help="", **labels):
+        with self._lock:
+            self._declare(name, "counter", help)
+            key = (name, _label_key(labels))
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set(self, name, value, help="", **labels):
+        with self._lock:
+            self._declare(name, "gauge", help)
+            self._values[(name, _label_key(labels))] = float(value)
+
+    def observe(self, name, value, help="", **labels):
+        with self._lock:
+            self._declare(name, "histogram", help)
+            key  = (name, _label_key(labels))
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        """Observes the block's wall time in v2g_stage_seconds{stage=...}."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("v2g_stage_seconds", time.perf_counter() - t0,
+                         help="Wall time per request stage.", stage=stage, **labels)
+
+    def add_collector(self, collect):
+        """
+        collect() → iterable of (name, type, help, labels dict, value),
+        called on every render().
+        """
+        with self._lock:
+            if collect not in self._collectors:
+                self._collectors.append(collect)
+
+    def render(self):
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            meta       = dict(self._meta)
+            values     = dict(self._values)
+            histograms = {k: (list(h[0]), h[1], h[2]) for k, h in self._histograms.items()}
+            collectors = list(self._collectors)
+
+        for collect in collectors:
+            for name, kind, help, labels, value in collect():
+                meta.setdefault(name, (kind, help))
+                values[(name, _label_key(labels))] = float(value)
+
+        samples = {}
+        for (name, labels), value in values.items():
+            samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for (name, labels), (counts, total, count) in histograms.items():
+            lines = samples.setdefault(name, [])
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts + [count - sum(counts)]):
+                running += n
+                le = labels + (("le", _format_value(bound)),)
+                lines.append(f"{name}_bucket{_format_labels(le)} {running}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        out = []
+        for name in sorted(samples):
+            kind, help = meta[name]
+            if help:
+                out.append(f"# HELP {name} {help}")
+            out.append(f"# TYPE {name} {kind}")
+            out.extend(sorted(samples[name]) if kind != "histogram" else samples[name])
+        return "\n".join(out) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._meta.clear()
+            self._values.clear()
+            self._histograms.clear()
+
+
+METRICS = Metrics()
+
+# module-level shortcuts onto the process-wide registry
+inc           = METRICS.inc
+set_gauge     = METRICS.set
+observe       = METRICS.observe
+timed         = METRICS.timed
+add_collector = METRICS.add_collector
+render        = METRICS.render
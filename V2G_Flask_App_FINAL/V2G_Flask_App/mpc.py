@@ -0,0 +1,180 @@
+# mpc.py
+#
+# Rolling-horizon (model predictive control) re-planning. A plan from
+# /planner is solved once, so it goes stale as the forecasts and the real
+# SoC drift. Here the plan is re-solved every hour from the measured SoC,
+# over a window that slides forward one hour at a time up to the fixed
+# deadline. Only the first hour of each plan is acted on.
+#
+# Each re-solve is kept cheap in two ways:
+#   - Long horizons are solved as a fine hourly window (fine_hours) plus a
+#     coarse tail of coarse_block-hour periods. Each period gets the block's
+#     total PV, mean price and rate × hours, so a week-long horizon has
+#     about fine_hours + 36 periods instead of 168.
+#   - The previous plan, shifted to the new start, is the warm start (a CBC
+#     MIP start), and the cached model template for the period count is
+#     reused.
+
+import math
+from datetime import datetime, timedelta, timezone
+
+from optimiser import solve_schedule, summarise_plan
+from weather_client import utc_now
+
+
+def _blocks(hours, fine_hours, coarse_block):
+    # hours per period: fine_hours single hours, then coarse_block-sized
+    # blocks (the last one possibly shorter)
+    lengths = [1] * min(hours, fine_hours)
+    tail    = hours - len(lengths)
+    while tail > 0:
+        lengths.append(min(coarse_block, tail))
+        tail -= lengths[-1]
+    return lengths
+
+
+def coarsen(solar, prices, demand, lengths, threshold):
+    """
+    Period-level (solar, prices, demand, charge_hours, discharge_hours) for
+    hourly inputs split into `lengths`. discharge_hours counts the hours in
+    each period where V2G is allowed (demand ≥ threshold).
+    """
+    out = ([], [], [], [], [])
+    start = 0
+    for n in lengths:
+        sl = slice(start, start + n)
+        v2g_hours = sum(d >= threshold for d in demand[sl])
+        out[0].append(sum(solar[sl]))
+        out[1].append(sum(prices[sl]) / n)
+        out[2].append(max(demand[sl]))
+        out[3].append(n)
+        out[4].append(v2g_hours)
+        start += n
+    return out
+
+
+def expand(plan, lengths):
+    """An hourly (cPV, cG, dG, E) from a period-level one, flows spread evenly."""
+    cPV, cG, dG, E = plan
+    hourly = ([], [], [], [E[0]])
+    for p, n in enumerate(lengths):
+        for _ in range(n):
+            hourly[0].append(cPV[p] / n)
+            hourly[1].append(cG[p] / n)
+            hourly[2].append(dG[p] / n)
+            hourly[3].append(hourly[3][-1] + (cPV[p] + cG[p] - dG[p]) / n)
+    return hourly
+
+
+def _aggregate(hourly, lengths):
+    # hourly (cPV, cG, dG, E) → period-level, for the warm start
+    cPV, cG, dG, E = hourly
+    out = ([], [], [], [E[0]])
+    start = 0
+    for n in lengths:
+        sl = slice(start, start + n)
+        out[0].append(sum(cPV[sl]))
+        out[1].append(sum(cG[sl]))
+        out[2].append(sum(dG[sl]))
+        start += n
+        out[3].append(E[min(start, len(E) - 1)])
+    return out
+
+
+def _hour_ceil(t):
+    t = t.astimezone(timezone.utc)
+    top = t.replace(minute=0, second=0, microsecond=0)
+    return top if top == t else top + timedelta(hours=1)
+
+
+class RollingHorizonPlanner:
+    """
+    One charging session re-planned hourly up to deadline_utc.
+
+    inputs(start_utc, hours) must return hourly (solar_forecast,
+    grid_prices, grid_demand) lists for the window, e.g. a fresh CNN
+    forecast built on WeatherFetcher.get_hist_and_future plus the tariff.
+    optimiser_kwargs are the run_optimiser battery / cost parameters
+    (battery_capacity, max_charge_rate, v2g_sell_price, ...). In eco mode
+    required_energy is ignored: the session returns to its first SoC.
+    """
+
+    def __init__(self, deadline_utc, required_energy, inputs, eco_mode=False,
+                 fine_hours=24, coarse_block=4, solver="cbc", **optimiser_kwargs):
+        self.deadline_utc    = deadline_utc.astimezone(timezone.utc)
+        self.required_energy = required_energy
+        self.inputs          = inputs
+        self.eco_mode        = eco_mode
+        self.fine_hours      = fine_hours
+        self.coarse_block    = coarse_block
+        self.solver          = solver
+        self.kwargs          = optimiser_kwargs
+        self.history         = []     # (start_utc, measured_soc, first-hour action)
+        self._last           = None   # (start_utc, hourly (cPV, cG, dG, E))
+
+    def _params(self, solar, prices, demand, lengths, soc):
+        kw        = self.kwargs
+        capacity  = kw.get("battery_capacity", 75.0)
+        threshold = kw.get("grid_demand_threshold", 30000)
+        sf, gp, gd, charge_hours, v2g_hours = coarsen(solar, prices, demand, lengths, threshold)
+        # Eco mode has to end back at the SoC the session *started* with,
+        # not the latest measurement, so it is posed as a cost-mode plan
+        # with that target and no grid charging (the same MILP otherwise)
+        charge_rate = 0.0 if self.eco_mode else kw.get("max_charge_rate", 11.0)
+        return (
+            sf, gp, gd, self.required_energy, capacity,
+            [charge_rate * n for n in charge_hours],
+            [kw.get("max_discharge_rate", 11.0) * n for n in v2g_hours],
+            soc,
+            kw.get("switch_penalty", 0.05),
+            kw.get("v2g_sell_price", 0.10),
+            kw.get("cycle_degradation_cost", 1.0) / (2 * capacity),
+            kw.get("co2_price_per_kg", 0.0) * kw.get("emission_factor", 0.233),
+            threshold,
+        )
+
+    def step(self, measured_soc, now_utc=None):
+        """
+        Re-plans from measured_soc at the start of the current (or next)
+        hour. Returns {"start_utc", "hours", "periods", "action", "plan"}
+        where action is the first hour's flows to apply and plan the full
+        hourly run_optimiser-style result. Raises ValueError once the
+        deadline has passed.
+        """
+        now   = now_utc or utc_now()
+        start = _hour_ceil(now)
+        hours = math.ceil((self.deadline_utc - start) / timedelta(hours=1))
+        if hours <= 0:
+            raise ValueError("The session deadline has passed")
+
+        solar, prices, demand = self.inputs(start, hours)
+        solar, prices, demand = list(solar[:hours]), list(prices[:hours]), list(demand[:hours])
+        hours   = len(solar)
+        lengths = _blocks(hours, self.fine_hours, self.coarse_block)
+        if self.eco_mode and not self.history:
+            self.required_energy = measured_soc
+        params  = self._params(solar, prices, demand, lengths, measured_soc)
+
+        warm = None
+        if self._last is not None:
+            last_start, last = self._last
+            shift = round((start - last_start) / timedelta(hours=1))
+            if 0 < shift < len(last[0]):
+                tail = (last[0][shift:], last[1][shift:], last[2][shift:], last[3][shift:])
+                if len(tail[0]) == hours:
+                    warm = _aggregate(tail, lengths)
+
+        plan   = solve_schedule(params, False, self.solver, warm_start=warm)
+        hourly = expand(plan, lengths)
+        self._last = (start, hourly)
+
+        result = summarise_plan(*hourly, prices, self.kwargs.get("v2g_sell_price", 0.10),
+                                self.kwargs.get("emission_factor", 0.233))
+        action = {
+            "solar_charging":   hourly[0][0],
+            "grid_charging":    hourly[1][0],
+            "grid_discharging": hourly[2][0],
+        }
+        self.history.append((start, measured_soc, action))
+        return {"start_utc": start, "hours": hours, "periods": len(lengths),
+                "action": action, "plan": result}
@@ -0,0 +1,105 @@
+# numpy_cnn.py
+#
+# Pure-NumPy forward pass for the shipped Keras .h5 forecaster, so inference
+# workers never have to import TensorFlow. Weights are read straight out of
+# the HDF5 file; only the layer types the solar CNN uses are supported.
+
+import json
+import h5py
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+_ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu":   lambda x: np.maximum(x, 0),
+}
+
+# Layers that are the identity at inference time
+_PASSTHROUGH = {"InputLayer", "Dropout"}
+
+
+def _activation(name):
+    if name not in _ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return _ACTIVATIONS[name]
+
+
+def _conv1d(x, kernel, bias, cfg):
+    # x: (N, L, C_in), kernel: (k, C_in, C_out), channels_last
+    k        = kernel.shape[0]
+    stride   = cfg["strides"][0]
+    dilation = cfg["dilation_rate"][0]
+    span     = (k - 1) * dilation + 1
+
+    if cfg["padding"] == "same":
+        L     = x.shape[1]
+        L_out = -(-L // stride)
+        total = max((L_out - 1) * stride + span - L, 0)
+        x = np.pad(x, ((0, 0), (total // 2, total - total // 2), (0, 0)))
+    elif cfg["padding"] != "valid":
+        raise ValueError(f"Unsupported Conv1D padding: {cfg['padding']}")
+
+    # (N, L_out, C_in, span) → keep every dilation-th tap → (N, L_out, C_in, k)
+    win = sliding_window_view(x, span, axis=1)[:, ::stride, :, ::dilation]
+    N, L_out, C_in, _ = win.shape
+    cols = win.reshape(N * L_out, C_in * k)
+    w    = kernel.transpose(1, 0, 2).reshape(C_in * k, -1)
+    return (cols @ w + bias).reshape(N, L_out, -1)
+
+
+class NumpyCNN:
+    """
+    Drop-in stand-in for a loaded Keras model: calling it (or .predict) on a
+    (N, seq_length, features) array returns the (N, units) output.
+    """
+
+    def __init__(self, model_path):
+        with h5py.File(model_path, "r") as f:
+            config  = json.loads(f.attrs["model_config"])
+            weights = f["model_weights"] if "model_weights" in f else f
+            layers  = config["config"]["layers"]
+
+            self.layers = []
+            prev = None
+            for layer in layers:
+                cls, cfg, name = layer["class_name"], layer["config"], layer["config"]["name"]
+
+                # Only plain chains are supported: each layer feeds the next
+                inbound = layer.get("inbound_nodes") or []
+                if prev is not None and config["class_name"] == "Functional":
+                    if len(inbound) != 1 or len(inbound[0]) != 1 or inbound[0][0][0] != prev:
+                        raise ValueError(f"Layer {name} is not part of a simple chain")
+                prev = name
+
+                if cls in _PASSTHROUGH:
+                    continue
+                if cls == "Flatten":
+                    self.layers.append((cls, None, None, cfg))
+                    continue
+                if cls not in ("Conv1D", "Dense"):
+                    raise ValueError(f"Unsupported layer type: {cls}")
+
+                group  = weights[name]
+                params = {
+                    n.decode() if isinstance(n, bytes) else n: np.asarray(group[n], dtype=np.float32)
+                    for n in group.attrs["weight_names"]
+                }
+                kernel = next(v for n, v in params.items() if n.endswith("kernel:0"))
+                bias   = next((v for n, v in params.items() if n.endswith("bias:0")), None)
+                if bias is None:
+                    bias = np.zeros(kernel.shape[-1], dtype=np.float32)
+                self.layers.append((cls, kernel, bias, cfg))
+
+    def __call__(self, x, training=False):
+        x = np.asarray(x, dtype=np.float32)
+        for cls, kernel, bias, cfg in self.layers:
+            if cls == "Flatten":
+                x = x.reshape(x.shape[0], -1)
+            elif cls == "Conv1D":
+                x = _activation(cfg["activation"])(_conv1d(x, kernel, bias, cfg))
+            else:
+                x = _activation(cfg["activation"])(x @ kernel + bias)
+        return x
+
+    def predict(self, x, verbose=0):
+        return self(x)
@@ -1,181 +1,680 @@
-# optimiser.py
-import pulp
-from pulp import (
-    LpProblem, LpMinimize, LpVariable, LpBinary,
-    lpSum, PULP_CBC_CMD
-)
-
-def run_optimiser(
-    solar_forecast:           list[float],
-    grid_prices:              list[float],
-    grid_demand:              list[float],
-    deadline_hour:            int,
-    required_energy:          float,
-    eco_mode:                 bool    = False,
-    cycle_degradation_cost:   float   = 1.0,    # £ per full (in+out) cycle
-    battery_capacity:         float   = 75.0,   # kWh
-    max_charge_rate:          float   = 11.0,   # kW
-    max_discharge_rate:       float   = 11.0,   # kW
-    initial_soc:              float   = 37.5,   # kWh
-    switch_penalty:           float   = 0.05,   # £ per discharge event
-    v2g_sell_price:           float   = 0.10,   # £/kWh
-    co2_price_per_kg:         float   = 0.0,    # £ you’ll pay per kg CO₂
-    emission_factor:          float   = 0.233,  # kg CO₂ per kWh grid draw
-    grid_demand_threshold:    float   = 30000
-) -> dict:
-    """
-    Modes:
-      - eco_mode=False → cost-minimisation as before.
-      - eco_mode=True  → solar-only V2G-arbitrage, end at initial_soc.
-    """
-
-    # Horizon
-    H = min(deadline_hour, len(solar_forecast))
-    sf, gp, gd = solar_forecast[:H], grid_prices[:H], grid_demand[:H]
-
-    # DEBUG: dump all inputs
-    print("Optimiser inputs (first H hours):")
-    print("Hour |   PV[kW] | Price[£/kWh] | Demand[kW]")
-    for h in range(H):
-        print(f"{h:02d}   | {sf[h]:7.2f}  |    {gp[h]:6.2f}    |  {gd[h]:7.2f}")
-    print("────────────────────────────────────────────────────────")
-
-    # Unit wear & CO₂ costs
-    wear_cost       = cycle_degradation_cost / (2 * battery_capacity)
-    co2_cost_per_kwh= co2_price_per_kg * emission_factor
-
-    # Build LP
-    model = LpProblem("EV_Optimisation", LpMinimize)
-
-    # Variables
-    cPV = [LpVariable(f"cPV_{h}", 0, sf[h])             for h in range(H)]
-    cG  = [LpVariable(f"cG_{h}",  0, max_charge_rate)   for h in range(H)]
-    dG  = [LpVariable(f"dG_{h}",  0, max_discharge_rate)for h in range(H)]
-    yPV = [LpVariable(f"yPV_{h}", cat=LpBinary)         for h in range(H)]
-    yG  = [LpVariable(f"yG_{h}",  cat=LpBinary)         for h in range(H)]
-    yD  = [LpVariable(f"yD_{h}",  cat=LpBinary)         for h in range(H)]
-    E   = [LpVariable(f"E_{h}",   0, battery_capacity)  for h in range(H+1)]
-
-    # 1) Initial SoC
-    model += E[0] == initial_soc
-
-    # 2) Hourly constraints
-    for h in range(H):
-        # balance
-        model += E[h+1] == E[h] + cPV[h] + cG[h] - dG[h]
-        # link flows ↔ binaries
-        model += cPV[h] <= sf[h] * yPV[h]
-        model += cG[h]  <= max_charge_rate * yG[h]
-        model += dG[h]  <= max_discharge_rate * yD[h]
-        # exactly one action
-        model += yPV[h] + yG[h] + yD[h] == 1
-        # V2G gating
-        if gd[h] < grid_demand_threshold:
-            model += yD[h] == 0
-        # only discharge if SoC enough
-        model += E[h] >= (required_energy if not eco_mode else initial_soc) * yD[h]
-
-    # 3) Final SoC
-    if eco_mode:
-        # end at starting SoC to complete a full solar→V2G cycle
-        model += E[H] == initial_soc, "EcoFinalSoC"
-        # forbid any grid charging
-        for h in range(H):
-            model += yG[h] == 0
-    else:
-        # hit your required energy
-        model += E[H] == required_energy, "FinalSoC"
-
-    # 4) Build per-hour cost vs profit terms
-    cost_terms = []
-    for h in range(H):
-        # cost to pay
-        cost = (
-            gp[h]*cG[h]
-          - v2g_sell_price*dG[h]
-          + wear_cost*(cPV[h] + cG[h] + dG[h])
-          + switch_penalty*yD[h]
-          + co2_cost_per_kwh*cG[h]
-        )
-        cost_terms.append(cost)
-
-    profit_terms = []
-    for h in range(H):
-        # profit from V2G arbitrage (ignores CO₂ cost)
-        prof = (
-            v2g_sell_price*dG[h]
-          - gp[h]*cG[h]
-          - wear_cost*(cPV[h] + cG[h] + dG[h])
-          - switch_penalty*yD[h]
-        )
-        profit_terms.append(prof)
-
-    # 5) Objective
-    if eco_mode:
-        # maximise profit = minimise -profit_terms
-        model += -lpSum(profit_terms), "EcoProfitObjective"
-    else:
-        # minimise full cost
-        model += lpSum(cost_terms), "CostObjective"
-
-    # Solve
-    status = model.solve(PULP_CBC_CMD(msg=False))
-    if pulp.LpStatus[status] != 'Optimal':
-        raise RuntimeError(f"Solver failed ({pulp.LpStatus[status]})")
-
-    # Extract
-    solar_charging   = [v.value() for v in cPV] + [0.0]
-    grid_charging    = [v.value() for v in cG]  + [0.0]
-    grid_discharging = [v.value() for v in dG]  + [0.0]
-    battery_soc      = [v.value() for v in E]
-
-    # Summaries
-    net_cost       = sum(grid_charging[h]*gp[h] - grid_discharging[h]*v2g_sell_price
-                         for h in range(H))
-    co2_emitted    = sum(grid_charging[h]*emission_factor for h in range(H))
-    co2_avoided    = sum(solar_charging[:-1])*emission_factor
-
-    # … after computing net_cost, co2_emitted, co2_avoided …
-
-    # DEBUG: dump the optimiser’s outputs
-    print(">>> Optimiser outputs:")
-    print(" solar_charging:   ", [f"{x:.2f}" for x in solar_charging])
-    print(" grid_charging:    ", [f"{x:.2f}" for x in grid_charging])
-    print(" grid_discharging: ", [f"{x:.2f}" for x in grid_discharging])
-    print(" battery_soc:      ", [f"{x:.2f}" for x in battery_soc])
-    print(" net_cost:         ", f"{net_cost:.2f}")
-    print(" co2_emitted_kg:   ", f"{co2_emitted:.2f}")
-    print(" co2_avoided_kg:   ", f"{co2_avoided:.2f}")
-    print(" filled_by_deadline:", f"{battery_soc[H]:.2f}")
-    print("────────────────────────────────────────────────────────")
-
-    return {
-        'solar_charging': solar_charging,
-        'grid_charging': grid_charging,
-        'grid_discharging': grid_discharging,
-        'battery_soc': battery_soc,
-        'net_cost': net_cost,
-        'co2_emitted_kg': co2_emitted,
-        'co2_avoided_kg': co2_avoided,
-        'filled_by_deadline': battery_soc[H]
-    }
-
-
-def compute_baseline_cost(grid_prices, required_energy, max_charge_rate):
-    hours_prices = sorted(
-        [(grid_prices[h], h) for h in range(len(grid_prices))],
-        key=lambda x: x[0]
-    )
-    remaining   = required_energy
-    cost        = 0.0
-    charge_plan = [0.0] * len(grid_prices)
-
-    for price, h in hours_prices:
-        charge = min(max_charge_rate, remaining)
-        charge_plan[h] = charge
-        cost += charge * price
-        remaining -= charge
-        if remaining <= 1e-6:
-            break
-
-    return cost, charge_plan
+# optimiser.py
+#
+# PuLP is imported lazily so that modules which only need
+# compute_baseline_cost (utils → every page) don't pay for it.
+#
+# milp_arrays, the DP steps (dp_grid, dp_actions, dp_backward, dp_forward)
+# and record_problem_size are public: stochastic.py and benchmark.py build
+# their own formulations from them.
+
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import inc, set_gauge, timed
+
+log = logging.getLogger(__name__)
+
+
+class _LpTemplate:
+    """
+    The EV MILP for one (horizon, eco_mode) structure, built once with named
+    variables and constraints. Everything that changes between requests
+    (PV caps, prices, demand gating, rates, SoC targets) is a bound, a
+    coefficient or a right-hand side, so update() just rewrites those in
+    place instead of rebuilding the whole PuLP model.
+    """
+
+    def __init__(self, H, eco_mode):
+        from pulp import LpProblem, LpMinimize, LpVariable, LpBinary, LpAffineExpression
+
+        self.H        = H
+        self.eco_mode = eco_mode
+        self.lock     = threading.Lock()
+
+        # Build LP (bounds/coefficients are placeholders until update())
+        model = LpProblem("EV_Optimisation", LpMinimize)
+
+        # Variables
+        self.cPV = [LpVariable(f"cPV_{h}", 0, 0)        for h in range(H)]
+        self.cG  = [LpVariable(f"cG_{h}",  0, 0)        for h in range(H)]
+        self.dG  = [LpVariable(f"dG_{h}",  0, 0)        for h in range(H)]
+        self.yPV = [LpVariable(f"yPV_{h}", cat=LpBinary) for h in range(H)]
+        self.yG  = [LpVariable(f"yG_{h}",  cat=LpBinary) for h in range(H)]
+        self.yD  = [LpVariable(f"yD_{h}",  cat=LpBinary) for h in range(H)]
+        self.E   = [LpVariable(f"E_{h}",   0, 0)        for h in range(H+1)]
+        cPV, cG, dG, yPV, yG, yD, E = self.cPV, self.cG, self.dG, self.yPV, self.yG, self.yD, self.E
+
+        # 1) Initial SoC
+        model += E[0] == 0, "InitialSoC"
+
+        # 2) Hourly constraints
+        self.pv_link, self.grid_link, self.dis_link, self.dis_soc = [], [], [], []
+        for h in range(H):
+            # balance
+            model += E[h+1] == E[h] + cPV[h] + cG[h] - dG[h], f"Balance_{h}"
+            # link flows ↔ binaries
+            model += cPV[h] <= 0 * yPV[h], f"PVLink_{h}"
+            model += cG[h]  <= 0 * yG[h],  f"GridLink_{h}"
+            model += dG[h]  <= 0 * yD[h],  f"DischargeLink_{h}"
+            # exactly one action
+            model += yPV[h] + yG[h] + yD[h] == 1, f"OneAction_{h}"
+            # only discharge if SoC enough
+            model += E[h] >= 0 * yD[h], f"DischargeSoC_{h}"
+
+            self.pv_link.append(model.constraints[f"PVLink_{h}"])
+            self.grid_link.append(model.constraints[f"GridLink_{h}"])
+            self.dis_link.append(model.constraints[f"DischargeLink_{h}"])
+            self.dis_soc.append(model.constraints[f"DischargeSoC_{h}"])
+
+        # 3) Final SoC (eco: back to the start SoC, otherwise the required
+        #    energy; either way just the right-hand side changes per solve)
+        model += E[H] == 0, "FinalSoC"
+        if eco_mode:
+            # forbid any grid charging
+            for v in yG:
+                v.upBound = 0
+
+        # 4) Objective; coefficients are filled in by update()
+        model += LpAffineExpression([(v, 0.0) for h in range(H)
+                                     for v in (cPV[h], cG[h], dG[h], yD[h])]), "Objective"
+
+        self.model      = model
+        self.initial    = model.constraints["InitialSoC"]
+        self.final      = model.constraints["FinalSoC"]
+
+    @staticmethod
+    def _set_coef(constraint, var, coef):
+        # PuLP ≥ 3 keeps the expression on .expr; older versions subclass it
+        getattr(constraint, "expr", constraint)[var] = coef
+
+    def update(self, sf, gp, gd, required_energy, battery_capacity, max_charge_rate,
+               max_discharge_rate, initial_soc, switch_penalty, v2g_sell_price,
+               wear_cost, co2_cost_per_kwh, grid_demand_threshold):
+        H = self.H
+        # rates may be scalars or per-hour lists
+        rate_c = max_charge_rate if hasattr(max_charge_rate, "__len__") else [max_charge_rate] * H
+        rate_d = max_discharge_rate if hasattr(max_discharge_rate, "__len__") else [max_discharge_rate] * H
+        for h in range(H):
+            self.cPV[h].upBound = sf[h]
+            self.cG[h].upBound  = rate_c[h]
+            self.dG[h].upBound  = rate_d[h]
+            self._set_coef(self.pv_link[h],   self.yPV[h], -sf[h])
+            self._set_coef(self.grid_link[h], self.yG[h],  -rate_c[h])
+            self._set_coef(self.dis_link[h],  self.yD[h],  -rate_d[h])
+
+            # V2G gating
+            self.yD[h].upBound = 0 if gd[h] < grid_demand_threshold else 1
+            self._set_coef(self.dis_soc[h], self.yD[h],
+                           -(required_energy if not self.eco_mode else initial_soc))
+        for e in self.E:
+            e.upBound = battery_capacity
+
+        self.initial.changeRHS(initial_soc)
+        self.final.changeRHS(initial_soc if self.eco_mode else required_energy)
+
+        # 5) Objective
+        #    cost mode: grid price + wear + CO₂ on grid draw, minus V2G revenue
+        #    eco mode:  -(V2G profit), which ignores the CO₂ cost
+        obj = self.model.objective
+        for h in range(H):
+            grid_coef = gp[h] + wear_cost + (0.0 if self.eco_mode else co2_cost_per_kwh)
+            obj[self.cPV[h]] = wear_cost
+            obj[self.cG[h]]  = grid_coef
+            obj[self.dG[h]]  = -v2g_sell_price + wear_cost
+            obj[self.yD[h]]  = switch_penalty
+
+    def solve(self, warm_start=None):
+        """
+        warm_start = (cPV, cG, dG, E) of a previous plan for the same
+        horizon, passed to CBC as a MIP start (mainly its action pattern;
+        CBC repairs the continuous values).
+        """
+        import pulp
+        if warm_start is not None:
+            def start(var, value):
+                # clipped to the current bounds; the rest is CBC's to repair
+                var.setInitialValue(min(max(value, var.lowBound or 0), var.upBound))
+
+            cPV, cG, dG, E = warm_start
+            for h in range(self.H):
+                action = max(("pv", cPV[h]), ("grid", cG[h]), ("dis", dG[h]), key=lambda a: a[1])[0]
+                start(self.cPV[h], cPV[h])
+                start(self.cG[h],  cG[h])
+                start(self.dG[h],  dG[h])
+                start(self.yPV[h], int(action == "pv"))
+                start(self.yG[h],  int(action == "grid"))
+                start(self.yD[h],  int(action == "dis"))
+            for e, value in zip(self.E, E):
+                start(e, value)
+        status = self.model.solve(pulp.PULP_CBC_CMD(msg=False, warmStart=warm_start is not None))
+        if pulp.LpStatus[status] != 'Optimal':
+            raise RuntimeError(f"Solver failed ({pulp.LpStatus[status]})")
+        return (
+            [v.value() for v in self.cPV],
+            [v.value() for v in self.cG],
+            [v.value() for v in self.dG],
+            [v.value() for v in self.E],
+        )
+
+
+def milp_arrays(sf, gp, gd, required_energy, battery_capacity, max_charge_rate,
+                max_discharge_rate, initial_soc, switch_penalty, v2g_sell_price,
+                wear_cost, co2_cost_per_kwh, grid_demand_threshold, eco_mode,
+                shadow_prices=None):
+    """
+    The same MILP as _LpTemplate as sparse arrays: (c, A, row lower, row
+    upper, var lower, var upper, integrality, (cPV, cG, dG, E) columns).
+    Rates may be per-hour arrays and shadow_prices (see solve_schedule) are
+    added to the per-kWh costs.
+    """
+    import numpy as np
+    from scipy.sparse import coo_matrix
+
+    H  = len(sf)
+    sf = np.asarray(sf, dtype=float)
+    gp = np.asarray(gp, dtype=float)
+    gd = np.asarray(gd, dtype=float)
+    h  = np.arange(H)
+    max_charge_rate    = np.broadcast_to(np.asarray(max_charge_rate, dtype=float), (H,))
+    max_discharge_rate = np.broadcast_to(np.asarray(max_discharge_rate, dtype=float), (H,))
+    pv_shadow, grid_shadow, dis_shadow = shadow_prices if shadow_prices is not None else (0.0, 0.0, 0.0)
+
+    # Column layout: cPV | cG | dG | yPV | yG | yD | E (H+1)
+    cPV, cG, dG, yPV, yG, yD = (k * H + h for k in range(6))
+    E   = 6 * H + np.arange(H + 1)
+    n   = 7 * H + 1
+
+    rows, cols, vals, lo, hi = [], [], [], [], []
+    row = 0
+
+    def add(block_cols, block_vals, lower, upper):
+        # one constraint per hour; block_cols/vals are lists of length-H arrays
+        nonlocal row
+        m = len(lower)
+        for c, v in zip(block_cols, block_vals):
+            rows.append(row + np.arange(m))
+            cols.append(c)
+            vals.append(np.broadcast_to(v, m).astype(float))
+        lo.append(lower)
+        hi.append(upper)
+        row += m
+
+    one, zero = np.ones(H), np.zeros(H)
+    final_soc = initial_soc if eco_mode else required_energy
+    soc_need  = initial_soc if eco_mode else required_energy
+
+    # 1) Initial / final SoC
+    add([E[:1]], [1.0], [initial_soc], [initial_soc])
+    add([E[H:]], [1.0], [final_soc], [final_soc])
+    # 2) balance: E[h+1] - E[h] - cPV - cG + dG == 0
+    add([E[1:], E[:-1], cPV, cG, dG], [1.0, -1.0, -1.0, -1.0, 1.0], zero, zero)
+    # link flows ↔ binaries
+    add([cPV, yPV], [1.0, -sf],                 np.full(H, -np.inf), zero)
+    add([cG,  yG],  [1.0, -max_charge_rate],    np.full(H, -np.inf), zero)
+    add([dG,  yD],  [1.0, -max_discharge_rate], np.full(H, -np.inf), zero)
+    # exactly one action
+    add([yPV, yG, yD], [1.0, 1.0, 1.0], one, one)
+    # only discharge if SoC enough
+    add([E[:-1], yD], [1.0, -soc_need], zero, np.full(H, np.inf))
+
+    A = coo_matrix(
+        (np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(row, n)
+    ).tocsr()
+
+    lb = np.zeros(n)
+    ub = np.empty(n)
+    ub[cPV], ub[cG], ub[dG] = sf, max_charge_rate, max_discharge_rate
+    ub[yPV] = 1.0
+    ub[yG]  = 0.0 if eco_mode else 1.0
+    # V2G gating
+    ub[yD]  = np.where(gd < grid_demand_threshold, 0.0, 1.0)
+    ub[E]   = battery_capacity
+
+    c = np.zeros(n)
+    c[cPV] = wear_cost + pv_shadow
+    c[cG]  = gp + wear_cost + (0.0 if eco_mode else co2_cost_per_kwh) + grid_shadow
+    c[dG]  = -v2g_sell_price + wear_cost + dis_shadow
+    c[yD]  = switch_penalty
+
+    integrality = np.zeros(n)
+    integrality[3 * H:6 * H] = 1
+
+    return c, A, np.concatenate(lo), np.concatenate(hi), lb, ub, integrality, (cPV, cG, dG, E)
+
+
+def _solve_highs(*params, shadow_prices=None):
+    """
+    milp_arrays solved in-process by HiGHS (scipy.optimize.milp): no model
+    objects, no subprocess and no MPS files on disk.
+    """
+    from scipy.optimize import milp, LinearConstraint, Bounds
+
+    with timed("model_build", solver="highs"):
+        c, A, lo, hi, lb, ub, integrality, cols = milp_arrays(*params, shadow_prices=shadow_prices)
+    record_problem_size("highs", variables=A.shape[1], constraints=A.shape[0])
+    with timed("solve", solver="highs"):
+        res = milp(c, constraints=LinearConstraint(A, lo, hi),
+                   integrality=integrality, bounds=Bounds(lb, ub))
+    if res.status != 0:
+        raise RuntimeError(f"Solver failed ({res.message})")
+
+    return tuple(res.x[col].tolist() for col in cols)
+
+
+def _window_min(x, m):
+    """y[i] = min(x[i : i+m+1]), inf past the end; O(len(x)) for any m."""
+    if m <= 0:
+        return x.copy()
+    import numpy as np
+    n, k = len(x), m + 1
+    pad  = -(n + m) % k
+    xp   = np.concatenate([x, np.full(m + pad, np.inf)]).reshape(-1, k)
+    # van Herk / Gil-Werman: suffix minima within each block of k plus
+    # prefix minima within the block where the window ends
+    suffix = np.minimum.accumulate(xp[:, ::-1], axis=1)[:, ::-1].ravel()
+    prefix = np.minimum.accumulate(xp, axis=1).ravel()
+    return np.minimum(suffix[:n], prefix[m:m + n])
+
+
+def dp_grid(initial_soc, final_soc, battery_capacity, soc_step):
+    """
+    The DP's SoC grid: (E, step, i0, iF). E (kWh) is anchored on the
+    initial SoC (index i0) with the step adjusted so the final SoC lands
+    exactly on a grid point (index iF).
+    """
+    import numpy as np
+
+    eps  = 1e-9
+    span = final_soc - initial_soc
+    step = soc_step if abs(span) < eps else abs(span) / max(round(abs(span) / soc_step), 1)
+    k_lo = -int(np.floor(initial_soc / step + eps))
+    k_hi = int(np.floor((battery_capacity - initial_soc) / step + eps))
+    E    = initial_soc + step * np.arange(k_lo, k_hi + 1)
+    i0   = -k_lo
+    iF   = i0 + int(round(span / step))
+    if not 0 <= iF < len(E) or not (0 <= initial_soc <= battery_capacity + eps):
+        raise RuntimeError("Solver failed (Infeasible)")
+    return E, step, i0, iF
+
+
+def dp_actions(E, step, sf, gp, gd, max_charge_rate, max_discharge_rate, soc_need,
+               wear_cost, v2g_sell_price, co2_cost_per_kwh, grid_demand_threshold,
+               eco_mode, shadow_prices=None):
+    """
+    Per hour, the allowed moves as (kind, max grid steps, cost per kWh),
+    plus the mask of grid states V2G may start from.
+    """
+    import numpy as np
+
+    H   = len(sf)
+    eps = 1e-9
+
+    def steps(kwh):
+        return int(np.floor(kwh / step + eps))
+
+    pv_shadow, grid_shadow, dis_shadow = shadow_prices if shadow_prices is not None else (0.0, 0.0, 0.0)
+    c_pv   = np.broadcast_to(wear_cost + np.asarray(pv_shadow, dtype=float), (H,))
+    c_grid = (np.asarray(gp, dtype=float) + wear_cost
+              + (0.0 if eco_mode else co2_cost_per_kwh) + np.asarray(grid_shadow, dtype=float))
+    c_dis  = np.broadcast_to(wear_cost - v2g_sell_price + np.asarray(dis_shadow, dtype=float), (H,))
+    rate_c = np.broadcast_to(np.asarray(max_charge_rate, dtype=float), (H,))
+    rate_d = np.broadcast_to(np.asarray(max_discharge_rate, dtype=float), (H,))
+
+    actions = []
+    for h in range(H):
+        acts = [("pv", steps(sf[h]), c_pv[h])]
+        if not eco_mode:
+            acts.append(("grid", steps(rate_c[h]), c_grid[h]))
+        if gd[h] >= grid_demand_threshold:
+            acts.append(("dis", steps(rate_d[h]), c_dis[h]))
+        actions.append(acts)
+    return actions, E >= soc_need - eps
+
+
+def dp_backward(E, actions, can_discharge, switch_penalty, terminal):
+    """
+    V[h, i] = min cost from SoC E[i] at hour h to the end, where the end
+    state costs terminal[i] (inf = not allowed).
+    """
+    import numpy as np
+
+    H = len(actions)
+    V = np.empty((H + 1, len(E)))
+    V[H] = terminal
+    for h in range(H - 1, -1, -1):
+        W    = V[h + 1]
+        best = W.copy()                                   # idle
+        for kind, m, c in actions[h]:
+            if kind == "dis":
+                # discharge a = E[i] - E[j] for j in [i-m, i]
+                cand = _window_min((W - c * E)[::-1], m)[::-1] + c * E + switch_penalty
+                cand[~can_discharge] = np.inf
+            else:
+                # charge a = E[j] - E[i] for j in [i, i+m]
+                cand = _window_min(W + c * E, m) - c * E
+            np.minimum(best, cand, out=best)
+        V[h] = best
+    return V
+
+
+def dp_forward(E, V, actions, can_discharge, switch_penalty, i0):
+    """Replays the cheapest move from state i0 on: (cPV, cG, dG, E)."""
+    import numpy as np
+
+    H   = len(actions)
+    eps = 1e-9
+    cPV, cG, dG = [0.0] * H, [0.0] * H, [0.0] * H
+    soc_idx = [i0]
+    i = i0
+    for h in range(H):
+        W = V[h + 1]
+        best_cost, best_kind, best_j = W[i], None, i
+        for kind, m, c in actions[h]:
+            if kind == "dis":
+                if not can_discharge[i]:
+                    continue
+                js   = np.arange(max(i - m, 0), i + 1)
+                cost = W[js] + c * (E[i] - E[js]) + switch_penalty
+            else:
+                js   = np.arange(i, min(i + m, len(E) - 1) + 1)
+                cost = W[js] + c * (E[js] - E[i])
+            k = int(np.argmin(cost))
+            if cost[k] < best_cost - eps:
+                best_cost, best_kind, best_j = cost[k], kind, int(js[k])
+        amount = abs(E[best_j] - E[i])
+        if best_kind == "pv":
+            cPV[h] = amount
+        elif best_kind == "grid":
+            cG[h] = amount
+        elif best_kind == "dis":
+            dG[h] = amount
+        i = best_j
+        soc_idx.append(i)
+
+    return cPV, cG, dG, E[soc_idx].tolist()
+
+
+def _solve_dp(sf, gp, gd, required_energy, battery_capacity, max_charge_rate,
+              max_discharge_rate, initial_soc, switch_penalty, v2g_sell_price,
+              wear_cost, co2_cost_per_kwh, grid_demand_threshold, eco_mode,
+              soc_step=0.05, shadow_prices=None):
+    """
+    The same schedule by backward dynamic programming over a SoC grid of
+    ~soc_step kWh. One action per hour and linear costs make each hour's
+    Bellman update three sliding-window minima, so the whole solve is
+    O(H·S) with S = battery_capacity / soc_step. Flows are rounded down to
+    the grid, so every DP plan is feasible for the MILP and its cost is an
+    upper bound on the MILP optimum (see `benchmark.py dp_gap`).
+    """
+    import numpy as np
+
+    final_soc = initial_soc if eco_mode else required_energy
+    E, step, i0, iF = dp_grid(initial_soc, final_soc, battery_capacity, soc_step)
+    record_problem_size("dp", soc_states=len(E))
+
+    actions, can_discharge = dp_actions(
+        E, step, sf, gp, gd, max_charge_rate, max_discharge_rate, final_soc, wear_cost,
+        v2g_sell_price, co2_cost_per_kwh, grid_demand_threshold, eco_mode, shadow_prices)
+
+    terminal     = np.full(len(E), np.inf)
+    terminal[iF] = 0.0
+    V = dp_backward(E, actions, can_discharge, switch_penalty, terminal)
+    if not np.isfinite(V[0, i0]):
+        raise RuntimeError("Solver failed (Infeasible)")
+
+    return dp_forward(E, V, actions, can_discharge, switch_penalty, i0)
+
+
+def _polish_lp(params, eco_mode, plan, shadow_prices=None):
+    """
+    A DP plan's flows re-optimised exactly with its per-period actions
+    fixed. With every binary of milp_arrays fixed the MILP is an LP,
+    which HiGHS solves in milliseconds; this undoes the DP's rounding of
+    flows down to the SoC grid. The DP plan stays feasible, so the result
+    is never worse.
+    """
+    import numpy as np
+    from scipy.optimize import milp, LinearConstraint, Bounds
+
+    c, A, lo, hi, lb, ub, _, cols = milp_arrays(*params, eco_mode, shadow_prices=shadow_prices)
+    H = len(params[0])
+
+    # action per period, 0 = PV (also idle periods) / 1 = grid / 2 = V2G;
+    # the binaries are columns 3H..6H (yPV | yG | yD)
+    action = np.argmax(np.asarray(plan[:3]) > 1e-9, axis=0)
+    y = np.zeros(3 * H)
+    y[action * H + np.arange(H)] = 1.0
+    lb, ub = lb.copy(), ub.copy()
+    lb[3 * H:6 * H] = ub[3 * H:6 * H] = y
+
+    res = milp(c, constraints=LinearConstraint(A, lo, hi), bounds=Bounds(lb, ub))
+    if res.status != 0:
+        return plan
+    return tuple(res.x[col].tolist() for col in cols)
+
+
+SOLVERS = ("cbc", "highs", "dp")
+
+
+def record_problem_size(solver, **dims):
+    for dim, value in dims.items():
+        set_gauge("v2g_problem_size", value, help="Size of the latest solve per engine.",
+                  solver=solver, dim=dim)
+
+
+# Templates keyed by (H, eco_mode); a busy template (another thread mid-
+# solve) is never shared, the caller just builds a throw-away one instead.
+_TEMPLATES      = OrderedDict()
+_TEMPLATES_LOCK = threading.Lock()
+MAX_TEMPLATES   = 32
+
+
+def _acquire_template(H, eco_mode):
+    key = (H, bool(eco_mode))
+    with _TEMPLATES_LOCK:
+        template = _TEMPLATES.get(key)
+        if template is not None:
+            _TEMPLATES.move_to_end(key)
+            if template.lock.acquire(blocking=False):
+                inc("v2g_model_templates_total", help="CBC model templates reused or built.",
+                    outcome="reused")
+                return template
+            return None
+    inc("v2g_model_templates_total", help="CBC model templates reused or built.", outcome="built")
+    template = _LpTemplate(H, eco_mode)
+    template.lock.acquire()
+    with _TEMPLATES_LOCK:
+        if key not in _TEMPLATES:
+            _TEMPLATES[key] = template
+            while len(_TEMPLATES) > MAX_TEMPLATES:
+                _TEMPLATES.popitem(last=False)
+    return template
+
+
+def solve_schedule(params, eco_mode, solver="cbc", reuse_model=True, dp_soc_step=0.05,
+                   shadow_prices=None, warm_start=None, dp_polish=False):
+    """
+    (cPV, cG, dG, E) for a run_optimiser params tuple, without the debug
+    output or summaries. Rates may be per-hour lists. shadow_prices =
+    (pv, grid, discharge) per-hour £/kWh surcharges, used by the fleet
+    coordinator, need solver="highs" or "dp". warm_start (a previous
+    (cPV, cG, dG, E)) is a CBC MIP start; the other engines ignore it.
+    dp_polish re-solves a DP plan's flows exactly (see _polish_lp).
+    """
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver: {solver}")
+    if solver == "cbc" and shadow_prices is not None:
+        raise ValueError("shadow_prices need solver='highs' or 'dp'")
+
+    record_problem_size(solver, hours=len(params[0]))
+    try:
+        if solver == "highs":
+            plan = _solve_highs(*params, eco_mode, shadow_prices=shadow_prices)
+        elif solver == "dp":
+            with timed("solve", solver="dp"):
+                plan = _solve_dp(*params, eco_mode, soc_step=dp_soc_step, shadow_prices=shadow_prices)
+                if dp_polish:
+                    plan = _polish_lp(params, eco_mode, plan, shadow_prices)
+        else:
+            plan = _solve_cbc(params, eco_mode, reuse_model, warm_start)
+    except RuntimeError:
+        inc("v2g_solves_total", help="Schedule solves by engine and outcome.",
+            solver=solver, status="failed")
+        raise
+    inc("v2g_solves_total", help="Schedule solves by engine and outcome.",
+        solver=solver, status="optimal")
+    return plan
+
+
+def _solve_cbc(params, eco_mode, reuse_model, warm_start):
+    H = len(params[0])
+    template = None
+    try:
+        with timed("model_build", solver="cbc"):
+            template = _acquire_template(H, eco_mode) if reuse_model else None
+            if template is None:
+                template = _LpTemplate(H, eco_mode)
+                template.lock.acquire()
+            template.update(*params)
+        record_problem_size("cbc", variables=7 * H + 1, constraints=len(template.model.constraints))
+        with timed("solve", solver="cbc"):
+            return template.solve(warm_start)
+    finally:
+        if template is not None:
+            template.lock.release()
+
+
+def summarise_plan(cPV, cG, dG, E, gp, v2g_sell_price, emission_factor):
+    """The run_optimiser result dict for an H-hour schedule."""
+    H = len(cPV)
+
+    # Extract
+    solar_charging   = list(cPV) + [0.0]
+    grid_charging    = list(cG)  + [0.0]
+    grid_discharging = list(dG)  + [0.0]
+    battery_soc      = list(E)
+
+    # Summaries
+    net_cost       = sum(grid_charging[h]*gp[h] - grid_discharging[h]*v2g_sell_price
+                         for h in range(H))
+    co2_emitted    = sum(grid_charging[h]*emission_factor for h in range(H))
+    co2_avoided    = sum(solar_charging[:-1])*emission_factor
+
+    return {
+        'solar_charging': solar_charging,
+        'grid_charging': grid_charging,
+        'grid_discharging': grid_discharging,
+        'battery_soc': battery_soc,
+        'net_cost': net_cost,
+        'co2_emitted_kg': co2_emitted,
+        'co2_avoided_kg': co2_avoided,
+        'filled_by_deadline': battery_soc[H]
+    }
+
+
+def run_optimiser(
+    solar_forecast:           list[float],
+    grid_prices:              list[float],
+    grid_demand:              list[float],
+    deadline_hour:            int,
+    required_energy:          float,
+    eco_mode:                 bool    = False,
+    cycle_degradation_cost:   float   = 1.0,    # £ per full (in+out) cycle
+    battery_capacity:         float   = 75.0,   # kWh
+    max_charge_rate:          float   = 11.0,   # kW
+    max_discharge_rate:       float   = 11.0,   # kW
+    initial_soc:              float   = 37.5,   # kWh
+    switch_penalty:           float   = 0.05,   # £ per discharge event
+    v2g_sell_price:           float   = 0.10,   # £/kWh
+    co2_price_per_kg:         float   = 0.0,    # £ you’ll pay per kg CO₂
+    emission_factor:          float   = 0.233,  # kg CO₂ per kWh grid draw
+    grid_demand_threshold:    float   = 30000,
+    reuse_model:              bool    = True,
+    solver:                   str     = "cbc",
+    dp_soc_step:              float   = 0.05,   # kWh per hourly slot, SoC grid for solver="dp"
+    dp_polish:                bool    = True,
+    slot_minutes:             int     = 60      # schedule resolution (15 / 30 / 60)
+) -> dict:
+    """
+    Modes:
+      - eco_mode=False → cost-minimisation as before.
+      - eco_mode=True  → solar-only V2G-arbitrage, end at initial_soc.
+
+    solver="cbc" solves through PuLP/CBC; reuse_model=True does that on a
+    cached model template for this horizon and mode, False builds the model
+    from scratch (same result, slower). solver="highs" builds the same MILP
+    as sparse matrices and solves it in-process with HiGHS. solver="dp"
+    skips the MILP entirely for a dynamic program over a dp_soc_step SoC
+    grid: milliseconds even for week-long horizons, at a small optimality
+    gap from rounding flows to the grid, which dp_polish then mostly
+    closes with one LP.
+
+    With slot_minutes < 60 the forecast, prices and demand are per slot
+    (deadline_hour stays in hours) and the flows in the result are kWh per
+    slot. The DP grid shrinks with the slot so it stays as fine relative to
+    the per-slot flows. Only the DP engine solves 96-192 slot plans at
+    interactive speed; the MILP engines take tens of seconds there.
+    """
+    from timeslots import slots_per_hour
+
+    if solver not in SOLVERS:
+        raise ValueError(f"Unknown solver: {solver}")
+
+    # Horizon
+    H = min(deadline_hour * slots_per_hour(slot_minutes), len(solar_forecast))
+    sf, gp, gd = solar_forecast[:H], grid_prices[:H], grid_demand[:H]
+
+    if log.isEnabledFor(logging.DEBUG):
+        rows = "\n".join(f"{h:02d}   | {sf[h]:7.2f}  |    {gp[h]:6.2f}    |  {gd[h]:7.2f}"
+                         for h in range(H))
+        log.debug("Optimiser inputs (first H hours):\n"
+                  "Hour |   PV[kW] | Price[£/kWh] | Demand[kW]\n%s", rows)
+
+    # Unit wear & CO₂ costs
+    wear_cost       = cycle_degradation_cost / (2 * battery_capacity)
+    co2_cost_per_kwh= co2_price_per_kg * emission_factor
+
+    # The engines plan kWh per period: kW × slot length. The switch penalty
+    # is charged per discharging period, so it is scaled the same way to
+    # keep an hour of V2G costing the same at any resolution.
+    dt = slot_minutes / 60
+    params = (
+        [x * dt for x in sf] if dt != 1 else sf, gp, gd, required_energy, battery_capacity,
+        max_charge_rate * dt, max_discharge_rate * dt, initial_soc, switch_penalty * dt,
+        v2g_sell_price, wear_cost, co2_cost_per_kwh, grid_demand_threshold
+    )
+
+    cPV, cG, dG, E = solve_schedule(params, eco_mode, solver, reuse_model, dp_soc_step * dt,
+                                    dp_polish=dp_polish)
+    result = summarise_plan(cPV, cG, dG, E, gp, v2g_sell_price, emission_factor)
+
+    if log.isEnabledFor(logging.DEBUG):
+        series = "\n".join(f" {k + ':':<18} {[f'{x:.2f}' for x in result[k]]}"
+                           for k in ("solar_charging", "grid_charging", "grid_discharging", "battery_soc"))
+        totals = "\n".join(f" {k + ':':<18} {result[k]:.2f}"
+                           for k in ("net_cost", "co2_emitted_kg", "co2_avoided_kg", "filled_by_deadline"))
+        log.debug("Optimiser outputs:\n%s\n%s", series, totals)
+
+    return result
+
+
+def compute_baseline_cost(grid_prices, required_energy, max_charge_rate):
+    hours_prices = sorted(
+        [(grid_prices[h], h) for h in range(len(grid_prices))],
+        key=lambda x: x[0]
+    )
+    remaining   = required_energy
+    cost        = 0.0
+    charge_plan = [0.0] * len(grid_prices)
+
+    for price, h in hours_prices:
+        charge = min(max_charge_rate, remaining)
+        charge_plan[h] = charge
+        cost += charge * price
+        remaining -= charge
+        if remaining <= 1e-6:
+            break
+
+    return cost, charge_plan
@@ -0,0 +1,59 @@
+# plan_cache.py
+#
+# Content-addressed cache of run_optimiser results. The key is a hash of
+# every input (forecast, prices, demand, vehicle and cost parameters), so an
+# entry never goes stale and /download can hand back the plan /planner just
+# showed without re-fetching weather, rerunning the CNN or re-solving.
+
+import json
+import math
+import hashlib
+
+from forecast_cache import TTLCache
+
+
+def _canonical(value):
+    # JSON-able form that hashes the same for equal inputs: numpy arrays and
+    # tuples become lists, numbers become floats (so 11 == 11.0)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    return float(value)
+
+
+def plan_key(**inputs):
+    """sha256 of the canonical JSON of the run_optimiser kwargs."""
+    canon = json.dumps(_canonical(inputs), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+_CACHE = None
+
+
+def get_plan_cache(settings=None):
+    """
+    Process-wide cache. The disk tier is enabled by setting
+    "plan_cache_dir" in settings.json.
+    """
+    global _CACHE
+    if _CACHE is None:
+        settings = settings or {}
+        _CACHE = TTLCache(
+            maxsize  = settings.get("plan_cache_size", 128),
+            disk_dir = settings.get("plan_cache_dir"),
+            expires  = lambda now: math.inf
+        )
+    return _CACHE
+
+
+def run_optimiser_cached(settings=None, **kwargs):
+    """(key, result) for run_optimiser(**kwargs), solved at most once per key."""
+    from optimiser import run_optimiser
+
+    key = plan_key(**kwargs)
+    return key, get_plan_cache(settings).get_or_compute(key, lambda: run_optimiser(**kwargs))
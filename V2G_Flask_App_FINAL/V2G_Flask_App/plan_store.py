@@ -0,0 +1,213 @@
+# plan_store.py
+#
+# Saved trips, one row per plan in SQLite (settings "plans_db", default
+# saved_plans.sqlite3). id and name are columns so renames are a one-row
+# UPDATE; everything else the planner saved is kept as JSON in `data`.
+# Plans are listed newest first from the created_at index, a page at a time.
+# Each plan can also carry `derived`: its summary text and metrics, computed
+# once when it is saved and stored as JSON next to the plan, with the
+# derived_key they were computed under (see utils.summary_key) so the app can
+# tell when they are stale.
+#
+# Every write is its own transaction and the database runs in WAL mode, so
+# concurrent requests (or worker processes) no longer overwrite each
+# other's changes the way rewriting saved_plans.json did.
+#
+# The first time a store is opened, saved_plans.json (if there is one) is
+# imported in file order. Plans without a "timestamp" get one from an id of
+# the form YYYYmmddHHMMSS, or else the file's modification time. The import
+# is recorded in the database and never repeated; the JSON file is left in
+# place as a backup.
+
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS plans (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,  -- insertion order
+    id          TEXT NOT NULL UNIQUE,
+    name        TEXT NOT NULL,
+    created_at  TEXT NOT NULL,                      -- ISO 8601, UTC
+    data        TEXT NOT NULL,
+    derived     TEXT,                               -- JSON, or NULL until computed
+    derived_key TEXT
+);
+CREATE INDEX IF NOT EXISTS plans_created_at ON plans (created_at, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# columns, not part of the JSON blob
+_COLUMNS = ("id", "name", "created_at", "derived_key")
+_SELECT  = "SELECT id, name, created_at, derived_key, derived, {data} FROM plans"
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _iso(t):
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return t.astimezone(timezone.utc).isoformat(timespec="seconds")
+
+
+def _legacy_timestamp(plan, default):
+    # "timestamp" if the plan has one, else an id that is a timestamp
+    for value, fmt in ((plan.get("timestamp"), None), (plan.get("id"), "%Y%m%d%H%M%S")):
+        if not value:
+            continue
+        try:
+            t = datetime.strptime(value, fmt) if fmt else datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            continue
+        return _iso(t)
+    return default
+
+
+class PlanStore:
+    """
+    Saved plans in a SQLite file. Plans are dicts as the planner saves them;
+    the ones handed back also carry "created_at", "derived" and
+    "derived_key".
+    """
+
+    def __init__(self, path):
+        self.path   = path
+        self._local = threading.local()   # one connection per thread
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+            # databases from before derived summaries
+            have = {r[1] for r in conn.execute("PRAGMA table_info(plans)")}
+            for column in ("derived", "derived_key"):
+                if column not in have:
+                    conn.execute(f"ALTER TABLE plans ADD COLUMN {column} TEXT")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _plan(row):
+        plan = json.loads(row[5])
+        plan.update(zip(_COLUMNS, row[:4]))
+        plan["derived"] = json.loads(row[4]) if row[4] else None
+        return plan
+
+    @staticmethod
+    def _row(plan, created_at=None):
+        data    = {k: v for k, v in plan.items() if k not in _COLUMNS + ("derived",)}
+        derived = plan.get("derived")
+        return (plan["id"], plan.get("name") or "Untitled",
+                created_at or plan.get("created_at") or _now(), json.dumps(data),
+                json.dumps(derived) if derived is not None else None, plan.get("derived_key"))
+
+    def add(self, plan):
+        """Store a plan (it must have an "id"); created_at defaults to now."""
+        with self._connect() as conn:
+            conn.execute("INSERT INTO plans (id, name, created_at, data, derived, derived_key) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", self._row(plan))
+        return plan["id"]
+
+    def get(self, plan_id):
+        row = self._connect().execute(
+            _SELECT.format(data="data") + " WHERE id = ?", (plan_id,)
+        ).fetchone()
+        return self._plan(row) if row else None
+
+    def list_recent(self, limit=20, offset=0, exclude=()):
+        """
+        Up to `limit` plans, newest first, skipping the first `offset`.
+        Top-level keys in `exclude` (e.g. "result") are dropped inside
+        SQLite rather than decoded.
+        """
+        data = "data"
+        if exclude:
+            data = "json_remove(data, {})".format(", ".join("?" * len(exclude)))
+        rows = self._connect().execute(
+            _SELECT.format(data=data) + " ORDER BY created_at DESC, seq DESC LIMIT ? OFFSET ?",
+            [f'$."{k}"' for k in exclude] + [limit, offset]
+        ).fetchall()
+        return [self._plan(r) for r in rows]
+
+    def set_derived(self, key, derived):
+        """Store {plan id: derived} computed under key, one UPDATE per plan."""
+        with self._connect() as conn:
+            conn.executemany("UPDATE plans SET derived = ?, derived_key = ? WHERE id = ?",
+                             [(json.dumps(d), key, i) for i, d in derived.items()])
+
+    def count(self):
+        return self._connect().execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+
+    def rename(self, plan_id, name):
+        """True if the plan exists."""
+        with self._connect() as conn:
+            cur = conn.execute("UPDATE plans SET name = ? WHERE id = ?", (name, plan_id))
+        return cur.rowcount > 0
+
+    def delete(self, plan_id):
+        """True if the plan existed."""
+        with self._connect() as conn:
+            cur = conn.execute("DELETE FROM plans WHERE id = ?", (plan_id,))
+        return cur.rowcount > 0
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM plans")
+
+    def import_json(self, path):
+        """
+        One-off import of a saved_plans.json list. Returns the number of
+        plans imported: 0 if the file is missing or was imported before.
+        """
+        key  = f"imported:{os.path.abspath(path)}"
+        conn = self._connect()
+        # BEGIN IMMEDIATE takes the write lock, so only one process imports
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute("SELECT 1 FROM meta WHERE key = ?", (key,)).fetchone()
+            if done or not os.path.exists(path):
+                conn.rollback()
+                return 0
+            with open(path) as f:
+                plans = json.load(f)
+            default = _iso(datetime.fromtimestamp(os.path.getmtime(path), timezone.utc))
+            rows    = [self._row(p, _legacy_timestamp(p, default)) for p in plans]
+            conn.executemany("INSERT OR IGNORE INTO plans (id, name, created_at, data, derived, "
+                             "derived_key) VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.execute("INSERT INTO meta (key, value) VALUES (?, ?)", (key, _now()))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return len(rows)
+
+
+_STORE      = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_plan_store(settings=None):
+    """
+    Process-wide store at settings["plans_db"], with saved_plans.json
+    imported on first use.
+    """
+    global _STORE
+    settings = settings or {}
+    path     = settings.get("plans_db", "saved_plans.sqlite3")
+    with _STORE_LOCK:
+        if _STORE is None or _STORE.path != path:
+            store = PlanStore(path)
+            store.import_json(settings.get("plans_json", "saved_plans.json"))
+            _STORE = store
+        return _STORE
@@ -0,0 +1,302 @@
+# stochastic.py
+#
+# Two-stage stochastic (sample-average) planning. run_optimiser plans
+# against one demand draw and the point PV forecast, so whether an hour
+# clears grid_demand_threshold, and with it the V2G plan, changes from run
+# to run. Here the first stage (the first first_stage_hours of the
+# schedule, the part acted on now) is chosen once for a whole ensemble of
+# demand / PV scenarios, and each scenario gets its own recourse plan for
+# the hours after it. The objective is the probability-weighted mean cost.
+#
+# Solve time stays bounded as the ensemble grows in two steps:
+#   - The ensemble is reduced to n_reduced scenarios by k-means on what the
+#     optimiser actually sees (PV kWh and the V2G kWh the demand gating
+#     allows). Each cluster is represented by its member nearest the
+#     centroid, weighted by the cluster's share of the ensemble.
+#   - The first stage is only shared over its first hours, so on the DP's
+#     SoC grid the problem splits exactly: every scenario's backward pass
+#     gives its cost-to-go from each SoC at the end of the first stage, and
+#     the first stage is one more DP against their weighted mean. That is
+#     n_reduced + 1 DP solves, linear in the scenario count, where the
+#     extensive-form MILP has 3·H binaries per scenario and can take HiGHS
+#     tens of seconds from 10 dissimilar 48 h scenarios. An LP over all
+#     scenarios with the actions fixed then undoes the DP's rounding (as
+#     dp_polish does); `benchmark.py stochastic` checks the result against
+#     that MILP.
+
+import numpy as np
+
+from metrics import timed
+from optimiser import (dp_actions, dp_backward, dp_forward, dp_grid, milp_arrays,
+                       record_problem_size, summarise_plan)
+
+
+def solar_scenarios(forecast, n_scenarios, rel_sigma=0.25, rho=0.8, seed=None):
+    """
+    (n_scenarios, hours) PV scenarios around a point forecast: multiplicative
+    errors with standard deviation rel_sigma, AR(1)-correlated hour to hour
+    with coefficient rho, clipped at zero output.
+    """
+    forecast = np.asarray(forecast, dtype=float)
+    z   = np.random.default_rng(seed).standard_normal((n_scenarios, len(forecast)))
+    err = np.empty_like(z)
+    err[:, :1] = z[:, :1]
+    for h in range(1, len(forecast)):
+        err[:, h] = rho * err[:, h - 1] + np.sqrt(1 - rho ** 2) * z[:, h]
+    return forecast * np.maximum(1 + rel_sigma * err, 0.0)
+
+
+def reduce_scenarios(features, k, seed=0, max_iter=50):
+    """
+    k representative rows of features (n, d) by k-means (k-means++ start):
+    (indices, probabilities), the medoid-like member of each cluster and
+    its share of the rows. Rows are returned unchanged when n ≤ k.
+    """
+    X = np.asarray(features, dtype=float)
+    n = len(X)
+    if n <= k:
+        return np.arange(n), np.full(n, 1.0 / n)
+
+    rng = np.random.default_rng(seed)
+    sq  = np.einsum("ij,ij->i", X, X)
+
+    def sq_dist(C):
+        return np.maximum(sq[:, None] - 2 * X @ C.T + np.einsum("ij,ij->i", C, C)[None, :], 0.0)
+
+    # k-means++: each new centre drawn in proportion to the squared distance
+    # from the centres so far
+    centres = [X[rng.integers(n)]]
+    d2 = sq_dist(np.array(centres))[:, 0]
+    for _ in range(1, k):
+        if d2.sum() <= 0:
+            break
+        centres.append(X[rng.choice(n, p=d2 / d2.sum())])
+        d2 = np.minimum(d2, sq_dist(centres[-1][None, :])[:, 0])
+    C = np.array(centres)
+
+    labels = None
+    for _ in range(max_iter):
+        new = sq_dist(C).argmin(axis=1)
+        if labels is not None and np.array_equal(new, labels):
+            break
+        # centroids as one-hot membership @ X; empty clusters are dropped
+        keep, labels = np.unique(new, return_inverse=True)
+        M = np.zeros((n, len(keep)))
+        M[np.arange(n), labels] = 1.0
+        C = (M.T @ X) / M.sum(axis=0)[:, None]
+
+    D = sq_dist(C)
+    indices, probabilities = [], []
+    for j in range(len(C)):
+        members = np.flatnonzero(labels == j)
+        indices.append(members[D[members, j].argmin()])
+        probabilities.append(len(members) / n)
+    return np.array(indices), np.array(probabilities)
+
+
+def extensive_arrays(params_list, probabilities, eco_mode, first_stage):
+    """
+    Every scenario's MILP (see milp_arrays) in one problem, with the first
+    `first_stage` hours' columns shared and the objective weighted by
+    probability: (c, A, row lower, row upper, var lower, var upper,
+    integrality, columns), columns[s] mapping scenario s's milp_arrays
+    columns to the combined ones. Solved as it is, this is the exact
+    two-stage problem (the benchmark's reference).
+    """
+    from scipy.sparse import coo_matrix, vstack
+
+    H = len(params_list[0][0])
+    n = 7 * H + 1
+    # Column layout per scenario: cPV | cG | dG | yPV | yG | yD | E (H+1);
+    # shared columns come first in the global layout, then each scenario's
+    # own
+    shared = np.zeros(n, dtype=bool)
+    for k in range(6):
+        shared[k * H:k * H + first_stage] = True
+    n_shared, n_own = int(shared.sum()), int((~shared).sum())
+    local  = np.where(shared, np.cumsum(shared) - 1, np.cumsum(~shared) - 1)
+    width  = n_shared + n_own * len(params_list)
+
+    c  = np.zeros(width)
+    lb = np.full(width, -np.inf)
+    ub = np.full(width, np.inf)
+    integrality = np.zeros(width)
+    blocks, lo, hi, columns = [], [], [], []
+    for s, (params, p) in enumerate(zip(params_list, probabilities)):
+        cs, A, lo_s, hi_s, lb_s, ub_s, int_s, _ = milp_arrays(*params, eco_mode)
+        g = np.where(shared, local, n_shared + s * n_own + local)
+        A = A.tocoo()
+        blocks.append(coo_matrix((A.data, (A.row, g[A.col])), shape=(A.shape[0], width)))
+        lo.append(lo_s)
+        hi.append(hi_s)
+        np.add.at(c, g, p * cs)
+        # a shared column has to fit every scenario's bounds
+        lb[g] = np.maximum(lb[g], lb_s)
+        ub[g] = np.minimum(ub[g], ub_s)
+        integrality[g] = int_s
+        columns.append(g)
+
+    ub = np.maximum(ub, lb)
+    return (c, vstack(blocks).tocsr(), np.concatenate(lo), np.concatenate(hi), lb, ub,
+            integrality, columns)
+
+
+def _extensive_lp(params_list, probabilities, eco_mode, first_stage, plans):
+    """
+    extensive_arrays with every binary fixed to the action pattern of
+    `plans`, which leaves an LP. Returns the re-optimised plans, or None if
+    the LP fails.
+    """
+    from scipy.optimize import milp, LinearConstraint, Bounds
+
+    c, A, lo, hi, lb, ub, _, columns = extensive_arrays(params_list, probabilities, eco_mode,
+                                                        first_stage)
+    H = len(params_list[0][0])
+    for plan, g in zip(plans, columns):
+        # action per period, 0 = PV (also idle periods) / 1 = grid / 2 = V2G;
+        # the binaries are columns 3H..6H (yPV | yG | yD)
+        action = np.argmax(np.asarray(plan[:3]) > 1e-9, axis=0)
+        y = np.zeros(3 * H)
+        y[action * H + np.arange(H)] = 1.0
+        lb[g[3 * H:6 * H]] = ub[g[3 * H:6 * H]] = y
+
+    res = milp(c, constraints=LinearConstraint(A, lo, hi), bounds=Bounds(lb, ub))
+    if res.status != 0:
+        return None
+    return [tuple(res.x[g[k * H:(k + 1) * H]].tolist() for k in range(3)) + (res.x[g[6 * H:]].tolist(),)
+            for g in columns]
+
+
+def run_stochastic_optimiser(
+    solar_scenarios,
+    grid_prices:              list[float],
+    demand_scenarios,
+    deadline_hour:            int,
+    required_energy:          float,
+    eco_mode:                 bool    = False,
+    cycle_degradation_cost:   float   = 1.0,    # £ per full (in+out) cycle
+    battery_capacity:         float   = 75.0,   # kWh
+    max_charge_rate:          float   = 11.0,   # kW
+    max_discharge_rate:       float   = 11.0,   # kW
+    initial_soc:              float   = 37.5,   # kWh
+    switch_penalty:           float   = 0.05,   # £ per discharge event
+    v2g_sell_price:           float   = 0.10,   # £/kWh
+    co2_price_per_kg:         float   = 0.0,
+    emission_factor:          float   = 0.233,
+    grid_demand_threshold:    float   = 30000,
+    first_stage_hours:        int     = 1,
+    n_reduced:                int     = 10,
+    dp_soc_step:              float   = 0.05,
+    polish:                   bool    = True,
+    seed:                     int     = 0
+) -> dict:
+    """
+    The run_optimiser plan with the first first_stage_hours fixed across an
+    ensemble of scenarios. solar_scenarios and demand_scenarios are
+    (n, hours) arrays (e.g. from solar_scenarios() and
+    demand_simulation.generate_scenarios); either may be a single hourly
+    list, shared by every scenario. The tariff is the same in all of them.
+
+    Returns the run_optimiser-style result of the most probable reduced
+    scenario, plus:
+      first_stage       {"solar_charging", "grid_charging",
+                        "grid_discharging"} for the first-stage hours
+      expected_cost     probability-weighted mean net_cost
+      cost_std          its standard deviation across the scenarios
+      cost_min/cost_max net_cost range across the scenarios
+      scenarios         [{"index", "probability", "plan"}] per reduced
+                        scenario, index being its row in the ensemble
+    Raises RuntimeError if some scenario can't reach the target SoC.
+    """
+    solar  = np.atleast_2d(np.asarray(solar_scenarios, dtype=float))
+    demand = np.atleast_2d(np.asarray(demand_scenarios, dtype=float))
+    if len(solar) != len(demand) and 1 not in (len(solar), len(demand)):
+        raise ValueError("solar_scenarios and demand_scenarios have different scenario counts")
+    n_total = max(len(solar), len(demand))
+    H = min(deadline_hour, solar.shape[1], demand.shape[1], len(grid_prices))
+    solar  = np.broadcast_to(solar[:, :H], (n_total, H))
+    demand = np.broadcast_to(demand[:, :H], (n_total, H))
+    gp     = list(grid_prices[:H])
+    N      = max(0, min(first_stage_hours, H))
+
+    with timed("scenario_reduction"):
+        # features in kWh: PV available and V2G allowed by the demand gating
+        features = np.hstack([solar, max_discharge_rate * (demand >= grid_demand_threshold)])
+        idx, prob = reduce_scenarios(features, n_reduced, seed)
+    record_problem_size("saa", hours=H, scenarios=len(idx), ensemble=n_total)
+
+    wear_cost = cycle_degradation_cost / (2 * battery_capacity)
+    co2_cost  = co2_price_per_kg * emission_factor
+    final_soc = initial_soc if eco_mode else required_energy
+
+    def params(sf, gd):
+        return (
+            list(sf), gp, list(gd), required_energy, battery_capacity,
+            max_charge_rate, max_discharge_rate, initial_soc, switch_penalty,
+            v2g_sell_price, wear_cost, co2_cost, grid_demand_threshold,
+        )
+
+    def actions(sf, gd, hours):
+        return dp_actions(E, step, sf, gp[hours], gd, max_charge_rate, max_discharge_rate,
+                          final_soc, wear_cost, v2g_sell_price, co2_cost,
+                          grid_demand_threshold, eco_mode)
+
+    with timed("solve", solver="saa"):
+        E, step, i0, iF = dp_grid(initial_soc, final_soc, battery_capacity, dp_soc_step)
+        terminal     = np.full(len(E), np.inf)
+        terminal[iF] = 0.0
+
+        # Recourse: each scenario's cost-to-go from every SoC at hour N,
+        # kept with that scenario's own actions for the forward pass
+        tail = slice(N, H)
+        recourse = []
+        for s in idx:
+            acts, can_discharge = actions(solar[s, tail], demand[s, tail], tail)
+            recourse.append((acts, can_discharge,
+                             dp_backward(E, acts, can_discharge, switch_penalty, terminal)))
+        expected_to_go = prob @ np.array([V[0] for _, _, V in recourse])
+
+        # First stage: PV no more than in any scenario, V2G only in hours
+        # every scenario allows it
+        head = slice(0, N)
+        acts, can_discharge = actions(solar[idx, head].min(axis=0), demand[idx, head].min(axis=0),
+                                      head)
+        V = dp_backward(E, acts, can_discharge, switch_penalty, expected_to_go)
+        if not np.isfinite(V[0, i0]):
+            raise RuntimeError("Solver failed (Infeasible)")
+        first = dp_forward(E, V, acts, can_discharge, switch_penalty, i0)
+        iN    = int(round((first[3][-1] - E[0]) / step))
+
+        plans = []
+        for acts, can_discharge, V in recourse:
+            rest = dp_forward(E, V, acts, can_discharge, switch_penalty, iN)
+            plans.append((first[0] + rest[0], first[1] + rest[1], first[2] + rest[2],
+                          first[3] + rest[3][1:]))
+
+        if polish:
+            polished = _extensive_lp([params(solar[s], demand[s]) for s in idx], prob,
+                                     eco_mode, N, plans)
+            plans = polished or plans
+
+    results = [summarise_plan(*plan, gp, v2g_sell_price, emission_factor) for plan in plans]
+    costs   = np.array([r["net_cost"] for r in results])
+    mean    = float(prob @ costs)
+
+    out = dict(results[int(prob.argmax())])
+    out.update({
+        "first_stage": {
+            "solar_charging":   plans[0][0][:N],
+            "grid_charging":    plans[0][1][:N],
+            "grid_discharging": plans[0][2][:N],
+        },
+        "first_stage_hours": N,
+        "expected_cost":     mean,
+        "cost_std":          float(np.sqrt(prob @ (costs - mean) ** 2)),
+        "cost_min":          float(costs.min()),
+        "cost_max":          float(costs.max()),
+        "scenarios": [
+            {"index": int(s), "probability": float(p), "plan": r}
+            for s, p, r in zip(idx, prob, results)
+        ],
+    })
+    return out
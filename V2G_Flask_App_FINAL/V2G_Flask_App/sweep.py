@@ -0,0 +1,195 @@
+# sweep.py
+#
+# Scenario sweeps over run_optimiser parameters, fanned out across a process
+# pool and streamed into a CSV as results arrive.
+#
+#   python sweep.py inputs.json grid.json results.csv --workers 8 --solver dp
+#
+# inputs.json holds the fixed run_optimiser kwargs (solar_forecast,
+# grid_prices, grid_demand, required_energy, ...). grid.json maps parameter
+# names to lists of values; every combination is one scenario. "car" takes
+# model names from cars.json and sets the battery capacity and rates.
+#
+# Each scenario has a stable id (a hash of its parameters and of the base
+# inputs), so re-running with the same output file only solves the scenarios
+# not in it yet. Every row also records inputs_id, the hash of the base
+# inputs (and of the cars.json entries swept over); resuming a file written
+# from different inputs is refused rather than mixing the two.
+
+import os
+import sys
+import csv
+import json
+import time
+import hashlib
+import inspect
+import argparse
+import itertools
+import multiprocessing
+
+from optimiser import run_optimiser
+
+CAR_FIELDS     = ("battery_capacity", "max_charge_rate", "max_discharge_rate")
+RESULT_FIELDS  = ("net_cost", "co2_emitted_kg", "co2_avoided_kg", "filled_by_deadline")
+SWEEP_AXES     = set(inspect.signature(run_optimiser).parameters) | {"car"}
+
+
+def _digest(obj):
+    canon = json.dumps(obj, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canon.encode("utf-8")).hexdigest()[:16]
+
+
+def inputs_id(base, cars=None):
+    """Stable id of the shared inputs: the base kwargs and the car specs used."""
+    return _digest({"base": base, "cars": cars or {}})
+
+
+def scenario_id(params, inputs=""):
+    """Stable id of a scenario: sha1 of its canonical JSON and the inputs id."""
+    return _digest({"inputs": inputs, "params": params})
+
+
+def expand_grid(grid):
+    """Every combination of the value lists in grid, as a list of dicts."""
+    unknown = set(grid) - SWEEP_AXES
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters: {', '.join(sorted(unknown))}")
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+# ─── Worker side ────────────────────────────────────────────────────────
+
+_BASE = _CARS = _INPUTS = None
+
+
+def _init_worker(base, cars, inputs):
+    # the shared inputs are sent once per worker, not once per scenario
+    global _BASE, _CARS, _INPUTS
+    _BASE, _CARS, _INPUTS = base, cars, inputs
+
+
+def _solve(params):
+    kwargs = dict(_BASE)
+    kwargs.update(params)
+    car = kwargs.pop("car", None)
+    if car is not None:
+        kwargs.update({k: _CARS[car][k] for k in CAR_FIELDS})
+
+    row = {"scenario_id": scenario_id(params, _INPUTS), "inputs_id": _INPUTS, **params}
+    t0  = time.perf_counter()
+    try:
+        result = run_optimiser(**kwargs)
+        row.update({k: result[k] for k in RESULT_FIELDS}, status="ok", error="")
+    except Exception as e:
+        row.update({k: "" for k in RESULT_FIELDS}, status="error", error=f"{type(e).__name__}: {e}")
+    row["solve_ms"] = (time.perf_counter() - t0) * 1e3
+    return row
+
+
+# ─── Driver ─────────────────────────────────────────────────────────────
+
+def _done_ids(out_path, fields, inputs):
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        return set()
+    with open(out_path, newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames != fields:
+            raise ValueError(f"{out_path} holds results for a different parameter grid")
+        done = set()
+        for row in reader:
+            if row["inputs_id"] != inputs:
+                raise ValueError(f"{out_path} holds results for different inputs "
+                                 f"(inputs_id {row['inputs_id']}, now {inputs})")
+            done.add(row["scenario_id"])
+        return done
+
+
+def run_sweep(base, grid, out_path, workers=None, cars_file="cars.json",
+              chunksize=8, progress_every=5.0, log=sys.stderr):
+    """
+    Solves every scenario of grid (see expand_grid) on top of the base
+    run_optimiser kwargs and appends one CSV row per scenario to out_path.
+    Scenarios already in out_path are skipped; a file written from other
+    base inputs or car specs raises ValueError. Failed solves are written
+    with status="error" instead of stopping the sweep.
+
+    Returns {"total", "skipped", "solved", "failed", "elapsed_s",
+    "solves_per_s"}.
+    """
+    scenarios = expand_grid(grid)
+    cars = {}
+    if "car" in grid:
+        with open(cars_file) as f:
+            cars = json.load(f)
+        missing = set(grid["car"]) - set(cars)
+        if missing:
+            raise ValueError(f"Unknown car models: {', '.join(sorted(missing))}")
+        cars = {c: {k: cars[c][k] for k in CAR_FIELDS} for c in grid["car"]}
+
+    inputs  = inputs_id(base, cars)
+    fields  = ["scenario_id", "inputs_id", *sorted(grid), "status", *RESULT_FIELDS, "solve_ms", "error"]
+    done    = _done_ids(out_path, fields, inputs)
+    pending = [p for p in scenarios if scenario_id(p, inputs) not in done]
+
+    new_file = not done and (not os.path.exists(out_path) or os.path.getsize(out_path) == 0)
+    solved = failed = 0
+    t0 = last = time.perf_counter()
+
+    with open(out_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        if new_file:
+            writer.writeheader()
+        if pending:
+            with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(base, cars, inputs)) as pool:
+                for row in pool.imap_unordered(_solve, pending, chunksize=chunksize):
+                    writer.writerow(row)
+                    f.flush()
+                    solved += 1
+                    failed += row["status"] != "ok"
+
+                    now = time.perf_counter()
+                    if log is not None and now - last >= progress_every:
+                        last = now
+                        print(f"{solved}/{len(pending)} solved, {solved / (now - t0):.1f} solves/s",
+                              file=log)
+
+    elapsed = time.perf_counter() - t0
+    stats = {
+        "total":        len(scenarios),
+        "skipped":      len(scenarios) - len(pending),
+        "solved":       solved,
+        "failed":       failed,
+        "elapsed_s":    elapsed,
+        "solves_per_s": solved / elapsed if solved else 0.0,
+    }
+    if log is not None:
+        print(f"{stats['solved']} solved ({stats['failed']} failed), {stats['skipped']} already done, "
+              f"{stats['solves_per_s']:.1f} solves/s", file=log)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep run_optimiser over a parameter grid.")
+    parser.add_argument("inputs", help="JSON file with the fixed run_optimiser kwargs")
+    parser.add_argument("grid", help="JSON file mapping parameter names to lists of values")
+    parser.add_argument("out", help="CSV file to append results to (resumed if it exists)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: all CPUs)")
+    parser.add_argument("--solver", default=None, help="run_optimiser solver for every scenario")
+    parser.add_argument("--chunksize", type=int, default=8)
+    parser.add_argument("--cars", default="cars.json")
+    args = parser.parse_args(argv)
+
+    with open(args.inputs) as f:
+        base = json.load(f)
+    with open(args.grid) as f:
+        grid = json.load(f)
+    if args.solver:
+        base["solver"] = args.solver
+
+    run_sweep(base, grid, args.out, workers=args.workers, cars_file=args.cars,
+              chunksize=args.chunksize)
+
+
+if __name__ == "__main__":
+    main()
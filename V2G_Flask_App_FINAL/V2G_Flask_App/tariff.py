@@ -0,0 +1,287 @@
+# tariff.py
+#
+# Grid import prices. Every tariff is one NumPy array of half-hourly prices
+# (£/kWh) on a UTC grid starting at t0, so the prices for any window are an
+# index computation and a slice. Tariffs come from tariffs.json (path in
+# settings "tariffs_file"), name → spec:
+#
+#   "tou":   {"type": "tou", "timezone": "Europe/London",
+#             "bands": {"00:00": 0.10, "07:00": 0.15, "15:00": 0.30, "19:00": 0.20},
+#             "weekend_bands": {...}}                      (optional)
+#   "agile": {"type": "series", "file": "prices/agile.csv", "fallback": "tou",
+#             "time_column": "valid_from", "price_column": "value_inc_vat",
+#             "scale": 0.01}                               (p/kWh → £/kWh)
+#
+# A "tou" table gives the price from each local start time until the next
+# band (wrapping past midnight) and is materialised DST-aware over about a
+# year around the window asked for. A "series" is a CSV file (header row)
+# or a JSON list of records, one per half-hour; timestamps are ISO 8601,
+# naive ones taken as UTC. Half-hours the series doesn't cover take the
+# price of its fallback tariff. The built-in "tou" below is the app's
+# original tariff and is used unless tariffs.json defines its own.
+#
+# A series file is only read when its prices are first asked for, and a
+# malformed spec is logged and skipped, so one bad feed breaks only the
+# tariffs that use it and the rest (and the list of names) keep working.
+
+import os
+import csv
+import json
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+RESOLUTION_MINUTES = 30
+_STEP = timedelta(minutes=RESOLUTION_MINUTES)
+
+DEFAULT_TARIFFS = {
+    "tou": {
+        "type":     "tou",
+        "timezone": "Europe/London",
+        "bands":    {"00:00": 0.10, "07:00": 0.15, "15:00": 0.30, "19:00": 0.20},
+    },
+}
+
+
+def _utc(t):
+    if t.tzinfo is None:
+        return t.replace(tzinfo=timezone.utc)
+    return t.astimezone(timezone.utc)
+
+
+def _check_aligned(t, where=""):
+    if t.minute % RESOLUTION_MINUTES or t.second or t.microsecond:
+        raise ValueError(f"{where}{t.isoformat()} is not on a {RESOLUTION_MINUTES}-minute boundary")
+
+
+class Tariff:
+    """
+    Half-hourly prices from t0 (UTC). prices() is the whole interface; the
+    subclasses only decide how the array is filled.
+    """
+
+    def __init__(self, name, fallback=None):
+        self.name     = name
+        self.fallback = fallback
+        self._grid    = (datetime(1970, 1, 1, tzinfo=timezone.utc), np.empty(0))   # (t0, prices)
+
+    def _covered(self, start, n):
+        # (t0, prices) covering the n half-hours from start, extended first
+        # if the subclass can
+        return self._grid
+
+    def half_hourly(self, start_utc, n):
+        """The n half-hourly prices from start_utc (on a half-hour)."""
+        start = _utc(start_utc)
+        _check_aligned(start)
+        t0, prices = self._covered(start, n)
+        offset = (start - t0) // _STEP
+        if 0 <= offset and offset + n <= len(prices) and not np.isnan(prices[offset:offset + n]).any():
+            return prices[offset:offset + n]
+
+        # partly outside the array (or gaps in it): what there is, the rest
+        # from the fallback tariff
+        out = np.full(n, np.nan)
+        lo, hi = max(offset, 0), min(offset + n, len(prices))
+        if lo < hi:
+            out[lo - offset:hi - offset] = prices[lo:hi]
+        missing = np.isnan(out)
+        if missing.any():
+            if self.fallback is None:
+                first = start + int(np.argmax(missing)) * _STEP
+                raise ValueError(f"Tariff '{self.name}' has no price for {first.isoformat()}")
+            out[missing] = self.fallback.half_hourly(start, n)[missing]
+        return out
+
+    def prices(self, start_utc, n_slots, slot_minutes=60):
+        """
+        Price per slot for n_slots slot_minutes slots from start_utc: the
+        mean over the half-hours in a 60-minute slot, each half-hour's
+        price repeated for 15-minute slots.
+        """
+        if slot_minutes == RESOLUTION_MINUTES:
+            return self.half_hourly(start_utc, n_slots)
+        if slot_minutes % RESOLUTION_MINUTES == 0:
+            k = slot_minutes // RESOLUTION_MINUTES
+            return self.half_hourly(start_utc, n_slots * k).reshape(n_slots, k).mean(axis=1)
+        if RESOLUTION_MINUTES % slot_minutes == 0:
+            k = RESOLUTION_MINUTES // slot_minutes
+            return np.repeat(self.half_hourly(start_utc, -(-n_slots // k)), k)[:n_slots]
+        raise ValueError(f"Unsupported slot length: {slot_minutes} minutes")
+
+
+def _minutes(hhmm):
+    h, m = hhmm.split(":")
+    return int(h) * 60 + int(m)
+
+
+class TimeOfUseTariff(Tariff):
+    """Price bands by local time of day, optionally different at weekends."""
+
+    def __init__(self, name, bands, weekend_bands=None, tz="Europe/London", days=400, fallback=None):
+        from zoneinfo import ZoneInfo
+
+        super().__init__(name, fallback)
+        self.tz      = ZoneInfo(tz)
+        self.days    = days
+        self.bands   = self._table(bands)
+        self.weekend = self._table(weekend_bands) if weekend_bands else self.bands
+        self._lock   = threading.Lock()
+
+    @staticmethod
+    def _table(bands):
+        # (start minutes, prices) sorted by start time
+        starts = sorted((_minutes(t), float(p)) for t, p in bands.items())
+        return np.array([s for s, _ in starts]), np.array([p for _, p in starts])
+
+    def _materialise(self, start):
+        # the grid from a day before start for self.days days; the local
+        # time of each half-hour takes DST into account
+        t0 = start.replace(minute=0, second=0, microsecond=0) - timedelta(days=1)
+        n  = self.days * 24 * 60 // RESOLUTION_MINUTES
+        local   = [(t0 + i * _STEP).astimezone(self.tz) for i in range(n)]
+        minute  = np.array([t.hour * 60 + t.minute for t in local])
+        weekend = np.array([t.weekday() >= 5 for t in local])
+        prices  = np.empty(n)
+        for mask, (starts, values) in ((~weekend, self.bands), (weekend, self.weekend)):
+            # index -1 (before the first band) wraps to the last band
+            prices[mask] = values[np.searchsorted(starts, minute[mask], side="right") - 1]
+        return t0, prices
+
+    def _covered(self, start, n):
+        t0, prices = self._grid
+        if start >= t0 and start + n * _STEP <= t0 + len(prices) * _STEP:
+            return self._grid
+        with self._lock:
+            if n * _STEP > timedelta(days=self.days - 1):
+                raise ValueError(f"Window longer than {self.days - 1} days")
+            self._grid = self._materialise(start)
+            return self._grid
+
+
+class SeriesTariff(Tariff):
+    """
+    Half-hourly dynamic prices from a CSV or JSON file, read on first use
+    (and retried on every use until it loads).
+    """
+
+    def __init__(self, name, path, time_column="start", price_column="price", scale=1.0,
+                 fallback=None):
+        super().__init__(name, fallback)
+        self.path         = path
+        self.time_column  = time_column
+        self.price_column = price_column
+        self.scale        = scale
+        self._loaded      = False
+        self._lock        = threading.Lock()
+
+    def _covered(self, start, n):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._grid   = self._load()
+                    self._loaded = True
+        return self._grid
+
+    def _load(self):
+        path, time_column, price_column = self.path, self.time_column, self.price_column
+        if path.lower().endswith(".json"):
+            with open(path) as f:
+                records = json.load(f)
+        else:
+            with open(path, newline="") as f:
+                records = list(csv.DictReader(f))
+        if not records:
+            raise ValueError(f"No prices in {path}")
+
+        times = [_utc(datetime.fromisoformat(r[time_column].replace("Z", "+00:00"))) for r in records]
+        for t in times:
+            _check_aligned(t, f"{path}: ")
+        t0     = min(times)
+        slots  = [(t - t0) // _STEP for t in times]
+        prices = np.full(max(slots) + 1, np.nan)
+        prices[slots] = [float(r[price_column]) * self.scale for r in records]
+        return t0, prices
+
+
+def load_tariffs(path="tariffs.json"):
+    """{name: Tariff} from DEFAULT_TARIFFS plus the tariffs file, if present."""
+    specs = dict(DEFAULT_TARIFFS)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            specs.update(json.load(f))
+    base = os.path.dirname(os.path.abspath(path)) if path else os.getcwd()
+
+    tariffs = {}
+
+    def build(name, seen=()):
+        if name in tariffs:
+            return tariffs[name]
+        if name not in specs:
+            raise ValueError(f"Unknown tariff: {name}")
+        if name in seen:
+            raise ValueError(f"Tariff fallbacks loop through '{name}'")
+        spec     = specs[name]
+        fallback = build(spec["fallback"], seen + (name,)) if spec.get("fallback") else None
+        if spec["type"] == "tou":
+            tariff = TimeOfUseTariff(name, spec["bands"], spec.get("weekend_bands"),
+                                     spec.get("timezone", "Europe/London"), fallback=fallback)
+        elif spec["type"] == "series":
+            tariff = SeriesTariff(name, os.path.join(base, spec["file"]),
+                                  spec.get("time_column", "start"), spec.get("price_column", "price"),
+                                  spec.get("scale", 1.0), fallback=fallback)
+        else:
+            raise ValueError(f"Unknown tariff type for '{name}': {spec['type']}")
+        tariffs[name] = tariff
+        return tariff
+
+    for name in specs:
+        try:
+            build(name)
+        except (KeyError, TypeError, ValueError) as e:
+            log.warning("Skipping tariff '%s': %s", name, e)
+    return tariffs
+
+
+# Loaded once per process and reloaded when the tariffs file or any price
+# series file changes (a new day-ahead price file dropped in place is
+# picked up on the next request)
+_LOADED      = None   # (path, {file: mtime}, tariffs)
+_LOADED_LOCK = threading.Lock()
+
+
+def _mtimes(files):
+    return {f: os.path.getmtime(f) if os.path.exists(f) else None for f in files}
+
+
+def _loaded(settings):
+    path = settings.get("tariffs_file", "tariffs.json")
+    global _LOADED
+    with _LOADED_LOCK:
+        if _LOADED is None or _LOADED[0] != path or _mtimes(_LOADED[1]) != _LOADED[1]:
+            tariffs = load_tariffs(path)
+            files   = [path] + [t.path for t in tariffs.values() if isinstance(t, SeriesTariff)]
+            _LOADED = (path, _mtimes(files), tariffs)
+        return _LOADED[2]
+
+
+def tariff_names(settings):
+    return sorted(_loaded(settings))
+
+
+def get_tariff(settings):
+    """The tariff named by settings["tariff"] (default "tou")."""
+    tariffs = _loaded(settings)
+    name    = settings.get("tariff", "tou")
+    if name not in tariffs:
+        raise ValueError(f"Unknown tariff: {name}")
+    return tariffs[name]
+
+
+def tariff_prices(settings, start_utc, n_slots, slot_minutes=60):
+    """The settings' tariff for n_slots slots from start_utc, as a list."""
+    return get_tariff(settings).prices(start_utc, n_slots, slot_minutes).tolist()
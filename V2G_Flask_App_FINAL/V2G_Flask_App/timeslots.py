@@ -0,0 +1,55 @@
+# timeslots.py
+#
+# Sub-hourly scheduling grid. Open-Meteo and the CNN both work in hourly
+# steps, so the weather and the PV forecast stay hourly (and cached that
+# way) and are interpolated onto 15/30-minute slots here. Tariffs and
+# demand are then evaluated per slot and the optimiser plans kWh per slot.
+
+import numpy as np
+
+SLOT_MINUTES = (15, 30, 60)
+
+
+def slots_per_hour(slot_minutes):
+    if slot_minutes not in SLOT_MINUTES:
+        raise ValueError(f"slot_minutes must be one of {SLOT_MINUTES}")
+    return 60 // slot_minutes
+
+
+def interpolate_hourly(values, slot_minutes):
+    """
+    Hourly samples → slot samples, linear between the hourly points and
+    holding the last one (so len(values) hours give len(values) × slots per
+    hour slots). Identity at slot_minutes=60.
+    """
+    n = slots_per_hour(slot_minutes)
+    v = np.asarray(values, dtype=float)
+    if n == 1:
+        return v.copy()
+    return np.interp(np.arange(len(v) * n) / n, np.arange(len(v)), v)
+
+
+def interpolate_frame(df, slot_minutes):
+    """
+    Hourly weather frame (a 'datetime' column + numeric columns) on the slot
+    grid, with every numeric column interpolated by interpolate_hourly.
+    """
+    import pandas as pd
+
+    n = slots_per_hour(slot_minutes)
+    if n == 1 or df.empty:
+        return df.copy()
+    out = {"datetime": pd.date_range(df["datetime"].iloc[0], periods=len(df) * n,
+                                     freq=f"{slot_minutes}min")}
+    for col in df.columns:
+        if col != "datetime":
+            out[col] = interpolate_hourly(df[col].to_numpy(dtype=float), slot_minutes)
+    return pd.DataFrame(out)
+
+
+def slot_labels(start_hour, count, slot_minutes=60):
+    """"HH:MM" for `count` slots starting at start_hour:00."""
+    return [
+        f"{(start_hour + i * slot_minutes // 60) % 24:02d}:{i * slot_minutes % 60:02d}"
+        for i in range(count)
+    ]
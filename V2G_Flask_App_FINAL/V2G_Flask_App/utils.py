@@ -2,18 +2,17 @@ from optimiser import compute_baseline_cost
 import calendar
 import os
 import json
-import requests
 from datetime import datetime,timedelta
 
 
 def generate_summary(
     result, required_range, deadline_hour,
-    grid_prices=None, energy_per_mile=0.25, max_charge_rate=11.0
+    grid_prices=None, energy_per_mile=0.25, max_charge_rate=11.0, slot_minutes=60
 ):
     # compute with passed energy_per_mile
     required_energy = required_range * energy_per_mile
     start_soc = result["battery_soc"][0]
-    end_soc   = result["battery_soc"][deadline_hour]
+    end_soc   = result["battery_soc"][deadline_hour * 60 // slot_minutes]
 
     solar_used = sum(result["solar_charging"])
     grid_used  = sum(result["grid_charging"])
@@ -34,7 +33,8 @@ def generate_summary(
     ]
 
     if grid_prices:
-        baseline_cost, _ = compute_baseline_cost(grid_prices, required_energy, max_charge_rate)
+        baseline_cost, _ = compute_baseline_cost(grid_prices, required_energy,
+                                                 max_charge_rate * slot_minutes / 60)
         savings = baseline_cost - net_cost
         lines += [
           f"• Full Grid Baseline Cost: £{baseline_cost:.2f}",
@@ -45,38 +45,92 @@ def generate_summary(
     return "\n".join(lines)
 
 
+def plan_metrics(result, grid_prices, required_energy, v2g_sell_price=0.10, emission_factor=0.233):
+    """Cost and CO₂ figures the planner shows next to a plan."""
+    baseline_cost  = required_energy * sum(grid_prices) / len(grid_prices)
+    grid_in_cost   = sum(ch * p for ch, p in zip(result["grid_charging"], grid_prices))
+    grid_out_rev   = sum(d * v2g_sell_price for d in result["grid_discharging"])
+    net_cost       = grid_in_cost - grid_out_rev
+    co2_emitted_kg = sum(ch * emission_factor for ch in result["grid_charging"])
+    co2_avoided_kg = sum(result["solar_charging"]) * emission_factor
+    return {
+        "baseline_cost":    baseline_cost,
+        "net_cost":         net_cost,
+        "money_saved":      baseline_cost - net_cost,
+        "co2_emitted_kg":   co2_emitted_kg,
+        "co2_avoided_kg":   co2_avoided_kg,
+        "net_co2_saved_kg": co2_avoided_kg - co2_emitted_kg,
+    }
+
+
+# Bump when generate_summary or plan_metrics change what they produce, so
+# saved plans get their stored summaries recomputed
+SUMMARY_VERSION = 1
+
+
+def summary_key(settings):
+    """Version + the settings a saved plan's summary and metrics depend on."""
+    return json.dumps([SUMMARY_VERSION, settings["energy_per_mile"], settings["charge_rate"],
+                       settings["v2g_sell_price"], settings.get("emission_factor", 0.233)])
+
+
+def plan_derived(plan, settings):
+    """
+    summary_text plus plan_metrics for a saved plan. Plans saved without
+    their grid prices keep the cost figures they were saved with.
+    """
+    prices  = plan.get("grid_prices")
+    derived = {"summary_text": generate_summary(
+        plan["result"], plan["range"], plan["deadline_hour"],
+        grid_prices     = prices,
+        energy_per_mile = settings["energy_per_mile"],
+        max_charge_rate = settings["charge_rate"],
+        slot_minutes    = plan.get("slot_minutes", 60)
+    )}
+    metrics = plan_metrics(plan["result"], prices or [0.0], plan["range"] * settings["energy_per_mile"],
+                           settings["v2g_sell_price"], settings.get("emission_factor", 0.233))
+    if not prices:
+        for k in ("baseline_cost", "net_cost", "money_saved"):
+            metrics[k] = plan.get(k)
+    derived.update(metrics)
+    return derived
+
+
 
 
 def format_charging_plan(
     result,
     sim_start_hour: int,
     deadline_hour: int,
-    day_offset: int
+    day_offset: int,
+    slot_minutes: int = 60
 ) -> str:
     """
     Builds the downloadable plan text.
 
     sim_start_hour: hour of day that simulation begins (0–23)
     day_offset:     number of days after today (0 = tomorrow)
+    slot_minutes:   length of one entry of the result lists
     """
+    last_slot = deadline_hour * 60 // slot_minutes
 
-    def label(h):
-        return (sim_start_hour + h) % 24
+    def minutes(h):
+        return sim_start_hour * 60 + h * slot_minutes
 
     def day_index(h):
-        return (sim_start_hour + h) // 24
+        return minutes(h) // (24 * 60)
 
     def fmt_hour(h):
-        hh = label(h)
+        hh, mm = divmod(minutes(h) % (24 * 60), 60)
         suffix = "AM" if hh < 12 else "PM"
         disp   = hh if 1 <= hh <= 12 else (12 if hh == 0 else hh - 12)
-        return f"{disp:02d}:00 {suffix}"
+        return f"{disp:02d}:{mm:02d} {suffix}"
 
     # 1) Group continuous blocks by action
     blocks = {"Solar Charging": [], "Grid Charging": [], "Discharging": []}
     active = {k: None for k in blocks}
 
-    for h in range(deadline_hour + 1):
+    for h in range(last_slot + 1):
         acts = {
             "Solar Charging":   result["solar_charging"][h] > 0,
             "Grid Charging":    result["grid_charging"][h]  > 0,
@@ -92,7 +146,7 @@ def format_charging_plan(
     # close any still-open blocks
     for act, start in active.items():
         if start is not None:
-            blocks[act].append((start, deadline_hour))
+            blocks[act].append((start, last_slot))
 
     # 2) Compute real start date
     today = datetime.now().date()
@@ -152,6 +206,11 @@ def load_settings():
       "min_soc_limit": 0.5,
       "degradation_cost_per_kwh": 0.01,
       "v2g_sell_price": 0.10,
+      "solver": "cbc",              # or "highs" (in-process, scipy) / "dp"
+      "slot_minutes": 60,           # or 30 / 15; sub-hourly plans always use "dp"
+      "tariff": "tou",              # a tariff name from tariffs_file (see tariff.py)
+      "tariffs_file": "tariffs.json",
+      "plans_db": "saved_plans.sqlite3",   # saved trips (see plan_store.py)
     }
     if os.path.exists("settings.json"):
         with open("settings.json") as f:
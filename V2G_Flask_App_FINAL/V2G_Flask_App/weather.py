@@ -1,12 +1,8 @@
-import openmeteo_requests
-import requests_cache
 import pandas as pd
-from retry_requests import retry
+from weather_client import get_weather_client, utc_now
 
-# Setup the Open-Meteo API client with cache and retry
-cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-openmeteo = openmeteo_requests.Client(session=retry_session)
+# Shared Open-Meteo client (cache + retry + connection pool, see weather_client.py)
+openmeteo = get_weather_client()
 
 def fetch_weather_forecast(latitude=52.9548, longitude=-1.1581, hours=48):
     url = "https://api.open-meteo.com/v1/forecast"
@@ -36,6 +32,6 @@ def fetch_weather_forecast(latitude=52.9548, longitude=-1.1581, hours=48):
     })
 
     # Filter to next N hours only
-    now = pd.Timestamp.now(tz=df["time"].dt.tz).floor("h")
+    now = pd.Timestamp(utc_now()).tz_convert(df["time"].dt.tz).floor("h")
     df = df[df["time"] > now].head(hours)
     return df.reset_index(drop=True)
\ No newline at end of file
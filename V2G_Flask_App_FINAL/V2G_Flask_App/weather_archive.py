@@ -0,0 +1,177 @@
+# weather_archive.py
+#
+# Local columnar archive of historical hourly weather, so backfills and model
+# retraining don't have to go back to the Open-Meteo historical API.
+#
+# Layout:   <root>/<lat>_<lon>/<YYYY-MM>/<column>.npy
+#
+# Every month partition holds one float32 array per column with a fixed slot
+# per hour of the month (NaN = not archived yet), so a time range maps
+# straight to array offsets and reads are np.load(mmap_mode="r") slices that
+# only touch the requested columns.
+#
+# Writes to a month partition are serialised by a process-wide lock per
+# partition directory (every DataFetcher has its own WeatherArchive), and
+# each column file is written to a uniquely named temp file and renamed
+# into place, so readers only ever see whole files.
+
+import os
+import calendar
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+
+from weather_client import utc_now
+
+DEFAULT_ARCHIVE_DIR = "weather_archive"
+
+_PARTITION_LOCKS = {}
+_PARTITION_LOCKS_LOCK = threading.Lock()
+
+
+def _partition_lock(month_dir):
+    key = os.path.abspath(month_dir)
+    with _PARTITION_LOCKS_LOCK:
+        return _PARTITION_LOCKS.setdefault(key, threading.Lock())
+
+
+def _save_atomic(path, arr):
+    # unique temp file in the same directory, then an atomic rename
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp.npy",
+                                     delete=False) as f:
+        tmp = f.name
+        try:
+            np.save(f, arr)
+        except BaseException:
+            f.close()
+            os.remove(tmp)
+            raise
+    os.replace(tmp, path)
+
+
+def _site_dir(latitude, longitude):
+    return f"{float(latitude):+.4f}_{float(longitude):+.4f}"
+
+
+def _month_start(ts):
+    return pd.Timestamp(year=ts.year, month=ts.month, day=1, tz="UTC")
+
+
+def _month_hours(month_start):
+    return calendar.monthrange(month_start.year, month_start.month)[1] * 24
+
+
+def _column_file(name):
+    # column names like "cloud_cover_%" are fine on disk, but keep them tidy
+    return name.replace("%", "pct").replace("/", "_") + ".npy"
+
+
+class WeatherArchive:
+    def __init__(self, root=DEFAULT_ARCHIVE_DIR):
+        self.root = root
+
+    def _month_dir(self, latitude, longitude, month_start):
+        return os.path.join(self.root, _site_dir(latitude, longitude), month_start.strftime("%Y-%m"))
+
+    def _columns_file(self, month_dir):
+        return os.path.join(month_dir, "columns.txt")
+
+    def _month_columns(self, month_dir):
+        try:
+            with open(self._columns_file(month_dir)) as f:
+                return [line.rstrip("\n") for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def append(self, latitude, longitude, df):
+        """
+        Writes the rows of df (UTC 'datetime' column + numeric columns) into
+        their month partitions, overwriting any slots already held.
+        """
+        if df.empty:
+            return
+        times   = pd.DatetimeIndex(pd.to_datetime(df["datetime"], utc=True))
+        columns = [c for c in df.columns if c != "datetime"]
+        months  = np.asarray(times.strftime("%Y-%m"))
+
+        for month in pd.unique(months):
+            rows        = months == month
+            month_start = pd.Timestamp(f"{month}-01", tz="UTC")
+            month_dir   = self._month_dir(latitude, longitude, month_start)
+            os.makedirs(month_dir, exist_ok=True)
+
+            slots = ((times[rows] - month_start) // pd.Timedelta(hours=1)).to_numpy()
+            with _partition_lock(month_dir):
+                known = self._month_columns(month_dir)
+                for col in columns:
+                    path = os.path.join(month_dir, _column_file(col))
+                    if os.path.exists(path):
+                        arr = np.load(path)
+                    else:
+                        arr = np.full(_month_hours(month_start), np.nan, dtype=np.float32)
+                    arr[slots] = df.loc[rows, col].to_numpy(dtype=np.float32)
+                    _save_atomic(path, arr)
+
+                new_cols = [c for c in columns if c not in known]
+                if new_cols:
+                    with open(self._columns_file(month_dir), "a") as f:
+                        f.writelines(f"{c}\n" for c in new_cols)
+
+    def read(self, latitude, longitude, start_utc, end_utc, columns=None):
+        """
+        Hourly rows in [start_utc, end_utc) for the requested columns (all
+        archived columns if None), as a DataFrame with a UTC 'datetime'
+        column. Hours where none of the columns are archived are dropped.
+        """
+        start = pd.Timestamp(start_utc)
+        end   = pd.Timestamp(end_utc)
+        start = start.tz_localize("UTC") if start.tzinfo is None else start.tz_convert("UTC")
+        end   = end.tz_localize("UTC") if end.tzinfo is None else end.tz_convert("UTC")
+
+        month_starts = pd.date_range(_month_start(start), end, freq="MS", tz="UTC")
+        frames = []
+        for month_start in month_starts:
+            month_dir = self._month_dir(latitude, longitude, month_start)
+            available = self._month_columns(month_dir)
+            if not available:
+                continue
+            cols = available if columns is None else list(columns)
+
+            lo = max(int((start - month_start) // pd.Timedelta(hours=1)), 0)
+            hi = min(int(-(-(end - month_start) // pd.Timedelta(hours=1))), _month_hours(month_start))
+            if hi <= lo:
+                continue
+
+            data = {"datetime": month_start + pd.to_timedelta(np.arange(lo, hi), unit="h")}
+            for col in cols:
+                path = os.path.join(month_dir, _column_file(col))
+                if col in available and os.path.exists(path):
+                    data[col] = np.array(np.load(path, mmap_mode="r")[lo:hi])
+                else:
+                    data[col] = np.full(hi - lo, np.nan, dtype=np.float32)
+            frames.append(pd.DataFrame(data))
+
+        if not frames:
+            return pd.DataFrame(columns=["datetime"] + list(columns or []))
+
+        df   = pd.concat(frames, ignore_index=True)
+        df   = df[(df["datetime"] >= start) & (df["datetime"] < end)]
+        keep = df.drop(columns="datetime").notna().any(axis=1)
+        return df[keep].reset_index(drop=True)
+
+    def missing_days(self, latitude, longitude, start_date, end_date, column="solar_radiation_W_m2"):
+        """
+        UTC dates in [start_date, end_date] with any hour of `column` not
+        archived. Only finished hours count: the current hour and later are
+        never archived, so they're never reported missing.
+        """
+        start = pd.Timestamp(start_date, tz="UTC")
+        end   = pd.Timestamp(end_date, tz="UTC") + pd.Timedelta(days=1)
+        end   = min(end, pd.Timestamp(utc_now()).floor("h"))
+        if end <= start:
+            return []
+        held  = self.read(latitude, longitude, start, end, [column]).dropna()
+        hours = pd.date_range(start, end, freq="h", tz="UTC", inclusive="left")
+        gaps  = hours[~hours.isin(held["datetime"])]
+        return sorted(set(gaps.date))
@@ -0,0 +1,220 @@
+# weather_client.py
+#
+# The single Open-Meteo client shared by weather.py, DataFetcher and
+# WeatherFetcher: one cached, retrying, connection-pooled session per process.
+#
+# V2G_WEATHER_MODE selects where responses come from:
+#   live   (default) straight from the network
+#   record           from the network, and every FlatBuffer response body is
+#                    also written to V2G_WEATHER_REPLAY_DIR
+#   replay           only from V2G_WEATHER_REPLAY_DIR, never the network, so
+#                    load tests and CI run offline with deterministic latency
+#
+# Recordings are keyed by the exact request, and every request window is
+# relative to "now", so record and replay also pin the clock (utc_now) that
+# the weather callers plan from. The first recording run writes the pinned
+# time to clock.json in the replay directory; later record and replay runs
+# read it back and ask for exactly the same dates, however long after the
+# recording they run. V2G_WEATHER_CLOCK=<ISO time> pins the clock in any mode.
+#
+# For CI (see README): run the app once with V2G_WEATHER_MODE=record and
+# V2G_WEATHER_REPLAY_DIR=ci/weather through the requests the tests make,
+# commit the directory, and run CI with V2G_WEATHER_MODE=replay. To
+# re-record, delete the directory (clock.json included) first.
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+WEATHER_MODES      = ("live", "record", "replay")
+DEFAULT_REPLAY_DIR = "weather_replay"
+CLOCK_FILE         = "clock.json"
+POOL_SIZE          = 16
+
+
+class ReplayMissError(LookupError):
+    pass
+
+
+class _StoredResponse:
+    """Just enough of a requests.Response for openmeteo_requests.Client."""
+
+    def __init__(self, content):
+        self.content     = content
+        self.status_code = 200
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        pass
+
+
+class RecordReplaySession:
+    """
+    Session wrapper that records response bodies to disk or replays them.
+    Files are named by a hash of the method, URL and sorted query params.
+    """
+
+    def __init__(self, mode, replay_dir, session=None):
+        if mode not in WEATHER_MODES:
+            raise ValueError(f"Unknown weather mode: {mode}")
+        if mode != "replay" and session is None:
+            raise ValueError(f"{mode} mode needs a network session")
+        self.mode       = mode
+        self.replay_dir = replay_dir
+        self.session    = session
+
+    def _path(self, method, url, params):
+        canon  = json.dumps([method, url, sorted((k, str(v)) for k, v in params.items())])
+        digest = hashlib.sha1(canon.encode("utf-8")).hexdigest()
+        return os.path.join(self.replay_dir, f"{digest}.fb")
+
+    def request(self, method, url, params=None, data=None, **kwargs):
+        params = dict(params or data or {})
+        path   = self._path(method, url, params)
+
+        if self.mode == "replay":
+            try:
+                with open(path, "rb") as f:
+                    return _StoredResponse(f.read())
+            except FileNotFoundError:
+                raise ReplayMissError(
+                    f"No recorded response for {url} {params} in {self.replay_dir}; "
+                    f"run once with V2G_WEATHER_MODE=record"
+                ) from None
+
+        if method == "POST":
+            response = self.session.post(url, data=params, **kwargs)
+        else:
+            response = self.session.get(url, params=params, **kwargs)
+
+        if self.mode == "record" and response.status_code == 200:
+            os.makedirs(self.replay_dir, exist_ok=True)
+            # unique temp file per writer, then an atomic rename
+            with tempfile.NamedTemporaryFile(dir=self.replay_dir, suffix=".tmp",
+                                             delete=False) as f:
+                f.write(response.content)
+            os.replace(f.name, path)
+        return response
+
+    def get(self, url, params=None, **kwargs):
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request("POST", url, data=data, **kwargs)
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+def _pooled_session():
+    # cache + retry, then swap in a larger connection pool with the same
+    # retry policy so concurrent requests share keep-alive connections
+    import requests_cache
+    from requests.adapters import HTTPAdapter
+    from retry_requests import retry
+
+    session = retry(
+        requests_cache.CachedSession('.cache', expire_after=3600),
+        retries=5, backoff_factor=0.2
+    )
+    for prefix in ("http://", "https://"):
+        retries = session.get_adapter(prefix).max_retries
+        session.mount(prefix, HTTPAdapter(
+            max_retries=retries, pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE
+        ))
+    return session
+
+
+_CLIENT      = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def _client_class():
+    import openmeteo_requests
+
+    class Client(openmeteo_requests.Client):
+        # weather_api wraps every session error in OpenMeteoRequestsError;
+        # a replay miss is re-raised as itself so callers can catch it
+        def weather_api(self, *args, **kwargs):
+            try:
+                return super().weather_api(*args, **kwargs)
+            except openmeteo_requests.OpenMeteoRequestsError as e:
+                if isinstance(e.__cause__, ReplayMissError):
+                    raise e.__cause__ from None
+                raise
+
+    return Client
+
+
+def get_weather_client():
+    """
+    The process-wide openmeteo_requests.Client. Its weather_api raises
+    ReplayMissError (not OpenMeteoRequestsError) for an unrecorded request
+    in replay mode.
+    """
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                mode       = os.getenv("V2G_WEATHER_MODE", "live")
+                replay_dir = os.getenv("V2G_WEATHER_REPLAY_DIR", DEFAULT_REPLAY_DIR)
+                session    = None if mode == "replay" else _pooled_session()
+                if mode != "live":
+                    session = RecordReplaySession(mode, replay_dir, session)
+                _CLIENT = _client_class()(session=session)
+    return _CLIENT
+
+
+def _parse_utc(text):
+    t = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    return t.replace(tzinfo=timezone.utc) if t.tzinfo is None else t.astimezone(timezone.utc)
+
+
+def _pinned_clock():
+    # the pinned time, or None when the clock runs normally (live mode)
+    if os.getenv("V2G_WEATHER_CLOCK"):
+        return _parse_utc(os.environ["V2G_WEATHER_CLOCK"])
+    mode = os.getenv("V2G_WEATHER_MODE", "live")
+    if mode == "live":
+        return None
+    path = os.path.join(os.getenv("V2G_WEATHER_REPLAY_DIR", DEFAULT_REPLAY_DIR), CLOCK_FILE)
+    try:
+        with open(path) as f:
+            return _parse_utc(json.load(f)["utc"])
+    except FileNotFoundError:
+        if mode == "replay":
+            raise ReplayMissError(f"No {path}; run once with V2G_WEATHER_MODE=record") from None
+    clock = datetime.now(timezone.utc).replace(microsecond=0)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"utc": clock.isoformat()}, f)
+    return clock
+
+
+_CLOCK = None   # (pinned time or None,) once resolved
+
+
+def utc_now():
+    """The current UTC time, or the pinned one in record/replay mode."""
+    global _CLOCK
+    if _CLOCK is None:
+        with _CLIENT_LOCK:
+            if _CLOCK is None:
+                _CLOCK = (_pinned_clock(),)
+    return _CLOCK[0] or datetime.now(timezone.utc)
+
+
+def reset_weather_client():
+    """
+    Drop the shared client and clock, e.g. after changing V2G_WEATHER_MODE.
+    """
+    global _CLIENT, _CLOCK
+    with _CLIENT_LOCK:
+        _CLIENT = None
+        _CLOCK  = None
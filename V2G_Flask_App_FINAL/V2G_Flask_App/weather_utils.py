@@ -1,95 +1,313 @@
-# weather_utils.py
-
-import pandas as pd
-import requests_cache
-from retry_requests import retry
-import openmeteo_requests
-from datetime import datetime, timedelta, timezone
-
-class WeatherFetcher:
-    def __init__(self, latitude, longitude, tz="Europe/London"):
-        self.latitude  = latitude
-        self.longitude = longitude
-        self.tz        = tz
-        # cache + retry
-        cache = requests_cache.CachedSession('.cache', expire_after=3600)
-        self.client = openmeteo_requests.Client(
-            session=retry(cache, retries=5, backoff_factor=0.2)
-        )
-
-    def fetch_range(self, start_utc: datetime, end_utc: datetime) -> pd.DataFrame:
-        """
-        Fetches hourly temperature, cloud_cover & solar_radiation
-        between two UTC datetimes, returns a tz-aware Europe/London DataFrame.
-        """
-        # ensure tz-aware
-        if start_utc.tzinfo is None:
-            start_utc = start_utc.replace(tzinfo=timezone.utc)
-        if end_utc.tzinfo is None:
-            end_utc = end_utc.replace(tzinfo=timezone.utc)
-
-        # pick the right endpoint
-        today_utc = datetime.now(timezone.utc).date()
-        url = (
-            "https://historical-forecast-api.open-meteo.com/v1/forecast"
-            if start_utc.date() < today_utc
-            else "https://api.open-meteo.com/v1/forecast"
-        )
-        params = {
-            "latitude":   self.latitude,
-            "longitude":  self.longitude,
-            "start_date": start_utc.date().isoformat(),
-            "end_date":   end_utc.date().isoformat(),
-            "hourly":     "temperature_2m,cloudcover,shortwave_radiation",
-            "timezone":   "UTC"
-        }
-
-        resp   = self.client.weather_api(url, params=params)[0]
-        hourly = resp.Hourly()
-        times  = pd.date_range(
-            start  = pd.to_datetime(hourly.Time(),    unit="s", utc=True),
-            end    = pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
-            freq   = pd.Timedelta(seconds=hourly.Interval()),
-            inclusive="left"
-        )
-
-        df = pd.DataFrame({
-            "datetime":             times,
-            "temperature_2m":       hourly.Variables(0).ValuesAsNumpy(),
-            "cloud_cover_%":        hourly.Variables(1).ValuesAsNumpy(),
-            "solar_radiation_W_m2": hourly.Variables(2).ValuesAsNumpy(),
-        })
-
-        # convert to local tz
-        df["datetime"] = df["datetime"].dt.tz_convert(self.tz)
-        return df
-
-    def get_hist_and_future(
-        self,
-        seq_hours: int,
-        forecast_hours: int
-    ) -> tuple[pd.DataFrame, pd.DataFrame]:
-        """
-        Returns (hist_df, future_df) where:
-         • hist_df   has the last seq_hours up to now
-         • future_df has the next forecast_hours from now
-        All with Europe/London tz on the 'datetime' column.
-        """
-        now_utc   = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
-        hist_start = now_utc - timedelta(hours=seq_hours)
-        future_end = now_utc + timedelta(hours=forecast_hours)
-
-        full = self.fetch_range(hist_start, future_end)
-
-        # slice by timestamp rather than by index
-        hist_df = full[
-            (full["datetime"] >= hist_start) &
-            (full["datetime"] <  now_utc)
-        ].reset_index(drop=True)
-
-        future_df = full[
-            (full["datetime"] >= now_utc) &
-            (full["datetime"] <= future_end)
-        ].reset_index(drop=True)
-
-        return hist_df, future_df
+# weather_utils.py
+
+import asyncio
+import threading
+import contextlib
+import pandas as pd
+from weather_client import get_weather_client, utc_now
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_CONCURRENCY = 8      # simultaneous Open-Meteo requests (≤ pool size)
+DEFAULT_TIMEOUT     = 30.0   # seconds, passed to the HTTP request (connect / read)
+
+WEATHER_COLUMNS = ["temperature_2m", "cloud_cover_%", "solar_radiation_W_m2"]
+
+
+class HourlyWeatherStore:
+    """
+    Rolling per-site store of hourly weather, indexed by UTC hour.
+
+    Each row remembers when it was fetched. Hours that were already in the
+    past at fetch time are final and never refetched; forecast hours are
+    refetched once they are older than forecast_ttl seconds. Rows older than
+    retention_days are dropped so the store stays bounded; ranges that start
+    before that are served straight from the network (see retains).
+    """
+
+    def __init__(self, forecast_ttl=3600, retention_days=14):
+        self.forecast_ttl   = forecast_ttl
+        self.retention_days = retention_days
+        self.frame = pd.DataFrame(
+            columns=WEATHER_COLUMNS + ["fetched_at"],
+            index=pd.DatetimeIndex([], tz="UTC")
+        )
+        self.lock = threading.Lock()
+
+    def _cutoff(self, now):
+        return pd.Timestamp(now, unit="s", tz="UTC") - pd.Timedelta(days=self.retention_days)
+
+    def retains(self, start_day, now=None):
+        """Whether hours from start_day on are within the retention window."""
+        now = utc_now().timestamp() if now is None else now
+        return pd.Timestamp(start_day, tz="UTC") >= self._cutoff(now)
+
+    def missing_days(self, start_day, end_day, now=None):
+        """
+        Smallest (first_day, last_day) span that covers every hour in
+        [start_day, end_day] that is missing or stale, or None if all held.
+        """
+        now   = utc_now().timestamp() if now is None else now
+        hours = _day_hours(start_day, end_day)
+        held  = self.frame.reindex(hours)
+
+        fetched_at = held["fetched_at"].astype(float)
+        hour_ts    = hours.asi8 / 1e9
+        # a row is a forecast if its hour hadn't started when it was fetched
+        is_forecast = hour_ts >= (fetched_at.values // 3600) * 3600
+        stale       = is_forecast & (now - fetched_at.values > self.forecast_ttl)
+        need        = fetched_at.isna().values | stale
+
+        if not need.any():
+            return None
+        needed = hours[need]
+        return needed[0].date(), needed[-1].date()
+
+    def merge(self, df, now=None):
+        """df: UTC 'datetime' column plus WEATHER_COLUMNS."""
+        now = utc_now().timestamp() if now is None else now
+        new = df.set_index("datetime")[WEATHER_COLUMNS].copy()
+        new.index = new.index.tz_convert("UTC")
+        new["fetched_at"] = now
+
+        kept  = self.frame[~self.frame.index.isin(new.index)]
+        frame = pd.concat([kept, new]).sort_index() if len(kept) else new.sort_index()
+        # the hours just merged stay even if they're past retention, so the
+        # caller that downloaded them can still read them
+        cutoff = min(self._cutoff(now), new.index.min()) if len(new) else self._cutoff(now)
+        self.frame = frame[frame.index >= cutoff]
+
+    def slice_days(self, start_day, end_day):
+        return _day_frame(self.frame, start_day, end_day)
+
+
+def _day_hours(start_day, end_day):
+    return pd.date_range(
+        start=pd.Timestamp(start_day, tz="UTC"),
+        end=pd.Timestamp(end_day, tz="UTC") + pd.Timedelta(days=1),
+        freq="h", inclusive="left"
+    )
+
+
+def _day_frame(frame, start_day, end_day):
+    # every hour of [start_day, end_day] from a UTC-indexed frame (NaN where
+    # it has none), with a UTC 'datetime' column
+    out = frame.reindex(_day_hours(start_day, end_day))[WEATHER_COLUMNS]
+    out = out.rename_axis("datetime").reset_index()
+    for col in WEATHER_COLUMNS:
+        out[col] = out[col].astype("float32")
+    return out
+
+
+# One store per site, shared by every WeatherFetcher in the process
+_STORES      = {}
+_STORES_LOCK = threading.Lock()
+
+
+def weather_store(latitude, longitude):
+    key = (round(float(latitude), 4), round(float(longitude), 4))
+    with _STORES_LOCK:
+        if key not in _STORES:
+            _STORES[key] = HourlyWeatherStore()
+        return _STORES[key]
+
+
+class WeatherFetcher:
+    def __init__(self, latitude, longitude, tz="Europe/London"):
+        self.latitude  = latitude
+        self.longitude = longitude
+        self.tz        = tz
+        self.store     = weather_store(latitude, longitude)
+        # shared cache + retry + pooled client (see weather_client.py)
+        self.client    = get_weather_client()
+
+    def _download(self, start_date, end_date, timeout=None) -> pd.DataFrame:
+        """One Open-Meteo request for whole UTC days; UTC 'datetime' column."""
+        # pick the right endpoint
+        today_utc = utc_now().date()
+        url = (
+            "https://historical-forecast-api.open-meteo.com/v1/forecast"
+            if start_date < today_utc
+            else "https://api.open-meteo.com/v1/forecast"
+        )
+        params = {
+            "latitude":   self.latitude,
+            "longitude":  self.longitude,
+            "start_date": start_date.isoformat(),
+            "end_date":   end_date.isoformat(),
+            "hourly":     "temperature_2m,cloudcover,shortwave_radiation",
+            "timezone":   "UTC"
+        }
+
+        kwargs = {"timeout": timeout} if timeout is not None else {}
+        resp   = self.client.weather_api(url, params=params, **kwargs)[0]
+        hourly = resp.Hourly()
+        times  = pd.date_range(
+            start  = pd.to_datetime(hourly.Time(),    unit="s", utc=True),
+            end    = pd.to_datetime(hourly.TimeEnd(), unit="s", utc=True),
+            freq   = pd.Timedelta(seconds=hourly.Interval()),
+            inclusive="left"
+        )
+
+        return pd.DataFrame({
+            "datetime":             times,
+            "temperature_2m":       hourly.Variables(0).ValuesAsNumpy(),
+            "cloud_cover_%":        hourly.Variables(1).ValuesAsNumpy(),
+            "solar_radiation_W_m2": hourly.Variables(2).ValuesAsNumpy(),
+        })
+
+    @staticmethod
+    def _utc_days(start_utc, end_utc):
+        # ensure tz-aware
+        if start_utc.tzinfo is None:
+            start_utc = start_utc.replace(tzinfo=timezone.utc)
+        if end_utc.tzinfo is None:
+            end_utc = end_utc.replace(tzinfo=timezone.utc)
+        return start_utc.astimezone(timezone.utc).date(), end_utc.astimezone(timezone.utc).date()
+
+    def _local_slice(self, start_day, end_day, downloaded=None):
+        if downloaded is not None:
+            df = _day_frame(downloaded.set_index("datetime"), start_day, end_day)
+        else:
+            with self.store.lock:
+                df = self.store.slice_days(start_day, end_day)
+
+        # convert to local tz
+        df["datetime"] = df["datetime"].dt.tz_convert(self.tz)
+        return df
+
+    def prefetch(self, start_utc: datetime, end_utc: datetime) -> None:
+        """
+        Makes sure every hour of the days spanning [start_utc, end_utc] is in
+        the site's store, downloading only the missing/stale span (at most
+        one request). Later fetch_range calls inside that span are free.
+        Ranges older than the store's retention are left to fetch_range.
+        """
+        start_day, end_day = self._utc_days(start_utc, end_utc)
+        if not self.store.retains(start_day):
+            return
+
+        with self.store.lock:
+            span = self.store.missing_days(start_day, end_day)
+        if span is not None:
+            # downloaded without the lock, so readers of the site aren't held up
+            df = self._download(*span)
+            with self.store.lock:
+                self.store.merge(df)
+
+    def fetch_range(self, start_utc: datetime, end_utc: datetime) -> pd.DataFrame:
+        """
+        Fetches hourly temperature, cloud_cover & solar_radiation
+        between two UTC datetimes, returns a tz-aware Europe/London DataFrame.
+
+        Served from the per-site hourly store; only hours it doesn't hold
+        (or stale forecast hours) go to the network. Ranges starting before
+        the store's retention window bypass it.
+        """
+        start_day, end_day = self._utc_days(start_utc, end_utc)
+        if not self.store.retains(start_day):
+            return self._local_slice(start_day, end_day, self._download(start_day, end_day))
+        self.prefetch(start_utc, end_utc)
+        return self._local_slice(start_day, end_day)
+
+    async def fetch_range_async(
+        self,
+        start_utc: datetime,
+        end_utc: datetime,
+        semaphore: asyncio.Semaphore = None,
+        timeout: float = DEFAULT_TIMEOUT
+    ) -> pd.DataFrame:
+        """
+        Awaitable fetch_range. The download runs on a worker thread (sharing
+        the pooled client) without holding the store lock, so several ranges
+        or sites can be in flight at once; semaphore bounds how many. timeout
+        goes to the HTTP request itself, which is what actually stops it.
+        """
+        start_day, end_day = self._utc_days(start_utc, end_utc)
+        if not self.store.retains(start_day):
+            async with semaphore or contextlib.nullcontext():
+                df = await asyncio.to_thread(self._download, start_day, end_day, timeout=timeout)
+            return self._local_slice(start_day, end_day, df)
+
+        with self.store.lock:
+            span = self.store.missing_days(start_day, end_day)
+
+        if span is not None:
+            async with semaphore or contextlib.nullcontext():
+                df = await asyncio.to_thread(self._download, *span, timeout=timeout)
+            with self.store.lock:
+                self.store.merge(df)
+
+        return self._local_slice(start_day, end_day)
+
+    def get_hist_and_future(
+        self,
+        seq_hours: int,
+        forecast_hours: int
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Returns (hist_df, future_df) where:
+         • hist_df   has the last seq_hours up to now
+         • future_df has the next forecast_hours from now
+        All with Europe/London tz on the 'datetime' column.
+        """
+        now_utc   = utc_now().replace(minute=0, second=0, microsecond=0)
+        hist_start = now_utc - timedelta(hours=seq_hours)
+        future_end = now_utc + timedelta(hours=forecast_hours)
+
+        full = self.fetch_range(hist_start, future_end)
+
+        # slice by timestamp rather than by index
+        hist_df = full[
+            (full["datetime"] >= hist_start) &
+            (full["datetime"] <  now_utc)
+        ].reset_index(drop=True)
+
+        future_df = full[
+            (full["datetime"] >= now_utc) &
+            (full["datetime"] <= future_end)
+        ].reset_index(drop=True)
+
+        return hist_df, future_df
+
+
+async def fetch_ranges_async(jobs, max_concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+    """
+    jobs: iterable of (WeatherFetcher, start_utc, end_utc). Runs them
+    concurrently, at most max_concurrency at a time, each request with its
+    own HTTP timeout, and returns the DataFrames in job order.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+    return await asyncio.gather(*(
+        wf.fetch_range_async(start, end, semaphore, timeout)
+        for wf, start, end in jobs
+    ))
+
+
+def fetch_ranges(jobs, max_concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+    """Blocking wrapper around fetch_ranges_async for sync callers (routes, scripts)."""
+    return asyncio.run(fetch_ranges_async(list(jobs), max_concurrency, timeout))
+
+
+def fetch_hist_and_future_many(
+    sites,
+    seq_hours: int,
+    forecast_hours: int,
+    max_concurrency: int = DEFAULT_CONCURRENCY,
+    timeout: float = DEFAULT_TIMEOUT
+) -> list[tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    (hist_df, future_df) for every (latitude, longitude) in sites, with the
+    history and forecast requests of all sites issued concurrently. Wall
+    time is roughly the slowest request rather than the sum of them.
+    """
+    now_utc    = utc_now().replace(minute=0, second=0, microsecond=0)
+    hist_start = now_utc - timedelta(hours=seq_hours)
+    future_end = now_utc + timedelta(hours=forecast_hours)
+
+    jobs = []
+    for lat, lon in sites:
+        wf = WeatherFetcher(lat, lon)
+        jobs += [(wf, hist_start, now_utc), (wf, now_utc, future_end)]
+    frames = fetch_ranges(jobs, max_concurrency, timeout)
+
+    return [(frames[i], frames[i + 1]) for i in range(0, len(frames), 2)]